@@ -0,0 +1,192 @@
+import logging
+import os
+import secrets
+import socket
+import subprocess
+import threading
+import time
+from typing import Callable, List, Optional
+
+import requests
+
+log = logging.getLogger("udemy-downloader.aria2")
+
+# the options download_aria passes to every aria2c process, set once on the daemon instead
+DEFAULT_OPTIONS = [
+    "-j16",
+    "-s20",
+    "-x16",
+    "-c",
+    "--auto-file-renaming=false",
+    "--summary-interval=0",
+    "--disable-ipv6",
+    "--follow-torrent=false",
+]
+
+_STATUS_KEYS = ["status", "totalLength", "completedLength", "downloadSpeed", "errorCode", "errorMessage"]
+
+
+class Aria2RPCError(Exception):
+    """The daemon can't be reached or rejected a call, downloads should fall back to an aria2c process"""
+
+
+class Aria2Error(Exception):
+    """A download submitted to the daemon failed, ``code`` is the aria2 exit status of that download"""
+
+    def __init__(self, code: str, message: str):
+        super().__init__(f"aria2 error {code}: {message}")
+        self.code = code
+        self.message = message
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Aria2RPC(object):
+    """
+    A long-lived ``aria2c --enable-rpc`` process listening on a local port.
+
+    Files are submitted with ``aria2.addUri`` and their status polled with ``aria2.tellStatus`` over JSON-RPC,
+    so a download doesn't pay for starting a process and a new TLS session. The daemon is bound to
+    127.0.0.1, protected by a random secret and exits with the process that started it.
+    """
+
+    def __init__(self, executable: str = "aria2c", options: Optional[List[str]] = None, max_concurrent: int = 16):
+        self.executable = executable
+        self.options = DEFAULT_OPTIONS if options is None else options
+        self.max_concurrent = max_concurrent
+        self.port = None
+        self.process = None
+        self._secret = secrets.token_hex(16)
+        self._session = requests.Session()
+        # never send the local calls through a proxy from the environment
+        self._session.trust_env = False
+        self._lock = threading.Lock()
+        self._ids = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/jsonrpc"
+
+    def start(self, timeout: float = 10.0) -> bool:
+        """Start the daemon and wait until it answers, returns False if it couldn't be started"""
+        self.port = _free_port()
+        args = [
+            self.executable,
+            "--enable-rpc",
+            "--rpc-listen-all=false",
+            f"--rpc-listen-port={self.port}",
+            f"--rpc-secret={self._secret}",
+            f"--stop-with-process={os.getpid()}",
+            f"--max-concurrent-downloads={self.max_concurrent}",
+            "--quiet",
+            *self.options,
+        ]
+        try:
+            self.process = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except OSError as error:
+            log.debug("Failed to start aria2c: %s", error)
+            return False
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                log.debug("aria2c exited with %s before its rpc interface came up", self.process.returncode)
+                return False
+            try:
+                version = self.call("aria2.getVersion")
+                log.debug("aria2c %s listening on port %d", version.get("version"), self.port)
+                return True
+            except Aria2RPCError:
+                time.sleep(0.1)
+        log.debug("aria2c rpc interface didn't come up within %.0fs", timeout)
+        self.shutdown()
+        return False
+
+    def call(self, method: str, *params):
+        with self._lock:
+            self._ids += 1
+            # system.* methods take no secret, system.multicall carries it in every call it wraps
+            token = [f"token:{self._secret}"] if method.startswith("aria2.") else []
+            payload = {"jsonrpc": "2.0", "id": self._ids, "method": method, "params": [*token, *params]}
+        try:
+            r = self._session.post(self.url, json=payload, timeout=10)
+            body = r.json()
+        except (requests.RequestException, ValueError) as error:
+            raise Aria2RPCError(f"{method} failed: {error}") from error
+        if "error" in body:
+            raise Aria2RPCError(f"{method} failed: {body['error'].get('message')}")
+        return body.get("result")
+
+    def multicall(self, calls: List[tuple], return_faults: bool = False) -> list:
+        """
+        Make several ``(method, *params)`` calls in one request, returns their results in order.
+
+        A call the daemon rejected raises ``Aria2RPCError``, or with ``return_faults`` is returned as an
+        ``Aria2Error`` in place of its result so one bad call doesn't fail the others.
+        """
+        payload = [{"methodName": method, "params": [f"token:{self._secret}", *params]} for method, *params in calls]
+        results = self.call("system.multicall", payload)
+        # each result is wrapped in a list, failed calls are a fault object instead
+        unwrapped = []
+        for result in results:
+            if isinstance(result, dict) and "code" in result:
+                if not return_faults:
+                    raise Aria2RPCError(f"system.multicall failed: {result.get('message')}")
+                unwrapped.append(Aria2Error(str(result.get("code")), result.get("message")))
+            else:
+                unwrapped.append(result[0])
+        return unwrapped
+
+    def add(self, url: str, directory: str, filename: str) -> str:
+        """Queue a download, returns its gid"""
+        return self.call("aria2.addUri", [url], {"dir": os.path.abspath(directory), "out": filename})
+
+    def wait(self, gid: str, progress: Optional[Callable[[int, int, int], None]] = None) -> dict:
+        """
+        Poll a download until it finishes and return its last status.
+
+        ``progress`` is called with the completed bytes, total bytes and speed after every poll. Raises
+        ``Aria2Error`` if the download failed.
+        """
+        delay = 0.05
+        while True:
+            status = self.call("aria2.tellStatus", gid, _STATUS_KEYS)
+            state = status.get("status")
+            if progress is not None:
+                progress(int(status.get("completedLength", 0)), int(status.get("totalLength", 0)), int(status.get("downloadSpeed", 0)))
+            if state in ("complete", "error", "removed"):
+                try:
+                    self.call("aria2.removeDownloadResult", gid)
+                except Aria2RPCError:
+                    pass
+                if state == "complete":
+                    return status
+                raise Aria2Error(status.get("errorCode", "removed"), status.get("errorMessage", "download was removed"))
+            time.sleep(delay)
+            # small files finish within the first polls, large ones don't need to be polled that often
+            delay = min(delay * 2, 1.0)
+
+    def download(self, url: str, directory: str, filename: str, progress=None) -> dict:
+        return self.wait(self.add(url, directory, filename), progress)
+
+    def shutdown(self):
+        """Stop the daemon and every download it still has, safe to call from several threads"""
+        with self._lock:
+            process, self.process = self.process, None
+        if process is None:
+            return
+        if process.poll() is None:
+            try:
+                self.call("aria2.forceShutdown")
+                process.wait(timeout=5)
+            except (Aria2RPCError, subprocess.TimeoutExpired):
+                process.terminate()
+                try:
+                    process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+        self._session.close()
@@ -0,0 +1,108 @@
+import asyncio
+import time
+from typing import Optional
+
+import aiohttp
+from requests import Request, Response
+from requests.cookies import get_cookie_header
+from requests.structures import CaseInsensitiveDict
+
+from endpoints import classify
+from tls import CIPHER_LIST, create_ssl_context
+
+
+class AsyncSession(object):
+    """
+    asyncio counterpart of ``Session`` for metadata requests.
+
+    Headers and cookies are taken from the blocking session, TLS uses the same cipher list as ``SSLCiphers``,
+    and requests go through the same response cache, retry policy, rate limiter and metrics.
+    ``_get`` returns a ``requests.Response`` so callers can treat both sessions the same.
+    Use it as an async context manager from inside a running event loop.
+    """
+
+    def __init__(self, session, rate_limiter, http_metrics, limit: int = 100, timeout: float = 20):
+        self._sync = session
+        self.cache = session.cache
+        self.retry_policy = session.retry_policy
+        self.rate_limiter = rate_limiter
+        self.http_metrics = http_metrics
+        self._headers = dict(session._session.headers)
+        self._cookies = session._session.cookies
+        self._limit = limit
+        self._timeout = timeout
+        self._client: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(ssl=create_ssl_context(CIPHER_LIST), limit=self._limit)
+        self._client = aiohttp.ClientSession(
+            connector=connector,
+            headers=self._headers,
+            timeout=aiohttp.ClientTimeout(total=self._timeout),
+            # cookies come from the requests jar, per request, so domain/path matching stays identical
+            cookie_jar=aiohttp.DummyCookieJar(),
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._client.close()
+        self._client = None
+
+    def _request_headers(self, url: str, extra: Optional[dict] = None) -> dict:
+        headers = dict(extra or {})
+        cookie = get_cookie_header(self._cookies, Request("GET", url))
+        if cookie:
+            headers["Cookie"] = cookie
+        return headers
+
+    async def _send(self, url: str, params: Optional[dict] = None, headers: Optional[dict] = None) -> Response:
+        await self.rate_limiter.acquire_async(url)
+        # aiohttp rejects bool params, requests sends them as "True"/"False"
+        query = {k: str(v) for k, v in params.items()} if params else None
+        async with self._client.get(url, params=query, headers=self._request_headers(url, headers)) as r:
+            body = await r.read()
+            response = Response()
+            response.status_code = r.status
+            response.reason = r.reason
+            response.url = str(r.url)
+            response.headers = CaseInsensitiveDict(r.headers)
+            response.encoding = r.get_encoding() if body else None
+            response._content = body
+            return response
+
+    def _record(self, url: str, start: float, resp: Response, cached: bool = False):
+        self.http_metrics.record(
+            classify(url),
+            time.monotonic() - start,
+            resp.status_code,
+            len(resp.content or b"") if not cached else 0,
+            getattr(resp, "retries", 0),
+            False,
+            cached,
+        )
+
+    async def _get(self, url: str, params: Optional[dict] = None) -> Response:
+        start = time.monotonic()
+        cached = self.cache.lookup(url, params) if self.cache else None
+        headers = None
+        if cached is not None:
+            if not cached.has_validators:
+                resp = self.cache.to_response(cached)
+                if resp is not None:
+                    self._record(url, start, resp, cached=True)
+                    return resp
+            else:
+                headers = self.cache.conditional_headers(cached)
+
+        errors = (aiohttp.ClientError, asyncio.TimeoutError)
+        req = await self.retry_policy.request_async(lambda: self._send(url, params, headers), url, errors)
+        if req.status_code == 304 and cached is not None:
+            resp = self.cache.revalidate(cached, req)
+            if resp is not None:
+                self._record(url, start, req, cached=True)
+                return resp
+            req = await self.retry_policy.request_async(lambda: self._send(url, params), url, errors)
+        self._record(url, start, req)
+        if req.ok and self.cache:
+            self.cache.store(url, params, req)
+        return req
@@ -0,0 +1,125 @@
+"""
+Compare downloading many small files with an aria2c process per file, the aria2c rpc daemon and a single batch.
+
+Usage: python benchmarks/bench_aria2.py [--files N] [--size BYTES] [--workers N]
+
+A local http server serves a fixture of generated files. The per-file paths download every file with ``--workers``
+threads (like --parallel-lectures does), the batch paths hand them all to one ``DownloadBatch`` as a chapter's
+captions and attachments are, once through an ``aria2c -i`` input file and once through the daemon. Each
+downloaded file must match its fixture. Needs aria2c in PATH.
+"""
+
+import argparse
+import functools
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from aria2_rpc import DEFAULT_OPTIONS, Aria2RPC  # noqa: E402
+from download_batch import DownloadBatch  # noqa: E402
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(directory):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def generate_fixture(directory, count, size):
+    digests = {}
+    for i in range(count):
+        name = f"asset_{i:05d}.bin"
+        data = os.urandom(size)
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(data)
+        digests[name] = hashlib.sha256(data).hexdigest()
+    return digests
+
+
+def per_process(base_url, out_dir, name):
+    subprocess.run(["aria2c", f"{base_url}/{name}", "-o", name, "-d", out_dir, *DEFAULT_OPTIONS], check=True, stdout=subprocess.DEVNULL)
+
+
+def timed(fn, names, workers):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(fn, names))
+    return time.perf_counter() - start
+
+
+def batched(base_url, out_dir, names, daemon=None):
+    batch = DownloadBatch()
+    for name in names:
+        batch.add(lambda name=name: f"{base_url}/{name}", out_dir, name)
+    start = time.perf_counter()
+    failed = batch.run(daemon)
+    if failed:
+        sys.exit(f"{len(failed)} files failed in the batch, e.g. {failed[0].filename}: {failed[0].error}")
+    return time.perf_counter() - start
+
+
+def verify(out_dir, digests):
+    for name, digest in digests.items():
+        with open(os.path.join(out_dir, name), "rb") as f:
+            if hashlib.sha256(f.read()).hexdigest() != digest:
+                sys.exit(f"{name} doesn't match its fixture")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark aria2c per process vs rpc")
+    parser.add_argument("--files", type=int, default=300, help="Number of files in the fixture (Default is 300)")
+    parser.add_argument("--size", type=int, default=16 * 1024, help="Size of each file in bytes (Default is 16384)")
+    parser.add_argument("--workers", type=int, default=4, help="Threads submitting downloads (Default is 4)")
+    args = parser.parse_args()
+
+    if not shutil.which("aria2c"):
+        sys.exit("aria2c is not in PATH")
+
+    with tempfile.TemporaryDirectory() as fixture, tempfile.TemporaryDirectory() as out:
+        digests = generate_fixture(fixture, args.files, args.size)
+        server = serve(fixture)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        names = sorted(digests)
+
+        results = {}
+        for path in ("process", "rpc", "batch -i", "batch rpc"):
+            os.makedirs(os.path.join(out, path))
+        process_dir = os.path.join(out, "process")
+        results["process"] = timed(lambda name: per_process(base_url, process_dir, name), names, args.workers)
+        results["batch -i"] = batched(base_url, os.path.join(out, "batch -i"), names)
+
+        daemon = Aria2RPC()
+        if not daemon.start():
+            sys.exit("Couldn't start the aria2c rpc daemon")
+        try:
+            rpc_dir = os.path.join(out, "rpc")
+            results["rpc"] = timed(lambda name: daemon.download(f"{base_url}/{name}", rpc_dir, name), names, args.workers)
+            results["batch rpc"] = batched(base_url, os.path.join(out, "batch rpc"), names, daemon)
+        finally:
+            daemon.shutdown()
+        for path in results:
+            verify(os.path.join(out, path), digests)
+        server.shutdown()
+
+    print(f"{args.files} files of {args.size} bytes, {args.workers} workers, every file matches its fixture")
+    print(f"{'path':<12}{'total s':>10}{'per file ms':>14}{'speedup':>10}")
+    for name, elapsed in results.items():
+        print(f"{name:<12}{elapsed:>10.2f}{elapsed / args.files * 1000:>14.1f}{results['process'] / elapsed:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
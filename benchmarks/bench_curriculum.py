@@ -0,0 +1,162 @@
+"""
+Compare the single-pass curriculum builder with the loop main() used before it.
+
+Usage: python benchmarks/bench_curriculum.py [--items N] [--chapter-size N] [--rounds N]
+
+The old loop looked every lecture up with ``course.index(entry)`` and reassigned the chapter's lecture list on
+every item. Both builders run over the same synthetic curriculum and must produce the same chapters.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pathvalidate import sanitize_filename  # noqa: E402
+
+from curriculum import Curriculum  # noqa: E402
+from models import to_json  # noqa: E402
+
+logger = logging.getLogger("udemy-downloader")
+
+
+def synthetic_curriculum(items, chapter_size):
+    course = []
+    chapter_index = 0
+    lecture_index = 0
+    for n in range(items):
+        if n % (chapter_size + 1) == 0:
+            chapter_index += 1
+            course.append({"_class": "chapter", "id": 10_000_000 + n, "object_index": chapter_index, "title": f"Chapter {chapter_index}"})
+            continue
+        lecture_index += 1
+        clazz = "quiz" if n % 17 == 0 else "lecture"
+        course.append(
+            {
+                "_class": clazz,
+                "id": 20_000_000 + n,
+                "object_index": lecture_index,
+                "title": f"Lecture {lecture_index}: some title / with characters?",
+                "asset": {"asset_type": "Video", "id": 30_000_000 + n, "captions": []},
+            }
+        )
+    return course
+
+
+def legacy_build(course, use_continuous_lecture_numbers=False):
+    """The curriculum loop of main() before the Curriculum module, logging calls included"""
+    udemy_object = {"chapters": []}
+    chapter_index_counter = -1
+    lecture_counter = 0
+    lectures = []
+
+    for entry in course:
+        clazz = entry.get("_class")
+
+        if clazz == "chapter":
+            if not use_continuous_lecture_numbers:
+                lecture_counter = 0
+            lectures = []
+
+            chapter_index = entry.get("object_index")
+            chapter_title = "{0:02d} - ".format(chapter_index) + sanitize_filename(entry.get("title"))
+
+            if chapter_title not in udemy_object["chapters"]:
+                udemy_object["chapters"].append(
+                    {
+                        "chapter_title": chapter_title,
+                        "chapter_id": entry.get("id"),
+                        "chapter_index": chapter_index,
+                        "lectures": [],
+                    }
+                )
+                chapter_index_counter += 1
+        elif clazz == "lecture" or clazz == "quiz":
+            lecture_counter += 1
+            lecture_id = entry.get("id")
+            if len(udemy_object["chapters"]) == 0:
+                chapter_index = entry.get("object_index")
+                chapter_title = "{0:02d} - ".format(chapter_index) + sanitize_filename(entry.get("title"))
+                if chapter_title not in udemy_object["chapters"]:
+                    udemy_object["chapters"].append(
+                        {
+                            "chapter_title": chapter_title,
+                            "chapter_id": lecture_id,
+                            "chapter_index": chapter_index,
+                            "lectures": [],
+                        }
+                    )
+                    chapter_index_counter += 1
+            if lecture_id:
+                logger.info(f"Processing {course.index(entry) + 1} of {len(course)}")
+
+                lecture_index = entry.get("object_index")
+                lecture_title = "{0:03d} ".format(lecture_counter) + sanitize_filename(entry.get("title"))
+
+                lectures.append(
+                    {
+                        "index": lecture_counter,
+                        "lecture_index": lecture_index,
+                        "lecture_title": lecture_title,
+                        "_class": entry.get("_class"),
+                        "id": lecture_id,
+                        "data": entry,
+                    }
+                )
+
+        udemy_object["chapters"][chapter_index_counter]["lectures"] = lectures
+        udemy_object["chapters"][chapter_index_counter]["lecture_count"] = len(lectures)
+
+    udemy_object["total_chapters"] = len(udemy_object["chapters"])
+    udemy_object["total_lectures"] = sum([entry.get("lecture_count", 0) for entry in udemy_object["chapters"] if entry])
+    return udemy_object
+
+
+def single_pass_build(course):
+    udemy_object = {"chapters": []}
+    for _ in Curriculum(udemy_object).build(course, len(course)):
+        pass
+    return udemy_object
+
+
+def best_of(fn, course, rounds):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = fn(course)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark curriculum building")
+    parser.add_argument("--items", type=int, default=5000, help="Curriculum items, chapters included (Default is 5000)")
+    parser.add_argument("--chapter-size", type=int, default=25, help="Lectures per chapter (Default is 25)")
+    parser.add_argument("--rounds", type=int, default=3, help="Timed rounds per builder, the best is reported (Default is 3)")
+    args = parser.parse_args()
+
+    # the log calls are part of the cost, but not their output
+    logging.disable(logging.CRITICAL)
+
+    course = synthetic_curriculum(args.items, args.chapter_size)
+    legacy, legacy_object = best_of(legacy_build, course, args.rounds)
+    single, single_object = best_of(single_pass_build, course, args.rounds)
+
+    # the records serialize to the dicts the old loop built
+    if legacy_object != json.loads(json.dumps(single_object, default=to_json)):
+        sys.exit("The builders produced different chapters")
+
+    print(f"{len(course)} items, {single_object['total_chapters']} chapters, {single_object['total_lectures']} lectures")
+    print(f"{'builder':<14}{'total ms':>10}")
+    for name, elapsed in (("course.index", legacy), ("single pass", single)):
+        print(f"{name:<14}{elapsed * 1000:>10.1f}")
+    print(f"speedup: {legacy / single:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
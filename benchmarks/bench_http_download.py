@@ -0,0 +1,188 @@
+"""
+Compare the old single-stream download() loop with the pooled, range-splitting HttpDownloader.
+
+Usage: python benchmarks/bench_http_download.py [--size MB] [--files N] [--connections N] [--rate KBPS]
+
+A local http server that answers range requests serves a fixture of generated files. ``--rate`` caps every
+connection of the server, like a CDN edge does, which is where splitting a file over several connections pays
+off; without it the run measures the per-byte cost of the read loops. The "resume" row downloads the files
+again after their part files were left half done. Each downloaded file must match its fixture.
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from http_download import HttpDownloader  # noqa: E402
+
+_RANGE_RE = re.compile(r"bytes=(\d+)-(\d*)")
+
+
+def make_handler(directory, rate):
+    class RangeHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_HEAD(self):
+            self.do_GET(body=False)
+
+        def do_GET(self, body=True):
+            path = os.path.join(directory, os.path.basename(self.path))
+            if not os.path.isfile(path):
+                self.send_error(404)
+                return
+            size = os.path.getsize(path)
+            start, end, status = 0, size - 1, 200
+            match = _RANGE_RE.fullmatch(self.headers.get("Range", ""))
+            if match:
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+                status = 206
+            self.send_response(status)
+            self.send_header("Content-Length", str(end - start + 1))
+            self.send_header("Accept-Ranges", "bytes")
+            if status == 206:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            self.end_headers()
+            if not body:
+                return
+            chunk = 64 * 1024
+            with open(path, "rb") as f:
+                f.seek(start)
+                remaining = end - start + 1
+                began = time.monotonic()
+                sent = 0
+                while remaining:
+                    data = f.read(min(chunk, remaining))
+                    self.wfile.write(data)
+                    remaining -= len(data)
+                    sent += len(data)
+                    if rate:
+                        ahead = sent / (rate * 1024) - (time.monotonic() - began)
+                        if ahead > 0:
+                            time.sleep(ahead)
+
+    return RangeHandler
+
+
+def serve(directory, rate):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(directory, rate))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def generate_fixture(directory, count, size):
+    digests = {}
+    for i in range(count):
+        name = f"lecture_{i:03d}.mp4"
+        data = os.urandom(size)
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(data)
+        digests[name] = hashlib.sha256(data).hexdigest()
+    return digests
+
+
+def legacy_download(url, path):
+    """The download() loop this replaced: an unpooled HEAD and GET, read in 1 KiB chunks"""
+    file_size = int(requests.head(url).headers["Content-Length"])
+    res = requests.get(url, headers={"Range": "bytes=0-%s" % file_size}, stream=True)
+    with open(path, mode="ab") as f:
+        for chunk in res.iter_content(chunk_size=1024):
+            if chunk:
+                f.write(chunk)
+
+
+def leave_half_done(connections, url, path):
+    """Download the first half of the pieces of a file, as if the run was interrupted"""
+    half = HttpDownloader(connections=connections)
+    total = int(requests.head(url).headers["Content-Length"])
+    pieces = -(-total // half.piece_size_for(total))
+    calls = [0]
+
+    def before_request(_):
+        calls[0] += 1
+        # the probe, then half of the pieces
+        if calls[0] > 1 + pieces // 2:
+            raise requests.ConnectionError("interrupted")
+
+    half.before_request = before_request
+    try:
+        half.download(url, path)
+    except requests.ConnectionError:
+        pass
+    half.close()
+
+
+def run(name, fn, names, out_dir):
+    os.makedirs(out_dir)
+    start = time.perf_counter()
+    for file in names:
+        fn(file, os.path.join(out_dir, file))
+    return name, time.perf_counter() - start
+
+
+def verify(out_dir, digests):
+    for name, digest in digests.items():
+        with open(os.path.join(out_dir, name), "rb") as f:
+            if hashlib.sha256(f.read()).hexdigest() != digest:
+                sys.exit(f"{os.path.basename(out_dir)}: {name} doesn't match its fixture")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the http downloader")
+    parser.add_argument("--size", type=int, default=64, help="Size of each file in MB (Default is 64)")
+    parser.add_argument("--files", type=int, default=3, help="Number of files in the fixture (Default is 3)")
+    parser.add_argument("--connections", type=int, default=8, help="Connections of the split downloads (Default is 8)")
+    parser.add_argument("--rate", type=int, default=0, help="Cap every server connection at this many KB/s (Default is no cap)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as fixture, tempfile.TemporaryDirectory() as out:
+        digests = generate_fixture(fixture, args.files, args.size * 1024 * 1024)
+        server = serve(fixture, args.rate)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        names = sorted(digests)
+        single = HttpDownloader(connections=1)
+        split = HttpDownloader(connections=args.connections)
+
+        results = []
+        results.append(run("legacy", lambda f, p: legacy_download(f"{base_url}/{f}", p), names, os.path.join(out, "legacy")))
+        results.append(run("1 conn", lambda f, p: single.download(f"{base_url}/{f}", p), names, os.path.join(out, "1 conn")))
+        results.append(run(f"{args.connections} conns", lambda f, p: split.download(f"{base_url}/{f}", p), names, os.path.join(out, "split")))
+        resume_dir = os.path.join(out, "resume")
+        os.makedirs(resume_dir)
+        for name in names:
+            leave_half_done(args.connections, f"{base_url}/{name}", os.path.join(resume_dir, name))
+        start = time.perf_counter()
+        for name in names:
+            split.download(f"{base_url}/{name}", os.path.join(resume_dir, name))
+        results.append(("resume", time.perf_counter() - start))
+
+        for directory in ("legacy", "1 conn", "split", "resume"):
+            verify(os.path.join(out, directory), digests)
+        single.close()
+        split.close()
+        server.shutdown()
+
+    total_mb = args.size * args.files
+    rate = f"{args.rate} KB/s per connection" if args.rate else "uncapped"
+    print(f"{args.files} files of {args.size} MB, server {rate}, every file matches its fixture")
+    print(f"{'path':<12}{'total s':>10}{'MB/s':>10}{'speedup':>10}")
+    for name, elapsed in results:
+        print(f"{name:<12}{elapsed:>10.2f}{total_mb / elapsed:>10.1f}{results[0][1] / elapsed:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
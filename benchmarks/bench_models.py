@@ -0,0 +1,138 @@
+"""
+Peak and retained memory of a parsed course, dict based vs the __slots__ records of models.py.
+
+Usage: python benchmarks/bench_models.py [--lectures N] [--article-size BYTES]
+
+Both runs decode the same raw curriculum json, build the chapters and parse every lecture while keeping the
+whole course in memory, as --info and --load-from-file runs do. The dict run reproduces the old layout: raw
+api objects kept on each lecture and parsed lectures as dict copies.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from curriculum import Curriculum  # noqa: E402
+from models import Lecture  # noqa: E402
+
+
+def synthetic_curriculum(lectures, article_size, chapter_size=25):
+    course = []
+    for n in range(lectures):
+        if n % chapter_size == 0:
+            course.append({"_class": "chapter", "id": 1_000_000 + n, "object_index": n // chapter_size + 1, "title": f"Chapter {n // chapter_size + 1}"})
+        captions = [
+            {"_class": "caption", "url": f"https://vtt-c.udemycdn.com/{n}/{lang}.vtt?Expires=1700000000&Signature=abc{n}", "locale_id": f"{lang}_US", "language": lang}
+            for lang in ("en", "es", "de", "fr", "pt")
+        ]
+        if n % 10 == 0:
+            asset = {"_class": "asset", "asset_type": "Article", "id": 3_000_000 + n, "body": ("<p>" + "lorem ipsum " * (article_size // 12) + "</p>")}
+        elif n % 3 == 0:
+            asset = {
+                "_class": "asset",
+                "asset_type": "Video",
+                "id": 3_000_000 + n,
+                "stream_urls": None,
+                "media_sources": [{"type": "application/dash+xml", "src": f"https://www.udemy.com/assets/{3_000_000 + n}/encrypted-files/out/v1/index.mpd?token={n}"}],
+                "captions": captions,
+            }
+        else:
+            asset = {
+                "_class": "asset",
+                "asset_type": "Video",
+                "id": 3_000_000 + n,
+                "stream_urls": {"Video": [{"type": "application/x-mpegURL", "label": "auto", "file": f"https://www.udemy.com/assets/{3_000_000 + n}/files/index.m3u8?token={n}"}]},
+                "captions": captions,
+            }
+        course.append(
+            {
+                "_class": "lecture",
+                "id": 2_000_000 + n,
+                "object_index": n + 1,
+                "title": f"Lecture {n + 1}",
+                "asset": asset,
+                "supplementary_assets": [
+                    {"_class": "asset", "asset_type": "File", "id": 4_000_000 + n, "title": "slides", "filename": "slides.pdf", "download_urls": {"File": [{"file": f"https://att-c.udemycdn.com/{n}/slides.pdf?Expires=1&Signature=x"}]}}
+                ],
+            }
+        )
+    return json.dumps({"results": course})
+
+
+def run_dicts(udemy, raw):
+    """The old layout, parsed lectures are {**lecture, ...} copies and raw api objects stay on the lecture"""
+    course = json.loads(raw)["results"]
+    chapters = []
+    for entry in course:
+        if entry["_class"] == "chapter":
+            chapters.append({"chapter_title": entry["title"], "chapter_id": entry["id"], "chapter_index": entry["object_index"], "lectures": []})
+            continue
+        lecture = {"index": entry["object_index"], "lecture_index": entry["object_index"], "lecture_title": entry["title"], "_class": entry["_class"], "id": entry["id"], "data": entry}
+        chapters[-1]["lectures"].append(lecture)
+    del course
+    parsed = []
+    for chapter in chapters:
+        for lecture in chapter["lectures"]:
+            parsed_lecture = {**lecture, **udemy._parse_lecture(Lecture.from_dict(lecture)).to_dict()}
+            # the old dicts referenced the article body of the raw object instead of holding a copy
+            body = lecture["data"]["asset"].get("body")
+            if "html_content" in parsed_lecture:
+                parsed_lecture["html_content"] = body
+            for asset in parsed_lecture["assets"]:
+                if "body" in asset:
+                    asset["body"] = body
+            parsed.append(parsed_lecture)
+    return chapters, parsed
+
+
+def run_records(udemy, raw):
+    course = json.loads(raw)["results"]
+    udemy_object = {"chapters": []}
+    curriculum = Curriculum(udemy_object)
+    for _ in curriculum.build(course):
+        pass
+    del course
+    parsed = [udemy._parse_lecture(lecture) for _, lecture in curriculum.events() if lecture is not None]
+    return udemy_object, parsed
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    result = fn(*args)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the memory used by a parsed course")
+    parser.add_argument("--lectures", type=int, default=3000, help="Lectures in the synthetic course (Default is 3000)")
+    parser.add_argument("--article-size", type=int, default=20000, help="Size of article bodies in bytes, every 10th lecture is an article (Default is 20000)")
+    args = parser.parse_args()
+
+    import main as downloader
+
+    logging.disable(logging.CRITICAL)
+    downloader.logger = logging.getLogger("udemy-downloader")
+    udemy = downloader.Udemy.__new__(downloader.Udemy)
+
+    raw = synthetic_curriculum(args.lectures, args.article_size)
+    per = 1000 / args.lectures
+    print(f"{args.lectures} lectures, {len(raw) / 1024 / 1024:.1f} MiB of curriculum json")
+    print(f"{'layout':<10}{'retained MiB/1000':>20}{'peak MiB/1000':>16}")
+    results = {}
+    for name, fn in (("dicts", run_dicts), ("records", run_records)):
+        current, peak = measure(fn, udemy, raw)
+        results[name] = (current, peak)
+        print(f"{name:<10}{current * per / 1024 / 1024:>20.2f}{peak * per / 1024 / 1024:>16.2f}")
+    print(f"retained: {results['dicts'][0] / results['records'][0]:.1f}x less, peak: {results['dicts'][1] / results['records'][1]:.1f}x less")
+
+
+if __name__ == "__main__":
+    main()
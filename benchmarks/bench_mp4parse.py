@@ -0,0 +1,132 @@
+"""
+Compare reading the pssh and track boxes of a large lecture with the bitstring parser and with BoxIndex.
+
+Usage: python benchmarks/bench_mp4parse.py [--size MB] [--runs N] [--moov-last]
+
+The fixture is an mp4 with a widevine pssh box and a video track in moov and an mdat of ``--size`` MB
+(sparse, so it takes no disk space). The bitstring path is what extract_kid did before: F4VParser.parse over
+the whole file, taking the pssh boxes of moov. The index path is F4VParser.parse_pssh followed by parse_tracks.
+Both must return the same pssh boxes. Peak memory is the largest amount allocated by Python during a run
+(tracemalloc). The bitstring path needs a bitstring release that still has ConstBitStream (< 4.2).
+"""
+
+import argparse
+import os
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import bitstring
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import mp4parse  # noqa: E402
+
+WIDEVINE_SYSTEM_ID = bytes.fromhex("edef8ba979d64acea3c827dcd51d21ed")
+
+
+def box(box_type, payload):
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def full_box(box_type, payload):
+    return box(box_type, b"\0\0\0\0" + payload)
+
+
+def make_moov(duration_seconds):
+    timescale = 1000
+    pssh_data = b"\x22\x10" + os.urandom(16)
+    pssh = full_box(b"pssh", WIDEVINE_SYSTEM_ID + struct.pack(">I", len(pssh_data)) + pssh_data)
+    mvhd = full_box(b"mvhd", struct.pack(">IIII", 0, 0, timescale, duration_seconds * timescale) + bytes(80))
+    tkhd = full_box(b"tkhd", struct.pack(">III", 0, 0, 1) + bytes(68))
+    mdhd = full_box(b"mdhd", struct.pack(">IIII", 0, 0, timescale, duration_seconds * timescale) + bytes(4))
+    hdlr = full_box(b"hdlr", b"\0\0\0\0vide" + bytes(12) + b"video\0")
+    visual_entry = bytes(6) + struct.pack(">H", 1) + bytes(16) + struct.pack(">HH", 1280, 720) + bytes(50)
+    avc1 = box(b"avc1", visual_entry + box(b"btrt", struct.pack(">III", 0, 2000000, 1500000)))
+    stsd = full_box(b"stsd", struct.pack(">I", 1) + avc1)
+    frames = duration_seconds * 30
+    stsz = full_box(b"stsz", struct.pack(">II", 6000, frames))
+    stbl = box(b"stbl", stsd + stsz)
+    trak = box(b"trak", tkhd + box(b"mdia", mdhd + hdlr + box(b"minf", stbl)))
+    return box(b"moov", mvhd + pssh + trak)
+
+
+def generate_fixture(path, size, moov_last):
+    ftyp = box(b"ftyp", b"isom\0\0\0\0isomiso2avc1mp41")
+    moov = make_moov(duration_seconds=600)
+    with open(path, "wb") as f:
+        f.write(ftyp)
+        if not moov_last:
+            f.write(moov)
+        f.write(struct.pack(">I4sQ", 1, b"mdat", 16 + size))
+        # leave the payload as a hole
+        f.seek(size, os.SEEK_CUR)
+        if moov_last:
+            f.write(moov)
+        else:
+            f.truncate()
+
+
+def bitstring_pssh(path):
+    for parsed in mp4parse.F4VParser.parse(filename=path):
+        if parsed.header.box_type == "moov":
+            return [(pssh.system_id, pssh.payload) for pssh in parsed.pssh]
+    return []
+
+
+def index_pssh(path):
+    psshs = [(pssh.system_id, pssh.payload) for pssh in mp4parse.F4VParser.parse_pssh(filename=path)]
+    mp4parse.F4VParser.parse_tracks(filename=path)
+    return psshs
+
+
+def measure(fn, path, runs):
+    times = []
+    peak = 0
+    result = None
+    for _ in range(runs):
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = fn(path)
+        times.append(time.perf_counter() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return result, min(times), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the bitstring mp4 parser against BoxIndex")
+    parser.add_argument("--size", type=int, default=512, help="Size of the mdat box in MB (Default is 512)")
+    parser.add_argument("--runs", type=int, default=3, help="Runs of each path, the fastest counts (Default is 3)")
+    parser.add_argument("--moov-last", action="store_true", help="Put moov after mdat, like files that weren't made faststart")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work:
+        path = os.path.join(work, "lecture.mp4")
+        generate_fixture(path, args.size * 1024 * 1024, args.moov_last)
+
+        rows = []
+        expected, elapsed, peak = measure(index_pssh, path, args.runs)
+        if not expected or expected[0][0] != WIDEVINE_SYSTEM_ID.hex():
+            sys.exit("BoxIndex didn't find the widevine pssh box")
+        rows.append(("BoxIndex", elapsed, peak))
+        if hasattr(bitstring, "ConstBitStream"):
+            result, elapsed, peak = measure(bitstring_pssh, path, args.runs)
+            if result != expected:
+                sys.exit("the bitstring parser found different pssh boxes")
+            rows.insert(0, ("bitstring", elapsed, peak))
+        else:
+            print(f"bitstring {bitstring.__version__} has no ConstBitStream, only BoxIndex is measured")
+
+    layout = "moov after mdat" if args.moov_last else "moov before mdat"
+    matched = ", pssh boxes match" if len(rows) > 1 else ""
+    print(f"mdat of {args.size} MB, {layout}, fastest of {args.runs} runs{matched}")
+    print(f"{'path':<12}{'ms':>12}{'peak KB':>12}{'speedup':>10}")
+    for name, elapsed, peak in rows:
+        print(f"{name:<12}{elapsed * 1000:>12.2f}{peak / 1e3:>12,.0f}{rows[0][1] / elapsed:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Compare the native MPD parser with the yt-dlp generic extractor it replaced.
+
+Usage: python benchmarks/bench_mpd.py [MPD_DIR] [--count N] [--rounds N]
+
+Without MPD_DIR a corpus of synthetic Udemy-like MPDs is generated in a temp folder. For every MPD both
+paths must list the same video representations (format id, size and bitrate), otherwise the run fails.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from mpd_parser import list_representations, list_representations_ytdlp  # noqa: E402
+
+VIDEO_LADDER = [(426, 240, 250), (640, 360, 400), (854, 480, 800), (1280, 720, 1500), (1920, 1080, 4000)]
+
+MPD_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" xmlns:cenc="urn:mpeg:cenc:2013" type="static" mediaPresentationDuration="PT{minutes}M12.4S" minBufferTime="PT2S" profiles="urn:mpeg:dash:profile:isoff-live:2011">
+  <Period id="0">
+    <AdaptationSet mimeType="video/mp4" contentType="video" segmentAlignment="true">
+      <ContentProtection schemeIdUri="urn:mpeg:dash:mp4protection:2011" value="cenc" cenc:default_KID="{kid}"/>
+      <SegmentTemplate timescale="1000" initialization="https://cdn.example.com/{asset}/v/$RepresentationID$/init.mp4" media="https://cdn.example.com/{asset}/v/$RepresentationID$/$Number$.m4s" startNumber="1" duration="6000"/>
+{videos}
+    </AdaptationSet>
+    <AdaptationSet mimeType="audio/mp4" contentType="audio" lang="en">
+      <SegmentTemplate timescale="1000" initialization="https://cdn.example.com/{asset}/a/$RepresentationID$/init.mp4" media="https://cdn.example.com/{asset}/a/$RepresentationID$/$Number$.m4s" startNumber="1" duration="6000"/>
+      <Representation id="audio_64" bandwidth="64000" codecs="mp4a.40.2" audioSamplingRate="44100"/>
+      <Representation id="audio_128" bandwidth="128000" codecs="mp4a.40.2" audioSamplingRate="44100"/>
+    </AdaptationSet>
+  </Period>
+</MPD>
+"""
+
+
+def generate_corpus(directory, count):
+    paths = []
+    for i in range(count):
+        ladder = VIDEO_LADDER[: 2 + i % (len(VIDEO_LADDER) - 1)]
+        videos = "\n".join(
+            f'      <Representation id="video_{i}_{h}" bandwidth="{kbps * 1000 + i}" codecs="avc1.4d401f" width="{w}" height="{h}" frameRate="30"/>'
+            for w, h, kbps in ladder
+        )
+        path = Path(directory, f"index_{1000 + i}.mpd")
+        path.write_text(
+            MPD_TEMPLATE.format(minutes=1 + i % 30, kid=f"{i:08x}-1234-abcd-1234-abcd1234abcd", asset=1000 + i, videos=videos)
+        )
+        paths.append(path)
+    return paths
+
+
+def video_records(representations):
+    return sorted((r.format_id, int(r.width), int(r.height), round(r.tbr)) for r in representations if r.kind == "video")
+
+
+def time_parser(fn, paths, rounds):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for path in paths:
+            fn(path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def import_time(module):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], check=True)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MPD representation listing")
+    parser.add_argument("mpd_dir", nargs="?", help="Folder of .mpd files, a synthetic corpus is generated if omitted")
+    parser.add_argument("--count", type=int, default=200, help="Size of the synthetic corpus (Default is 200)")
+    parser.add_argument("--rounds", type=int, default=3, help="Timed rounds per parser, the best is reported (Default is 3)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.mpd_dir:
+            paths = sorted(Path(args.mpd_dir).glob("*.mpd"))
+        else:
+            paths = generate_corpus(tmp, args.count)
+        if not paths:
+            sys.exit("No .mpd files found")
+
+        mismatches = [p for p in paths if video_records(list_representations(p)) != video_records(list_representations_ytdlp(p))]
+        if mismatches:
+            for path in mismatches:
+                print(f"mismatch: {path}")
+            sys.exit(1)
+
+        native = time_parser(list_representations, paths, args.rounds)
+        ytdlp = time_parser(list_representations_ytdlp, paths, args.rounds)
+
+    print(f"{len(paths)} MPDs, identical video representations from both parsers")
+    print(f"{'parser':<10}{'total s':>10}{'per mpd ms':>14}")
+    for name, elapsed in (("native", native), ("yt-dlp", ytdlp)):
+        print(f"{name:<10}{elapsed:>10.3f}{elapsed / len(paths) * 1000:>14.3f}")
+    print(f"speedup: {ytdlp / native:.1f}x")
+    print(f"import: mpegdash.parser {import_time('mpegdash.parser'):.3f}s, yt_dlp {import_time('yt_dlp'):.3f}s")
+
+
+if __name__ == "__main__":
+    main()
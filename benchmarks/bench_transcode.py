@@ -0,0 +1,127 @@
+"""
+Compare encoding lectures with H.265 in one ffmpeg process against cutting them at keyframes and encoding the
+chunks in parallel.
+
+Usage: python benchmarks/bench_transcode.py [--durations S,S,...] [--chunks N] [--workers N] [--preset PRESET] [--crf CRF]
+
+Test clips (a moving test pattern with a tone, 720p30, a keyframe every 2 seconds like udemy's renditions)
+are generated with ffmpeg's lavfi sources. Each clip is encoded both ways with the same libx265 settings;
+both outputs must have the duration and frame count of the clip. Needs ffmpeg and ffprobe with libx265 in PATH.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ffmpeg_runner import run_ffmpeg  # noqa: E402
+from transcode import ChunkedEncoder, default_workers  # noqa: E402
+
+
+def generate_clip(path, duration):
+    args = [
+        "ffmpeg",
+        "-y",
+        "-f",
+        "lavfi",
+        "-i",
+        f"testsrc2=size=1280x720:rate=30:duration={duration}",
+        "-f",
+        "lavfi",
+        "-i",
+        f"sine=frequency=440:duration={duration}",
+        "-c:v",
+        "libx264",
+        "-g",
+        "60",
+        "-pix_fmt",
+        "yuv420p",
+        "-c:a",
+        "aac",
+        "-shortest",
+        path,
+    ]
+    subprocess.run(args, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def probe(path):
+    """Duration and video frame count of ``path``"""
+    duration = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.strip()
+    frames = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0", "-count_packets", "-show_entries", "stream=nb_read_packets", "-of", "csv=p=0", path],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.strip()
+    return float(duration), int(frames)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark single-process vs chunked H.265 encoding")
+    parser.add_argument("--durations", default="60,300", help="Comma separated clip lengths in seconds (Default is 60,300)")
+    parser.add_argument("--chunks", type=int, default=os.cpu_count() or 4, help="Chunks per clip (Default is the number of cores)")
+    parser.add_argument("--workers", type=int, help="Chunks encoded at once (Default is derived from the cores and --preset)")
+    parser.add_argument("--preset", default="medium", help="libx265 preset (Default is medium)")
+    parser.add_argument("--crf", type=int, default=28, help="libx265 crf (Default is 28)")
+    args = parser.parse_args()
+
+    if not shutil.which("ffmpeg") or not shutil.which("ffprobe"):
+        sys.exit("ffmpeg and ffprobe must be in PATH")
+    workers = args.workers or default_workers(args.preset)
+    video_args = ["-c:v", "libx265", "-vtag", "hvc1", "-crf", str(args.crf), "-preset", args.preset]
+
+    def single(input_path, output_path):
+        return ["ffmpeg", "-y", "-i", input_path, "-map", "0", *video_args, "-c:a", "copy", "-f", "mp4", output_path]
+
+    def chunk(input_path, output_path):
+        return ["ffmpeg", "-y", "-i", input_path, "-map", "0:v:0", *video_args, "-an", "-f", "mp4", output_path]
+
+    chunker = ChunkedEncoder(chunk, args.chunks, workers)
+    rows = []
+    with tempfile.TemporaryDirectory() as work:
+        for duration in (int(value) for value in args.durations.split(",")):
+            clip = os.path.join(work, f"clip_{duration}.mp4")
+            generate_clip(clip, duration)
+            expected = probe(clip)
+
+            single_path = os.path.join(work, f"single_{duration}.mp4")
+            start = time.perf_counter()
+            if run_ffmpeg(single(clip, single_path)) != 0:
+                sys.exit(f"single-process encode of the {duration}s clip failed")
+            single_time = time.perf_counter() - start
+
+            chunked_path = os.path.join(work, f"chunked_{duration}.mp4")
+            start = time.perf_counter()
+            if chunker.encode(clip, chunked_path) is None:
+                sys.exit(f"the {duration}s clip is too short to split")
+            chunked_time = time.perf_counter() - start
+
+            for path in (single_path, chunked_path):
+                got = probe(path)
+                if got[1] != expected[1] or abs(got[0] - expected[0]) > 0.1:
+                    sys.exit(f"{os.path.basename(path)}: {got[0]:.2f}s/{got[1]} frames, the clip has {expected[0]:.2f}s/{expected[1]}")
+            rows.append(
+                (duration, single_time, chunked_time, os.path.getsize(single_path), os.path.getsize(chunked_path))
+            )
+
+    print(f"libx265 -preset {args.preset} -crf {args.crf}, {args.chunks} chunks, {workers} at once, frame counts and durations match")
+    print(f"{'clip s':>8}{'single s':>10}{'chunked s':>11}{'speedup':>9}{'single MB':>11}{'chunked MB':>12}")
+    for duration, single_time, chunked_time, single_size, chunked_size in rows:
+        print(
+            f"{duration:>8}{single_time:>10.1f}{chunked_time:>11.1f}{single_time / chunked_time:>8.2f}x"
+            f"{single_size / 1e6:>11.2f}{chunked_size / 1e6:>12.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -29,6 +29,7 @@ class URLS:
     SUBSCRIPTION_COURSES = "https://{portal_name}.udemy.com/api-2.0/users/me/subscription-course-enrollments?fields%5Buser%5D=title%2Cimage_100x100&fields%5Bcourse%5D=title%2Cheadline%2Curl%2Ccompletion_ratio%2Cnum_published_lectures%2Cimage_480x270%2Cimage_240x135%2Cfavorite_time%2Carchive_time%2Cis_taking_disabled%2Cfeatures%2Cvisible_instructors%2Clast_accessed_time%2Csort_order%2Cis_user_subscribed%2Cis_in_user_subscription%2Cis_wishlisted%2Cpublished_title%2Cavailable_features%2Cnum_published_practice_tests%2Cnum_coding_exercises%2Cnum_published_quizzes%2Cnum_of_published_curriculum_objects%2Cprimary_category%2Clocale%2Ccourse_has_labels%2Cis_gen_ai_policy_opted_in%2Cavailable_features&ordering=-last_accessed%2C-enrolled&page=1&page_size=50&locale=en_US"
     MY_COURSES = "https://{portal_name}.udemy.com/api-2.0/users/me/subscribed-courses?fields[course]=id,url,title,published_title&ordering=-last_accessed,-access_time&page=1&page_size=10000"
     COLLECTION = "https://{portal_name}.udemy.com/api-2.0/users/me/subscribed-courses-collections/?collection_has_courses=True&course_limit=20&fields[course]=last_accessed_time,title,published_title&fields[user_has_subscribed_courses_collection]=@all&page=1&page_size=1000"
+    LECTURE = "https://{portal_name}.udemy.com/api-2.0/users/me/subscribed-courses/{course_id}/lectures/{lecture_id}/"
     QUIZ = "https://{portal_name}.udemy.com/api-2.0/quizzes/{quiz_id}/assessments/?version=1&page_size=250&fields[assessment]=id,assessment_type,prompt,correct_response,section,question_plain,related_lectures"
     VISIT = "https://{portal_name}.udemy.com/api-2.0/visits/current/?fields%5Bvisit%5D=@default,visitor,country&locale=en_US"
     # URL form encoded, email
@@ -48,8 +49,14 @@ CURRICULUM_ITEMS_PARAMS = {
     "page_size": "200",
 }
 
+# a single lecture with freshly signed asset urls, the same fields the curriculum items have
+LECTURE_PARAMS = {
+    "fields[lecture]": CURRICULUM_ITEMS_PARAMS["fields[lecture]"],
+    "fields[asset]": CURRICULUM_ITEMS_PARAMS["fields[asset]"],
+}
+
 COURSE_URL_PARAMS = {
-    "fields[course]": "title",
+    "fields[course]": "id,url,title,published_title",
     "use_remote_version": True,
     "caching_intent": True,
 }
@@ -66,6 +73,10 @@ HOME_DIR = APP_ROOT
 SAVED_DIR = os.path.join(APP_ROOT, "saved")
 KEY_FILE_PATH = os.path.join(APP_ROOT, "keyfile.json")
 COOKIE_FILE_PATH = os.path.join(APP_ROOT, "cookies.txt")
+COURSE_INDEX_PATH = os.path.join(SAVED_DIR, "course_index.json")
+COURSE_INDEX_TTL = 7 * 24 * 60 * 60  # seconds
+HTTP_CACHE_DIR = os.path.join(SAVED_DIR, "http_cache")
+STREAM_CACHE_DIR = os.path.join(SAVED_DIR, "stream_cache")
 # Allow host to override log paths so it can tail a known file
 _ENV_LOG_DIR = os.environ.get("UDEMY_LOG_DIR")
 _ENV_LOG_FILE = os.environ.get("UDEMY_LOG_FILE")
@@ -0,0 +1,77 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+log = logging.getLogger("udemy-downloader.course_index")
+
+# only these fields are needed to resolve a course, the rest of the enrollment record is dropped
+INDEXED_FIELDS = ("id", "url", "title", "published_title")
+
+
+class CourseIndex(object):
+    """
+    Persistent (portal, slug) -> course index so a course can be resolved without listing every enrollment.
+
+    Entries older than ``ttl`` seconds are ignored and dropped on the next save.
+    """
+
+    def __init__(self, path: str, ttl: int):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    @staticmethod
+    def _key(portal_name: str, slug: str) -> str:
+        return f"{portal_name}/{slug}".lower()
+
+    def _is_fresh(self, entry: dict) -> bool:
+        return time.time() - entry.get("time", 0) < self.ttl
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, encoding="utf8", mode="r") as f:
+                entries = json.loads(f.read())
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError):
+            log.warning("Course index at %s is unreadable, starting with an empty index", self.path)
+            return {}
+        return {k: v for k, v in entries.items() if isinstance(v, dict) and self._is_fresh(v)}
+
+    def save(self):
+        with self._lock:
+            entries = {k: v for k, v in self._entries.items() if self._is_fresh(v)}
+            self._entries = entries
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp_path = self.path + ".tmp"
+                with open(tmp_path, encoding="utf8", mode="w") as f:
+                    f.write(json.dumps(entries))
+                os.replace(tmp_path, self.path)
+            except OSError:
+                log.exception("Failed to write course index to %s", self.path)
+
+    def get(self, portal_name: str, slug: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(self._key(portal_name, slug))
+        if entry and self._is_fresh(entry):
+            return entry.get("course")
+        return None
+
+    def put(self, portal_name: str, slug: str, course: dict):
+        record = {k: course.get(k) for k in INDEXED_FIELDS}
+        with self._lock:
+            self._entries[self._key(portal_name, slug)] = {"course": record, "time": time.time()}
+
+    def put_many(self, portal_name: str, courses: list):
+        """Index every course of a full enrollment scan by both its slug and its id"""
+        for course in courses:
+            if not isinstance(course, dict) or not course.get("id"):
+                continue
+            self.put(portal_name, str(course.get("id")), course)
+            if course.get("published_title"):
+                self.put(portal_name, course.get("published_title"), course)
@@ -0,0 +1,122 @@
+import logging
+from typing import Iterable, Iterator, Optional, Tuple
+
+from pathvalidate import sanitize_filename
+
+from models import Chapter, Lecture
+
+log = logging.getLogger("udemy-downloader.curriculum")
+
+LECTURE_CLASSES = ("lecture", "quiz")
+
+
+class Curriculum(object):
+    """
+    Builds the ``chapters`` of a ``udemy_object`` from raw curriculum items in a single pass.
+
+    Chapters and lectures are indexed by id and by ``object_index`` as they are added, so looking one up never
+    scans the curriculum. They are stored in ``udemy_object`` as ``Chapter``/``Lecture`` records, chapters that were
+    loaded from json are converted. Dump ``udemy_object`` with ``models.to_json`` as the ``default`` hook.
+    """
+
+    def __init__(self, udemy_object: dict, continuous_numbers: bool = False):
+        self.udemy_object = udemy_object
+        self.chapters = udemy_object.setdefault("chapters", [])
+        self.chapters[:] = [Chapter.from_dict(chapter) for chapter in self.chapters]
+        self.continuous_numbers = continuous_numbers
+        self.chapters_by_id = {}
+        self.chapters_by_index = {}
+        self.lectures_by_id = {}
+        self.lectures_by_index = {}
+        for chapter in self.chapters:
+            self._index_chapter(chapter)
+            for lecture in chapter.lectures:
+                self._index_lecture(lecture)
+
+    def _index_chapter(self, chapter: Chapter):
+        self.chapters_by_id[chapter.chapter_id] = chapter
+        self.chapters_by_index[chapter.chapter_index] = chapter
+
+    def _index_lecture(self, lecture: Lecture):
+        self.lectures_by_id[lecture.id] = lecture
+        self.lectures_by_index[lecture.lecture_index] = lecture
+
+    def _add_chapter(self, chapter_id, chapter_index, title) -> Chapter:
+        chapter = Chapter(
+            chapter_title="{0:02d} - ".format(chapter_index) + sanitize_filename(title),
+            chapter_id=chapter_id,
+            chapter_index=chapter_index,
+            lectures=[],
+            lecture_count=0,
+        )
+        self.chapters.append(chapter)
+        self._index_chapter(chapter)
+        return chapter
+
+    def build(self, entries: Iterable[dict], total: Optional[int] = None) -> Iterator[Tuple[Chapter, Optional[Lecture]]]:
+        """
+        Add raw curriculum ``entries`` as they are read.
+
+        Yields ``(chapter, None)`` when a chapter starts and ``(chapter, lecture)`` for each of its lectures and
+        quizzes, so ``entries`` can be a generator that is still fetching pages. ``total_chapters`` and
+        ``total_lectures`` are set once every entry has been read.
+        """
+        chapter = None
+        lecture_counter = 0
+
+        for n, entry in enumerate(entries, start=1):
+            clazz = entry.get("_class")
+
+            if clazz == "chapter":
+                # reset lecture tracking
+                if not self.continuous_numbers:
+                    lecture_counter = 0
+                chapter = self._add_chapter(entry.get("id"), entry.get("object_index"), entry.get("title"))
+                yield chapter, None
+            elif clazz in LECTURE_CLASSES:
+                lecture_counter += 1
+                lecture_id = entry.get("id")
+                if chapter is None:
+                    # dummy chapters to handle lectures without chapters
+                    chapter = self._add_chapter(lecture_id, entry.get("object_index"), entry.get("title"))
+                    yield chapter, None
+
+                if not lecture_id:
+                    log.debug("%s: ID is None, skipping", clazz.capitalize())
+                    continue
+                log.info(f"Processing {n} of {total}" if total else f"Processing {n}")
+
+                lecture = Lecture(
+                    index=lecture_counter,
+                    lecture_index=entry.get("object_index"),
+                    lecture_title="{0:03d} ".format(lecture_counter) + sanitize_filename(entry.get("title")),
+                    _class=clazz,
+                    id=lecture_id,
+                    data=entry,
+                )
+                chapter.lectures.append(lecture)
+                chapter.lecture_count += 1
+                self._index_lecture(lecture)
+                yield chapter, lecture
+
+        self.udemy_object["total_chapters"] = len(self.chapters)
+        self.udemy_object["total_lectures"] = sum(chapter.lecture_count or 0 for chapter in self.chapters)
+
+    def events(self) -> Iterator[Tuple[Chapter, Optional[Lecture]]]:
+        """The same ``(chapter, lecture)`` pairs ``build`` yields, for a curriculum that is already built"""
+        for chapter in self.chapters:
+            yield chapter, None
+            for lecture in chapter.lectures:
+                yield chapter, lecture
+
+    def chapter(self, chapter_id) -> Optional[Chapter]:
+        return self.chapters_by_id.get(chapter_id)
+
+    def lecture(self, lecture_id) -> Optional[Lecture]:
+        return self.lectures_by_id.get(lecture_id)
+
+    def chapter_at(self, object_index) -> Optional[Chapter]:
+        return self.chapters_by_index.get(object_index)
+
+    def lecture_at(self, object_index) -> Optional[Lecture]:
+        return self.lectures_by_index.get(object_index)
@@ -0,0 +1,180 @@
+import logging
+import os
+import re
+import secrets
+import subprocess
+import tempfile
+import time
+from typing import Callable, List, Optional
+
+from aria2_rpc import DEFAULT_OPTIONS, Aria2Error, Aria2RPC, Aria2RPCError
+
+log = logging.getLogger("udemy-downloader.batch")
+
+# a line of the "Download Results" table aria2c prints on exit, the gid column may be shortened to 6 characters
+_RESULT_RE = re.compile(r"^([0-9a-f]{6,16})\|(OK|ERR|INPR|RM)\s*\|")
+
+
+class BatchItem(object):
+    __slots__ = ("get_url", "directory", "filename", "on_done", "fallback", "owner", "gid", "error")
+
+    def __init__(self, get_url, directory, filename, on_done, fallback, owner):
+        self.get_url = get_url
+        self.directory = directory
+        self.filename = filename
+        self.on_done = on_done
+        self.fallback = fallback
+        self.owner = owner
+        self.gid = None
+        self.error = None
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, self.filename)
+
+
+class DownloadBatch(object):
+    """
+    Files collected while a chapter is parsed (captions, attachments) and downloaded by a single aria2c run.
+
+    ``run`` submits every item to the aria2c rpc daemon when there is one, otherwise it writes them to an input
+    file for ``aria2c -i``. Each item gets its own gid so its result is mapped back to it; the items that failed
+    are returned so the caller can retry them one by one.
+    """
+
+    def __init__(self):
+        self.items = []
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(
+        self,
+        get_url: Callable[[], str],
+        directory: str,
+        filename: str,
+        on_done: Optional[Callable[[], None]] = None,
+        fallback: Optional[Callable[[], None]] = None,
+        owner=None,
+    ):
+        """
+        Queue a file. ``get_url`` is called when the batch runs, so links refreshed in the meantime are used.
+
+        ``on_done`` is called once the file is downloaded, ``fallback`` downloads the item on its own if the
+        batch failed it, ``owner`` is kept for the caller (e.g. the lecture the file belongs to).
+        """
+        self.items.append(BatchItem(get_url, directory, filename, on_done, fallback, owner))
+
+    def run(self, daemon: Optional[Aria2RPC] = None, concurrency: int = 16) -> List[BatchItem]:
+        """Download every item and return the ones that failed"""
+        items = []
+        for item in self.items:
+            item.error = None
+            url = item.get_url()
+            if not url:
+                item.error = "no download url"
+                continue
+            items.append((item, url))
+        # the first 6 characters tell the items apart in the shortened gid column of aria2c's results
+        prefix = secrets.token_hex(5)
+        for n, (item, _) in enumerate(items):
+            item.gid = f"{n:06x}{prefix}"
+
+        start = time.monotonic()
+        if items:
+            if daemon is not None:
+                self._run_rpc(daemon, items)
+            else:
+                self._run_input_file(items, concurrency)
+        failed = [item for item in self.items if item.error is not None]
+        log.debug("Batch of %d files done in %.1fs, %d failed", len(self.items), time.monotonic() - start, len(failed))
+        return failed
+
+    def _run_rpc(self, daemon: Aria2RPC, items):
+        """
+        Raises ``Aria2RPCError`` if the daemon stops answering, after trying to remove the downloads it
+        accepted. The caller should shut the daemon down before downloading the items another way, so a file
+        is never written by two processes. A download the daemon rejects (e.g. a malformed url) only fails its item.
+        """
+        results = daemon.multicall(
+            [
+                ("aria2.addUri", [url], {"dir": os.path.abspath(item.directory), "out": item.filename, "gid": item.gid})
+                for item, url in items
+            ],
+            return_faults=True,
+        )
+        pending = {}
+        for (item, _), result in zip(items, results):
+            if isinstance(result, Aria2Error):
+                item.error = f"rejected by aria2c: {result.message}"
+            else:
+                pending[item.gid] = item
+        try:
+            self._poll_rpc(daemon, pending)
+        except Aria2RPCError:
+            try:
+                daemon.multicall([("aria2.forceRemove", gid) for gid in pending], return_faults=True)
+            except Aria2RPCError:
+                pass
+            raise
+
+    @staticmethod
+    def _poll_rpc(daemon: Aria2RPC, pending: dict):
+        keys = ["gid", "status", "errorCode", "errorMessage"]
+        delay = 0.05
+        while pending:
+            gids = list(pending)
+            statuses = daemon.multicall([("aria2.tellStatus", gid, keys) for gid in gids], return_faults=True)
+            finished = []
+            for gid, status in zip(gids, statuses):
+                if isinstance(status, Aria2Error):
+                    # the daemon no longer knows the download
+                    pending.pop(gid).error = f"aria2 error: {status.message}"
+                    continue
+                state = status.get("status")
+                if state not in ("complete", "error", "removed"):
+                    continue
+                item = pending.pop(gid)
+                if state != "complete":
+                    item.error = f"aria2 error {status.get('errorCode', 'removed')}: {status.get('errorMessage', 'download was removed')}"
+                finished.append(item.gid)
+            if finished:
+                daemon.multicall([("aria2.removeDownloadResult", gid) for gid in finished], return_faults=True)
+            if pending:
+                time.sleep(delay)
+                delay = min(delay * 2, 1.0)
+
+    def _run_input_file(self, items, concurrency: int):
+        lines = []
+        for item, url in items:
+            lines += [url, f"  dir={os.path.abspath(item.directory)}", f"  out={item.filename}", f"  gid={item.gid}"]
+        fd, input_path = tempfile.mkstemp(prefix="aria2-batch-", suffix=".txt")
+        try:
+            with os.fdopen(fd, encoding="utf8", mode="w") as f:
+                f.write("\n".join(lines) + "\n")
+            options = [option for option in DEFAULT_OPTIONS if not option.startswith("-j")]
+            process = subprocess.run(
+                ["aria2c", "-i", input_path, f"-j{concurrency}", "--download-result=full", *options],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                encoding="utf-8",
+                errors="replace",
+            )
+        finally:
+            os.remove(input_path)
+
+        results = {}
+        for line in process.stdout.splitlines():
+            log.debug("[ARIA2] %s", line.rstrip())
+            match = _RESULT_RE.match(line.strip())
+            if match:
+                results[match.group(1)[:6]] = match.group(2)
+        for item, _ in items:
+            status = results.get(item.gid[:6])
+            if status is None:
+                # no results table (aria2c crashed or was killed), trust only finished files
+                complete = os.path.isfile(item.path) and not os.path.isfile(item.path + ".aria2")
+                status = "OK" if complete else "ERR"
+            if status != "OK":
+                item.error = f"aria2c status {status} (exit code {process.returncode})"
@@ -0,0 +1,58 @@
+import re
+from urllib.parse import parse_qsl, urlparse
+
+from constants import URLS
+
+_PLACEHOLDER_RE = re.compile(r"\{[a-z_]+\}")
+
+
+def _compile(template: str):
+    parts = urlparse(template)
+    pieces = _PLACEHOLDER_RE.split(parts.path)
+    path_re = re.compile("^" + "[^/]+".join(re.escape(p) for p in pieces) + "$")
+    query_keys = frozenset(k for k, _ in parse_qsl(parts.query, keep_blank_values=True))
+    return path_re, query_keys
+
+
+# (name, path regex, query keys) for every API template in URLS
+_TEMPLATES = [
+    (f"URLS.{name}", *_compile(value))
+    for name, value in vars(URLS).items()
+    if not name.startswith("_") and isinstance(value, str)
+]
+
+
+def classify(url: str) -> str:
+    """
+    Map a request url to the endpoint template it was built from, e.g. ``URLS.CURRICULUM_ITEMS``.
+
+    Media urls that aren't API templates are bucketed by type: ``m3u8``, ``mpd``, ``caption`` or ``cdn``.
+    """
+    parts = urlparse(url)
+    path = parts.path
+    query_keys = {k for k, _ in parse_qsl(parts.query, keep_blank_values=True)}
+
+    best = None
+    best_score = -1
+    for name, path_re, template_keys in _TEMPLATES:
+        if not path_re.match(path):
+            continue
+        # templates can share a path (MY_COURSES / COURSE_SEARCH), prefer the one whose query keys are present
+        if template_keys - {"page", "page_size"} - query_keys:
+            continue
+        score = len(template_keys & query_keys)
+        if score > best_score:
+            best, best_score = name, score
+    if best:
+        return best
+
+    lowered = path.lower()
+    if lowered.endswith(".m3u8"):
+        return "m3u8"
+    if lowered.endswith(".mpd"):
+        return "mpd"
+    if lowered.endswith((".vtt", ".srt")):
+        return "caption"
+    if "/api-2.0/" in lowered:
+        return "api"
+    return "cdn"
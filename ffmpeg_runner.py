@@ -0,0 +1,175 @@
+import logging
+import os
+import re
+import subprocess
+import threading
+import time
+from collections import deque
+from typing import Callable, List, Optional
+
+log = logging.getLogger("udemy-downloader.ffmpeg")
+
+# the input duration ffmpeg prints before it starts, used for the ETA when the caller doesn't know it
+_DURATION_RE = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+
+
+def parse_timestamp(value: str) -> Optional[float]:
+    """Seconds of an ``HH:MM:SS.micro`` timestamp, None for N/A"""
+    hours, _, rest = value.strip().partition(":")
+    minutes, _, seconds = rest.partition(":")
+    try:
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    except ValueError:
+        return None
+
+
+def with_progress(args: List[str]) -> List[str]:
+    """``args`` with ffmpeg's machine readable progress sent to stdout instead of the stats line on stderr"""
+    for index, arg in enumerate(args):
+        if os.path.splitext(os.path.basename(arg))[0].lower() == "ffmpeg":
+            return [*args[: index + 1], "-progress", "pipe:1", "-nostats", *args[index + 1 :]]
+    raise ValueError(f"not an ffmpeg command: {args!r}")
+
+
+class FFmpegProgress(object):
+    """The latest progress block of an ffmpeg process"""
+
+    __slots__ = ("frame", "fps", "out_time", "speed", "total_size", "duration", "started", "ended")
+
+    def __init__(self, duration: Optional[float] = None):
+        self.frame = 0
+        self.fps = 0.0
+        self.out_time = 0.0
+        self.speed = 0.0
+        self.total_size = 0
+        self.duration = duration
+        self.started = time.monotonic()
+        self.ended = False
+
+    def update(self, key: str, value: str):
+        try:
+            if key == "frame":
+                self.frame = int(value)
+            elif key == "fps":
+                self.fps = float(value)
+            elif key == "out_time_us":
+                self.out_time = max(0.0, int(value) / 1e6)
+            elif key == "out_time" and not self.out_time:
+                self.out_time = max(0.0, parse_timestamp(value) or 0.0)
+            elif key == "speed":
+                self.speed = float(value.rstrip("x"))
+            elif key == "total_size":
+                self.total_size = int(value)
+            elif key == "progress":
+                self.ended = value == "end"
+        except ValueError:
+            # N/A until ffmpeg has written something
+            pass
+
+    @property
+    def percent(self) -> Optional[float]:
+        if not self.duration:
+            return None
+        return min(100.0, self.out_time * 100 / self.duration)
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Seconds until ffmpeg reaches the end of the input at its current speed, None while that's unknown"""
+        if self.ended:
+            return 0.0
+        if not self.duration or not self.speed:
+            return None
+        return max(0.0, (self.duration - self.out_time) / self.speed)
+
+    def as_dict(self) -> dict:
+        eta = self.eta
+        return {
+            "frame": self.frame,
+            "fps": round(self.fps, 2),
+            "out_time": round(self.out_time, 3),
+            "speed": round(self.speed, 3),
+            "total_size": self.total_size,
+            "duration": self.duration,
+            "eta": round(eta, 1) if eta is not None else None,
+        }
+
+
+class FFmpegProcess(object):
+    """
+    Runs an ffmpeg command given as an argument list with ``-progress pipe:1``.
+
+    Every progress block ffmpeg writes (about twice a second) updates ``progress`` and is handed to
+    ``on_progress``. Its log lines go to the logger at DEBUG, the last ones are kept in ``tail`` for error
+    messages. With ``stdin=True`` the input can be written to ``stdin`` (e.g. ``-i pipe:0``), ``wait`` closes it.
+    """
+
+    def __init__(
+        self,
+        args: List[str],
+        on_progress: Optional[Callable[[FFmpegProgress], None]] = None,
+        duration: Optional[float] = None,
+        stdin: bool = False,
+    ):
+        self.on_progress = on_progress
+        self.progress = FFmpegProgress(duration)
+        self.tail = deque(maxlen=20)
+        self.process = subprocess.Popen(
+            with_progress(args),
+            stdin=subprocess.PIPE if stdin else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        self._threads = [
+            threading.Thread(target=self._read_progress, daemon=True),
+            threading.Thread(target=self._read_log, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def stdin(self):
+        return self.process.stdin
+
+    def _read_progress(self):
+        for raw in self.process.stdout:
+            key, _, value = raw.decode("utf-8", "replace").strip().partition("=")
+            self.progress.update(key, value)
+            if key == "progress" and self.on_progress is not None:
+                try:
+                    self.on_progress(self.progress)
+                except Exception:
+                    log.exception("Progress callback failed")
+        self.process.stdout.close()
+
+    def _read_log(self):
+        for raw in self.process.stderr:
+            line = raw.decode("utf-8", "replace").rstrip()
+            if self.progress.duration is None:
+                match = _DURATION_RE.search(line)
+                if match:
+                    self.progress.duration = parse_timestamp(match.group(0)[len("Duration: ") :])
+            self.tail.append(line)
+            log.debug("[FFMPEG] %s", line)
+        self.process.stderr.close()
+
+    def kill(self):
+        self.process.kill()
+
+    def wait(self) -> int:
+        """Close stdin, wait for ffmpeg and its output to be read, return its exit code"""
+        if self.process.stdin is not None:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+        ret_code = self.process.wait()
+        for thread in self._threads:
+            thread.join()
+        return ret_code
+
+
+def run_ffmpeg(
+    args: List[str], on_progress: Optional[Callable[[FFmpegProgress], None]] = None, duration: Optional[float] = None
+) -> int:
+    """Run an ffmpeg command to completion and return its exit code, see ``FFmpegProcess``"""
+    return FFmpegProcess(args, on_progress, duration).wait()
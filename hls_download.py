@@ -0,0 +1,185 @@
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Callable, List, Optional
+
+import m3u8
+import requests
+from urllib3.exceptions import HTTPError as ProtocolError
+
+from retry_policy import CircuitOpenError
+
+log = logging.getLogger("udemy-downloader.hls_download")
+
+# how many times a segment is fetched again after a connection error before the download fails
+SEGMENT_ATTEMPTS = 3
+
+
+class UnsupportedPlaylist(Exception):
+    """The playlist needs something the native engine doesn't do (e.g. AES keys), it is left to yt-dlp"""
+
+
+class Segment(object):
+    __slots__ = ("uri", "start", "end")
+
+    def __init__(self, uri: str, start: Optional[int] = None, end: Optional[int] = None):
+        self.uri = uri
+        self.start = start
+        self.end = end
+
+
+def _byterange(value: str, next_offset: Optional[int]):
+    """``<length>[@<offset>]``, without an offset the range follows the previous one of the same uri"""
+    length, _, offset = value.partition("@")
+    start = int(offset) if offset else (next_offset or 0)
+    return start, start + int(length) - 1
+
+
+def playlist_segments(playlist: m3u8.M3U8) -> List[Segment]:
+    """
+    The segments of a VOD media playlist in playback order, each fmp4 initialization section once before
+    the segments it applies to. Raises ``UnsupportedPlaylist`` for master playlists and encrypted segments.
+    """
+    if playlist.is_variant:
+        raise UnsupportedPlaylist("is a master playlist")
+    if not playlist.segments:
+        raise UnsupportedPlaylist("has no segments")
+    segments = []
+    init_section = None
+    next_offset = {}
+    for segment in playlist.segments:
+        key = segment.key
+        if key is not None and key.method and key.method.upper() != "NONE":
+            raise UnsupportedPlaylist(f"has {key.method} encrypted segments")
+        section = segment.init_section
+        if section is not None and section.uri:
+            uri = section.absolute_uri or section.uri
+            identity = (uri, section.byterange)
+            if identity != init_section:
+                init_section = identity
+                start = end = None
+                if section.byterange:
+                    start, end = _byterange(section.byterange, None)
+                segments.append(Segment(uri, start, end))
+        uri = segment.absolute_uri or segment.uri
+        start = end = None
+        if segment.byterange:
+            start, end = _byterange(segment.byterange, next_offset.get(uri))
+            next_offset[uri] = end + 1
+        segments.append(Segment(uri, start, end))
+    return segments
+
+
+def is_fragmented_mp4(playlist: m3u8.M3U8) -> bool:
+    """fmp4 segments (EXT-X-MAP) concatenate into an mp4 file, mpeg-ts ones have to be remuxed"""
+    return any(segment.init_section is not None for segment in playlist.segments)
+
+
+class HlsDownloader(object):
+    """
+    Downloads the segments of a non-DRM HLS media playlist without yt-dlp.
+
+    Up to ``concurrency`` segments are fetched at once over ``session`` (share one to share its connection
+    pool) and written to the output strictly in playlist order, so the output can be a pipe into ffmpeg as
+    well as a file. At most ``concurrency`` fetched segments are held in memory while an earlier one is
+    still on its way.
+
+    ``before_request(url)`` is called before every request (e.g. a rate limiter), ``retry(send, url)`` may wrap
+    it to retry failed statuses and ``record(url, elapsed, status, size, retries, reused)`` is called for every
+    response, ``reused`` being whether its connection came from the pool.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 10,
+        session: Optional[requests.Session] = None,
+        timeout: float = 20,
+        before_request: Optional[Callable[[str], None]] = None,
+        retry: Optional[Callable] = None,
+        record: Optional[Callable[[str, float, int, int, int, bool], None]] = None,
+    ):
+        self.concurrency = concurrency
+        self.session = session or requests.Session()
+        self.timeout = timeout
+        self.before_request = before_request
+        self.retry = retry
+        self.record = record
+
+    def get(self, url: str, headers: Optional[dict] = None) -> requests.Response:
+        """
+        GET ``url`` through the same rate limiting, retries and recording as the segments, e.g. for the playlist.
+        Error statuses are returned, not raised.
+        """
+
+        def send():
+            if self.before_request is not None:
+                self.before_request(url)
+            return self.session.get(url, headers=headers, timeout=self.timeout)
+
+        start = time.monotonic()
+        response = self.retry(send, url) if self.retry is not None else send()
+        if self.record is not None:
+            self.record(
+                url,
+                time.monotonic() - start,
+                response.status_code,
+                len(response.content),
+                getattr(response, "retries", 0),
+                getattr(response, "connection_reused", False),
+            )
+        return response
+
+    def _fetch(self, segment: Segment) -> bytes:
+        headers = {}
+        if segment.start is not None:
+            headers["Range"] = f"bytes={segment.start}-{segment.end}"
+
+        for attempt in range(SEGMENT_ATTEMPTS):
+            try:
+                response = self.get(segment.uri, headers)
+                response.raise_for_status()
+                data = response.content
+            except (requests.HTTPError, CircuitOpenError):
+                raise
+            except (requests.ConnectionError, requests.Timeout, ProtocolError) as error:
+                if attempt == SEGMENT_ATTEMPTS - 1:
+                    raise
+                log.debug("Segment %s failed (%s), fetching it again", segment.uri.split("?")[0], error)
+                continue
+            return data
+
+    def download(
+        self, playlist: m3u8.M3U8, output: BinaryIO, progress: Optional[Callable[[int, int, int], None]] = None
+    ) -> int:
+        """
+        Write every segment of ``playlist`` to ``output`` in order and return the bytes written.
+
+        ``progress(done, total, written)`` is called after every segment. Raises ``UnsupportedPlaylist`` before
+        anything is fetched if the playlist can't be downloaded natively, ``requests.HTTPError`` for error statuses.
+        """
+        segments = playlist_segments(playlist)
+        written = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="hls") as executor:
+            pending = deque()
+            queued = iter(segments)
+            try:
+                for segment in queued:
+                    pending.append(executor.submit(self._fetch, segment))
+                    if len(pending) >= self.concurrency:
+                        break
+                done = 0
+                while pending:
+                    data = pending.popleft().result()
+                    next_segment = next(queued, None)
+                    if next_segment is not None:
+                        pending.append(executor.submit(self._fetch, next_segment))
+                    output.write(data)
+                    written += len(data)
+                    done += 1
+                    if progress is not None:
+                        progress(done, len(segments), written)
+            finally:
+                for future in pending:
+                    future.cancel()
+        return written
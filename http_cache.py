@@ -0,0 +1,229 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+
+from endpoints import classify
+
+log = logging.getLogger("udemy-downloader.http_cache")
+
+# How long (seconds) a cached response may be reused per endpoint. Entries with an ETag or Last-Modified
+# are revalidated with a conditional request, the rest are served as-is until they expire.
+# Manifests are requested through signed urls that expire, so they are only kept briefly.
+DEFAULT_TTLS = {
+    "URLS.COURSE": 7 * 24 * 60 * 60,
+    "URLS.QUIZ": 24 * 60 * 60,
+    "URLS.MY_COURSES": 24 * 60 * 60,
+    "URLS.SUBSCRIPTION_COURSES": 24 * 60 * 60,
+    "URLS.COURSE_SEARCH": 24 * 60 * 60,
+    "URLS.COLLECTION": 24 * 60 * 60,
+    # curriculum items embed signed caption/asset urls
+    "URLS.CURRICULUM_ITEMS": 30 * 60,
+    "m3u8": 10 * 60,
+    "mpd": 10 * 60,
+}
+
+# response headers worth keeping, everything else is dropped
+_KEPT_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+
+class CacheEntry(object):
+    __slots__ = ("key", "url", "endpoint", "etag", "last_modified", "headers", "encoding", "stored", "size")
+
+    def __init__(self, key, url, endpoint, etag, last_modified, headers, encoding, stored, size):
+        self.key = key
+        self.url = url
+        self.endpoint = endpoint
+        self.etag = etag
+        self.last_modified = last_modified
+        self.headers = headers
+        self.encoding = encoding
+        self.stored = stored
+        self.size = size
+
+    @property
+    def has_validators(self) -> bool:
+        return bool(self.etag or self.last_modified)
+
+    def to_json(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class ResponseCache(object):
+    """
+    On-disk GET response cache keyed by url + params.
+
+    Each entry is a ``<key>.json`` metadata file next to a ``<key>.body`` file. The cache is bounded to
+    ``max_bytes`` of bodies and evicts the least recently used entries first.
+    """
+
+    def __init__(self, path: str, max_bytes: int, ttls: Optional[dict] = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = DEFAULT_TTLS if ttls is None else ttls
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._lru = OrderedDict()  # key -> CacheEntry, least recently used first
+        self._total = 0
+        os.makedirs(self.path, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def key_for(url: str, params: Optional[dict] = None) -> str:
+        raw = url + "\n" + json.dumps(params or {}, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _file(self, key: str, suffix: str) -> str:
+        return os.path.join(self.path, f"{key}.{suffix}")
+
+    def _load(self):
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.path, name), encoding="utf8", mode="r") as f:
+                    entries.append((CacheEntry(**json.loads(f.read())), os.path.getmtime(f.name)))
+            except (OSError, ValueError, TypeError):
+                continue
+        # the metadata file is touched on every hit, so its mtime is the last access time
+        for entry, _ in sorted(entries, key=lambda e: e[1]):
+            if self._expired(entry):
+                self._remove(entry.key)
+                continue
+            self._lru[entry.key] = entry
+            self._total += entry.size
+
+    def _ttl(self, endpoint: str) -> int:
+        return self.ttls.get(endpoint, 0)
+
+    def _expired(self, entry: CacheEntry) -> bool:
+        return time.time() - entry.stored >= self._ttl(entry.endpoint)
+
+    def _remove(self, key: str):
+        for suffix in ("json", "body"):
+            try:
+                os.remove(self._file(key, suffix))
+            except OSError:
+                pass
+
+    def _write_meta(self, entry: CacheEntry):
+        with open(self._file(entry.key, "json"), encoding="utf8", mode="w") as f:
+            f.write(json.dumps(entry.to_json()))
+
+    def lookup(self, url: str, params: Optional[dict] = None) -> Optional[CacheEntry]:
+        """Return the cached entry for a request if it hasn't expired"""
+        key = self.key_for(url, params)
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if self._expired(entry):
+                self._lru.pop(key)
+                self._total -= entry.size
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._lru.move_to_end(key)
+        try:
+            os.utime(self._file(key, "json"))
+        except OSError:
+            pass
+        return entry
+
+    @staticmethod
+    def conditional_headers(entry: CacheEntry) -> dict:
+        headers = {}
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def to_response(self, entry: CacheEntry, revalidated: bool = False) -> Optional[Response]:
+        """Rebuild a ``requests.Response`` from a cached entry"""
+        try:
+            with open(self._file(entry.key, "body"), mode="rb") as f:
+                body = f.read()
+        except OSError:
+            return None
+        if revalidated:
+            self.revalidated += 1
+        else:
+            self.hits += 1
+        response = Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.url = entry.url
+        response.encoding = entry.encoding
+        response.headers = CaseInsensitiveDict(entry.headers)
+        response._content = body
+        response.from_cache = True
+        return response
+
+    def revalidate(self, entry: CacheEntry, response: Response) -> Optional[Response]:
+        """Handle a 304 for ``entry``: restart its ttl and serve the cached body"""
+        entry.stored = time.time()
+        etag = response.headers.get("ETag")
+        if etag:
+            entry.etag = etag
+        try:
+            self._write_meta(entry)
+        except OSError:
+            pass
+        return self.to_response(entry, revalidated=True)
+
+    def store(self, url: str, params: Optional[dict], response: Response):
+        """Cache a 200 response if its endpoint has a ttl"""
+        endpoint = classify(url)
+        if response.status_code != 200 or self._ttl(endpoint) <= 0:
+            return
+        body = response.content
+        if len(body) > self.max_bytes:
+            return
+        key = self.key_for(url, params)
+        headers = {h: response.headers[h] for h in _KEPT_HEADERS if h in response.headers}
+        entry = CacheEntry(
+            key=key,
+            url=url,
+            endpoint=endpoint,
+            etag=headers.get("ETag"),
+            last_modified=headers.get("Last-Modified"),
+            headers=headers,
+            encoding=response.encoding,
+            stored=time.time(),
+            size=len(body),
+        )
+        try:
+            with open(self._file(key, "body"), mode="wb") as f:
+                f.write(body)
+            self._write_meta(entry)
+        except OSError:
+            log.exception("Failed to write cache entry for %s", url)
+            self._remove(key)
+            return
+        with self._lock:
+            old = self._lru.pop(key, None)
+            if old is not None:
+                self._total -= old.size
+            self._lru[key] = entry
+            self._total += entry.size
+            evicted = []
+            while self._total > self.max_bytes and self._lru:
+                _, victim = self._lru.popitem(last=False)
+                self._total -= victim.size
+                evicted.append(victim.key)
+        for victim_key in evicted:
+            self._remove(victim_key)
+        if evicted:
+            log.debug("Evicted %d cache entries", len(evicted))
@@ -0,0 +1,298 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+import requests
+from urllib3.exceptions import HTTPError as ProtocolError
+
+from retry_policy import CircuitOpenError
+from tls import ReuseTrackingAdapter
+
+log = logging.getLogger("udemy-downloader.http_download")
+
+# bytes read per readinto into a worker's buffer
+BUFFER_SIZE = 1024 * 1024
+# files are split in pieces of at most this size, each fetched with its own range request
+PIECE_SIZE = 8 * 1024 * 1024
+# smaller files are split in fewer pieces than there are connections, a range request costs a round trip
+MIN_PIECE_SIZE = 1024 * 1024
+# how many times a piece is fetched again after a connection error before the download fails
+PIECE_ATTEMPTS = 3
+
+
+class HttpDownloader(object):
+    """
+    Pooled HTTP downloader, used where aria2c isn't installed.
+
+    Files are written to ``<path>.part`` and renamed once complete. Files the server serves ranges of are split
+    into pieces of up to ``PIECE_SIZE`` fetched over up to ``connections`` pooled connections, into a preallocated part
+    file. The finished pieces are recorded in ``<path>.part.json`` so an interrupted download resumes where it
+    stopped. Data is read with ``readinto`` into one reusable buffer per connection.
+
+    ``before_request(url)`` is called before every request (e.g. a rate limiter) and ``retry(send, url)`` may
+    wrap it to retry failed statuses, as ``RetryPolicy.request`` does. A piece whose connection drops is fetched
+    up to ``piece_attempts`` times; callers that retry the whole download (which resumes) can pass 1. ``record(url, elapsed, status, size,
+    retries, reused)`` is called for every request once its body is read (or failed), with its real status,
+    the bytes it delivered and whether its connection came from the pool.
+    """
+
+    def __init__(
+        self,
+        connections: int = 8,
+        piece_size: int = PIECE_SIZE,
+        buffer_size: int = BUFFER_SIZE,
+        timeout: float = 20,
+        before_request: Optional[Callable[[str], None]] = None,
+        retry: Optional[Callable] = None,
+        record: Optional[Callable[[str, float, int, int, int, bool], None]] = None,
+        piece_attempts: int = PIECE_ATTEMPTS,
+    ):
+        self.connections = connections
+        self.piece_size = piece_size
+        self.buffer_size = buffer_size
+        self.timeout = timeout
+        self.before_request = before_request
+        self.retry = retry
+        self.record = record
+        self.piece_attempts = piece_attempts
+        self.session = requests.Session()
+        adapter = ReuseTrackingAdapter(pool_connections=16, pool_maxsize=max(connections, 16))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # ranges are byte offsets of the stored file, never let the server compress it
+        self.session.headers["Accept-Encoding"] = "identity"
+
+    def _get(self, url: str, start: int, end: Optional[int] = None) -> requests.Response:
+        headers = {"Range": f"bytes={start}-{'' if end is None else end}"}
+
+        def send():
+            if self.before_request is not None:
+                self.before_request(url)
+            return self.session.get(url, headers=headers, stream=True, timeout=self.timeout)
+
+        return self.retry(send, url) if self.retry is not None else send()
+
+    def _record(self, url: str, start: float, response: requests.Response, size: int):
+        if self.record is not None:
+            self.record(
+                url,
+                time.monotonic() - start,
+                response.status_code,
+                size,
+                getattr(response, "retries", 0),
+                getattr(response, "connection_reused", False),
+            )
+
+    def download(self, url: str, path: str, progress: Optional[Callable[[int, Optional[int]], None]] = None) -> int:
+        """
+        Download ``url`` to ``path`` and return its size.
+
+        ``progress(completed, total)`` is called with the bytes on disk so far, resumed ones included, and the
+        size of the file (None if the server doesn't tell). Raises ``requests.HTTPError`` for error statuses.
+        """
+        start = time.monotonic()
+        probe = self._get(url, 0, 0)
+        if probe.status_code == 416:
+            # an empty file
+            probe.close()
+            self._record(url, start, probe, 0)
+            open(path, "wb").close()
+            return 0
+        if not probe.ok:
+            probe.close()
+            self._record(url, start, probe, 0)
+            probe.raise_for_status()
+
+        total = None
+        content_range = probe.headers.get("Content-Range", "")
+        if probe.status_code == 206 and "/" in content_range and not content_range.endswith("/*"):
+            total = int(content_range.rsplit("/", 1)[1])
+        elif probe.status_code == 200 and probe.headers.get("Content-Length"):
+            total = int(probe.headers["Content-Length"])
+
+        if total is not None and os.path.isfile(path) and os.path.getsize(path) == total:
+            probe.close()
+            self._record(url, start, probe, 0)
+            if progress is not None:
+                progress(total, total)
+            return total
+
+        if probe.status_code != 206 or total is None:
+            # no ranges, the probe already is the whole body
+            return self._stream(url, start, probe, path, total, progress)
+        validator = probe.headers.get("ETag") or probe.headers.get("Last-Modified")
+        # reading the probed byte hands its connection back to the pool
+        self._record(url, start, probe, len(probe.content))
+        return self._download_pieces(url, path, total, validator, progress)
+
+    def _stream(self, url: str, start: float, response: requests.Response, path: str, total: Optional[int], progress) -> int:
+        part_path = path + ".part"
+        buffer = memoryview(bytearray(self.buffer_size))
+        completed = 0
+        try:
+            with response, open(part_path, "wb") as f:
+                while True:
+                    n = response.raw.readinto(buffer)
+                    if not n:
+                        break
+                    f.write(buffer[:n])
+                    completed += n
+                    if progress is not None:
+                        progress(completed, total)
+        finally:
+            self._record(url, start, response, completed)
+        if total is not None and completed != total:
+            raise IOError(f"Connection closed after {completed} of {total} bytes")
+        os.replace(part_path, path)
+        return completed
+
+    def piece_size_for(self, total: int) -> int:
+        """Enough pieces to keep every connection busy, as long as they stay worth a request"""
+        return min(self.piece_size, max(MIN_PIECE_SIZE, -(-total // self.connections)))
+
+    def _download_pieces(self, url: str, path: str, total: int, validator: Optional[str], progress) -> int:
+        part_path = path + ".part"
+        state_path = part_path + ".json"
+        state = self._load_state(state_path, part_path, total, validator)
+        if state is not None:
+            piece_size, done = state
+        else:
+            piece_size = self.piece_size_for(total)
+            done = set()
+            with open(part_path, "wb") as f:
+                preallocate(f.fileno(), total)
+        pieces = [_piece_range(index, piece_size, total) for index in range((total + piece_size - 1) // piece_size)]
+
+        lock = threading.Lock()
+        completed = [sum(end - start + 1 for start, end in (pieces[index] for index in done))]
+        if progress is not None:
+            progress(completed[0], total)
+
+        def advance(n):
+            with lock:
+                completed[0] += n
+                if progress is not None:
+                    progress(completed[0], total)
+
+        def piece_done(index):
+            with lock:
+                done.add(index)
+                # single piece files restart from scratch, writing their state isn't worth it
+                if len(pieces) > 1:
+                    self._save_state(state_path, total, validator, piece_size, done)
+
+        todo = queue.Queue()
+        for index in range(len(pieces)):
+            if index not in done:
+                todo.put(index)
+        stop = threading.Event()
+        errors = []
+
+        def worker():
+            buffer = memoryview(bytearray(self.buffer_size))
+            with open(part_path, "r+b") as f:
+                while not stop.is_set():
+                    try:
+                        index = todo.get_nowait()
+                    except queue.Empty:
+                        return
+                    try:
+                        self._fetch_piece(url, f, index, pieces[index], buffer, advance)
+                        piece_done(index)
+                    except Exception as error:
+                        errors.append(error)
+                        stop.set()
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(min(self.connections, todo.qsize()))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+        os.replace(part_path, path)
+        try:
+            os.remove(state_path)
+        except OSError:
+            pass
+        return total
+
+    def _fetch_piece(self, url: str, f, index: int, piece: tuple, buffer: memoryview, advance):
+        start, end = piece
+        for attempt in range(self.piece_attempts):
+            written = 0
+            response = None
+            requested = time.monotonic()
+            try:
+                response = self._get(url, start, end)
+                with response:
+                    if response.status_code != 206:
+                        response.raise_for_status()
+                        raise IOError(f"Expected a partial response for bytes {start}-{end}, got {response.status_code}")
+                    f.seek(start)
+                    remaining = end - start + 1
+                    while remaining:
+                        n = response.raw.readinto(buffer[: min(len(buffer), remaining)])
+                        if not n:
+                            raise IOError(f"Connection closed with {remaining} bytes of piece {index} left")
+                        f.write(buffer[:n])
+                        written += n
+                        remaining -= n
+                        advance(n)
+                self._record(url, requested, response, written)
+                return
+            except (requests.ConnectionError, requests.Timeout, ProtocolError, IOError) as error:
+                if response is not None:
+                    self._record(url, requested, response, written)
+                # the bytes of the failed attempt are written again
+                advance(-written)
+                # the host is failing every request, fetching the piece again can't help
+                if isinstance(error, (requests.HTTPError, CircuitOpenError)) or attempt == self.piece_attempts - 1:
+                    raise
+                log.debug("Piece %d of %s failed (%s), fetching it again", index, url.split("?")[0], error)
+
+    @staticmethod
+    def _load_state(state_path: str, part_path: str, total: int, validator: Optional[str]):
+        """The piece size and finished pieces of an interrupted download of the same file, None if it can't be resumed"""
+        if not os.path.isfile(part_path) or os.path.getsize(part_path) != total:
+            return None
+        try:
+            with open(state_path, encoding="utf8", mode="r") as f:
+                state = json.loads(f.read())
+        except (OSError, ValueError):
+            return None
+        if state.get("size") != total or state.get("validator") != validator or not state.get("piece_size"):
+            return None
+        return state["piece_size"], set(state.get("done", []))
+
+    @staticmethod
+    def _save_state(state_path: str, total: int, validator: Optional[str], piece_size: int, done: set):
+        with open(state_path, encoding="utf8", mode="w") as f:
+            f.write(json.dumps({"size": total, "validator": validator, "piece_size": piece_size, "done": sorted(done)}))
+
+    def close(self):
+        self.session.close()
+
+
+def _piece_range(index: int, piece_size: int, total: int):
+    start = index * piece_size
+    return start, min(start + piece_size, total) - 1
+
+
+def preallocate(fd: int, size: int):
+    """Reserve ``size`` bytes for a file, so pieces written out of order don't fragment it"""
+    if size <= 0:
+        return
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError:
+            # not supported by every file system
+            pass
+    os.ftruncate(fd, size)
@@ -0,0 +1,102 @@
+import json
+import math
+import threading
+from collections import defaultdict
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class _EndpointStats(object):
+    __slots__ = ("latencies", "statuses", "bytes", "retries", "reused", "cached")
+
+    def __init__(self):
+        self.latencies = []
+        self.statuses = defaultdict(int)
+        self.bytes = 0
+        self.retries = 0
+        self.reused = 0
+        self.cached = 0
+
+
+class HttpMetrics(object):
+    """
+    Per-endpoint request instrumentation: latency, status, bytes received, retries and connection reuse.
+
+    Endpoints are the names returned by ``endpoints.classify`` (``URLS.CURRICULUM_ITEMS``, ``m3u8``, ``cdn``...).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = defaultdict(_EndpointStats)
+
+    def record(self, endpoint: str, latency: float, status: int, bytes_received: int = 0, retries: int = 0, reused: bool = False, cached: bool = False):
+        with self._lock:
+            stats = self._endpoints[endpoint]
+            stats.latencies.append(latency)
+            stats.statuses[str(status)] += 1
+            stats.bytes += bytes_received
+            stats.retries += retries
+            stats.reused += 1 if reused else 0
+            stats.cached += 1 if cached else 0
+
+    def summary(self) -> dict:
+        with self._lock:
+            result = {}
+            for name, stats in sorted(self._endpoints.items()):
+                latencies = sorted(stats.latencies)
+                result[name] = {
+                    "count": len(latencies),
+                    "statuses": dict(stats.statuses),
+                    "bytes": stats.bytes,
+                    "retries": stats.retries,
+                    "connections_reused": stats.reused,
+                    "cache_hits": stats.cached,
+                    "latency_sum": round(sum(latencies), 6),
+                    **{f"p{int(q * 100)}": round(percentile(latencies, q), 6) for q in QUANTILES},
+                }
+            return result
+
+    def to_openmetrics(self, summary: dict = None) -> str:
+        summary = self.summary() if summary is None else summary
+        lines = [
+            "# TYPE udemy_http_request_duration_seconds summary",
+            "# UNIT udemy_http_request_duration_seconds seconds",
+        ]
+        for name, stats in summary.items():
+            for q in QUANTILES:
+                lines.append(f'udemy_http_request_duration_seconds{{endpoint="{name}",quantile="{q}"}} {stats[f"p{int(q * 100)}"]}')
+            lines.append(f'udemy_http_request_duration_seconds_count{{endpoint="{name}"}} {stats["count"]}')
+            lines.append(f'udemy_http_request_duration_seconds_sum{{endpoint="{name}"}} {stats["latency_sum"]}')
+        lines.append("# TYPE udemy_http_responses counter")
+        for name, stats in summary.items():
+            for status, count in sorted(stats["statuses"].items()):
+                lines.append(f'udemy_http_responses_total{{endpoint="{name}",status="{status}"}} {count}')
+        for metric, key in (
+            ("udemy_http_received_bytes", "bytes"),
+            ("udemy_http_retries", "retries"),
+            ("udemy_http_connections_reused", "connections_reused"),
+            ("udemy_http_cache_hits", "cache_hits"),
+        ):
+            lines.append(f"# TYPE {metric} counter")
+            for name, stats in summary.items():
+                lines.append(f'{metric}_total{{endpoint="{name}"}} {stats[key]}')
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str, extra: dict = None):
+        """Write the summary to ``path``, as OpenMetrics text for .prom/.txt files and JSON otherwise"""
+        summary = self.summary()
+        if path.lower().endswith((".prom", ".txt", ".openmetrics")):
+            content = self.to_openmetrics(summary)
+        else:
+            content = json.dumps({"endpoints": summary, **(extra or {})}, indent=2)
+        with open(path, encoding="utf8", mode="w") as f:
+            f.write(content)
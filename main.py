@@ -1,16 +1,24 @@
 # -*- coding: utf-8 -*-
 import argparse
+import asyncio
+import atexit
+import functools
 import json
 import logging
 import math
 import os
+import queue
 import re
 import subprocess
 import sys
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from http.cookiejar import MozillaCookieJar
 from pathlib import Path
-from urllib.parse import urlparse
+from urllib.parse import parse_qsl, quote, urlencode, urlparse, urlunparse
+from urllib.request import url2pathname
 from typing import IO, Union
 import shutil
 
@@ -18,7 +26,6 @@ import browser_cookie3
 import demoji
 import m3u8
 import requests
-import yt_dlp
 from bs4 import BeautifulSoup
 from coloredlogs import ColoredFormatter
 from dotenv import load_dotenv
@@ -27,7 +34,28 @@ from requests.exceptions import ConnectionError as conn_error
 from tqdm import tqdm
 
 from constants import *
-from tls import SSLCiphers
+
+try:
+    from async_session import AsyncSession
+except ImportError:  # aiohttp is optional, only needed for --async-metadata
+    AsyncSession = None
+from aria2_rpc import Aria2Error, Aria2RPC, Aria2RPCError
+from course_index import CourseIndex
+from download_batch import DownloadBatch
+from curriculum import Curriculum
+from endpoints import classify
+from ffmpeg_runner import FFmpegProcess
+from http_cache import ResponseCache
+from hls_download import HlsDownloader, UnsupportedPlaylist, is_fragmented_mp4
+from http_download import HttpDownloader
+from http_metrics import HttpMetrics
+from models import Asset, Lecture, Source, Subtitle, to_json
+from mpd_parser import parse_representations
+from rate_limit import RateLimiter, parse_rate_limit
+from retry_policy import EXPIRED_STATUSES, UNSENT_STATUSES, ExpiredURLError, RetryPolicy, expired_status, request_not_sent
+from stream_cache import CACHED_FIELDS, DEFAULT_MARGIN, StreamCache, lecture_expiry
+from tls import CIPHER_LIST, SSLCiphers
+from transcode import ChunkedEncoder, TranscodePool, default_workers, skip_reason
 from utils import extract_kid
 from vtt_to_srt import convert
 
@@ -35,6 +63,17 @@ DOWNLOAD_DIR = os.path.join(os.getcwd(), "out_dir")
 MAIN_SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
 
 retry = 3
+# how many times a lecture whose links expired is fetched again before giving up on it
+url_refreshes = 2
+retry_policy = RetryPolicy()
+rate_limiter = RateLimiter()
+http_metrics = HttpMetrics()
+http_stats_path = None
+async_metadata = False
+parallel_lectures = 1
+external_links_lock = threading.Lock()
+# asset types that are files to download, the chapter's download batch takes care of them
+DOWNLOADABLE_ASSETS = ("audio", "e-book", "file", "presentation", "ebook", "source_code")
 downloader = None
 logger: logging.Logger = None
 dl_assets = False
@@ -49,6 +88,20 @@ course_name = None
 keep_vtt = False
 skip_hls = False
 concurrent_downloads = 10
+page_workers = 1
+http_cache = False
+http_cache_size = 256
+stream_cache = False
+aria2_rpc = True
+# the aria2c daemon download_aria submits to, None when files are downloaded by an aria2c process each
+aria2 = None
+# False when aria2c isn't installed, files are then downloaded by the built-in http downloader
+aria2_available = True
+http_downloader = None
+hls_downloader = None
+http_downloader_lock = threading.Lock()
+# non-DRM hls lectures are downloaded by the in-process segment engine, yt-dlp only when it can't
+native_hls = True
 save_to_file = None
 load_from_file = None
 course_url = None
@@ -60,6 +113,12 @@ use_h265 = False
 h265_crf = 28
 h265_preset = "medium"
 use_nvenc = False
+# encodes run at once, None derives it from the core count and --h265-preset
+transcode_workers = None
+# lectures are cut at keyframes into this many chunks encoded side by side, 0 encodes them in one piece
+h265_chunks = 0
+# the pool --use-h265 hands downloaded lectures to
+transcoder = None
 browser = None
 cj = None
 use_continuous_lecture_numbers = False
@@ -103,19 +162,22 @@ def deEmojify(inputStr: str):
 
 # from https://stackoverflow.com/a/21978778/9785713
 def log_subprocess_output(prefix: str, pipe: IO[str]):
-    """Stream subprocess output to the logger as DEBUG lines."""
+    """Stream subprocess output to the logger as DEBUG lines, returns the last lines for error checks."""
+    tail = deque(maxlen=50)
     if not pipe:
-        return
+        return tail
     try:
         for line in iter(pipe.readline, ""):
             if not line:
                 break
+            tail.append(line)
             logger.debug("[%s] %s", prefix, line.rstrip())
     finally:
         try:
             pipe.close()
         except Exception:
             pass
+    return tail
 
 
 def parse_chapter_filter(chapter_str: str):
@@ -152,9 +214,25 @@ def _mask(val: str, keep_start: int = 6, keep_end: int = 4) -> str:
         return "(masked)"
 
 
+def write_http_stats():
+    """Write the request statistics collected during this run to --http-stats"""
+    try:
+        http_metrics.write(
+            http_stats_path,
+            extra={
+                "retries": retry_policy.metrics.snapshot(),
+                "rate_limits": rate_limiter.stats(),
+                "transcodes": transcoder.job_stats() if transcoder is not None else [],
+            },
+        )
+        logger.info("> Request statistics written to %s", http_stats_path)
+    except Exception:
+        logger.exception("Failed to write request statistics")
+
+
 # this is the first function that is called, we parse the arguments, setup the logger, and ensure that required directories exist
 def pre_run():
-    global dl_assets, dl_captions, dl_quizzes, skip_lectures, caption_locale, quality, bearer_token, course_name, keep_vtt, skip_hls, concurrent_downloads, load_from_file, save_to_file, bearer_token, course_url, info, logger, keys, id_as_course_name, LOG_LEVEL, use_h265, h265_crf, h265_preset, use_nvenc, browser, is_subscription_course, DOWNLOAD_DIR, use_continuous_lecture_numbers, chapter_filter, cookies_first
+    global dl_assets, dl_captions, dl_quizzes, skip_lectures, caption_locale, quality, bearer_token, course_name, keep_vtt, skip_hls, concurrent_downloads, page_workers, http_cache, http_cache_size, stream_cache, aria2_rpc, native_hls, http_stats_path, async_metadata, parallel_lectures, load_from_file, save_to_file, bearer_token, course_url, info, logger, keys, id_as_course_name, LOG_LEVEL, use_h265, h265_crf, h265_preset, use_nvenc, transcode_workers, h265_chunks, browser, is_subscription_course, DOWNLOAD_DIR, use_continuous_lecture_numbers, chapter_filter, cookies_first
 
     # make sure the logs directory exists and touch the file early for visibility
     try:
@@ -214,6 +292,68 @@ def pre_run():
         type=int,
         help="The number of maximum concurrent downloads for segments (HLS and DASH, must be a number 1-30)",
     )
+    parser.add_argument(
+        "--parallel-lectures",
+        dest="parallel_lectures",
+        type=int,
+        help="The number of lectures to download at the same time, must be a number 1-16 (Default is 1). Each lecture still uses --concurrent-downloads for its segments",
+    )
+    parser.add_argument(
+        "--page-workers",
+        dest="page_workers",
+        type=int,
+        help="The number of API pages (curriculum, course lists) to fetch in parallel, must be a number 1-16 (Default is 1, pages are fetched one after another)",
+    )
+    parser.add_argument(
+        "--http-cache",
+        dest="http_cache",
+        action="store_true",
+        help="If specified, API responses and manifests are cached on disk and revalidated with conditional requests on later runs",
+    )
+    parser.add_argument(
+        "--http-cache-size",
+        dest="http_cache_size",
+        type=int,
+        help="The maximum size of the http cache in MB, least recently used responses are evicted first (Default is 256)",
+    )
+    parser.add_argument(
+        "--stream-cache",
+        dest="stream_cache",
+        action="store_true",
+        help="If specified, the resolved streams, captions and assets of each lecture are cached on disk and reused on later runs until shortly before their signed urls expire",
+    )
+    parser.add_argument(
+        "--no-aria2-rpc",
+        dest="no_aria2_rpc",
+        action="store_true",
+        help="If specified, captions, assets and videos are downloaded by starting an aria2c process per file instead of submitting them to a single aria2c rpc daemon",
+    )
+    parser.add_argument(
+        "--no-native-hls",
+        dest="no_native_hls",
+        action="store_true",
+        help="If specified, non-DRM hls lectures are downloaded with yt-dlp instead of the built-in segment downloader",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        dest="rate_limits",
+        action="append",
+        type=parse_rate_limit,
+        metavar="HOST_PATTERN=RATE[:BURST]",
+        help="Limit requests per second to hosts matching a pattern, e.g. '*.udemy.com=5' or '*.udemycdn.com=50:100'. Can be specified multiple times, the first matching pattern wins",
+    )
+    parser.add_argument(
+        "--http-stats",
+        dest="http_stats_path",
+        type=str,
+        help="Write per-endpoint request statistics (latency percentiles, statuses, bytes, retries, connection reuse) to this file on exit. Files ending in .prom or .txt are written in the OpenMetrics text format, anything else as JSON. With --use-h265 the JSON also lists the fps, realtime speed and queue wait of every encode",
+    )
+    parser.add_argument(
+        "--async-metadata",
+        dest="async_metadata",
+        action="store_true",
+        help="If specified, curriculum pages, quizzes and stream manifests are fetched concurrently with asyncio before downloading (requires aiohttp)",
+    )
     parser.add_argument(
         "--skip-lectures",
         dest="skip_lectures",
@@ -335,6 +475,18 @@ def pre_run():
         action="store_true",
         help="Whether to use the NVIDIA hardware transcoding for H.265. Only works if you have a supported NVIDIA GPU and ffmpeg with nvenc support",
     )
+    parser.add_argument(
+        "--transcode-workers",
+        dest="transcode_workers",
+        type=int,
+        help="The number of lectures to encode with H.265 at the same time while the next ones download (Default is derived from the number of CPU cores and --h265-preset)",
+    )
+    parser.add_argument(
+        "--h265-chunks",
+        dest="h265_chunks",
+        type=int,
+        help="Cut each lecture at keyframes into this many chunks and encode them in parallel, for machines a single encoder doesn't keep busy. With --transcode-workers it sets how many chunks are encoded at once",
+    )
     parser.add_argument(
         "--out",
         "-o",
@@ -383,6 +535,27 @@ def pre_run():
         elif concurrent_downloads > 30:
             # if the user gave a number thats greater than 30, set cc to the max of 30
             concurrent_downloads = 30
+    if args.parallel_lectures:
+        parallel_lectures = min(max(args.parallel_lectures, 1), 16)
+    if args.page_workers:
+        page_workers = min(max(args.page_workers, 1), 16)
+    if args.http_cache:
+        http_cache = True
+    if args.stream_cache:
+        stream_cache = True
+    if args.no_aria2_rpc:
+        aria2_rpc = False
+    if args.no_native_hls:
+        native_hls = False
+    if args.http_stats_path:
+        http_stats_path = os.path.abspath(args.http_stats_path)
+    if args.async_metadata:
+        async_metadata = True
+    if args.rate_limits:
+        for pattern, rate, burst in args.rate_limits:
+            rate_limiter.add_rule(pattern, rate, burst)
+    if args.http_cache_size and args.http_cache_size > 0:
+        http_cache_size = args.http_cache_size
     if args.load_from_file:
         load_from_file = args.load_from_file
     if args.save_to_file:
@@ -401,6 +574,16 @@ def pre_run():
         h265_preset = args.h265_preset
     if args.use_nvenc:
         use_nvenc = True
+    if args.transcode_workers:
+        if args.transcode_workers < 1:
+            logger.fatal("> --transcode-workers must be at least 1")
+            sys.exit(1)
+        transcode_workers = args.transcode_workers
+    if args.h265_chunks:
+        if args.h265_chunks < 2:
+            logger.fatal("> --h265-chunks must be at least 2")
+            sys.exit(1)
+        h265_chunks = args.h265_chunks
     if args.log_level:
         if args.log_level.upper() == "DEBUG":
             LOG_LEVEL = logging.DEBUG
@@ -480,6 +663,11 @@ def pre_run():
             pass
 
     logger.info(f"Output directory set to {DOWNLOAD_DIR}")
+    if http_stats_path:
+        atexit.register(write_http_stats)
+    if async_metadata and AsyncSession is None:
+        logger.warning("> --async-metadata requires aiohttp (pip install aiohttp), falling back to blocking requests")
+        async_metadata = False
 
     # Log helper tool resolution to aid troubleshooting
     for tool in ("yt-dlp", "aria2c", "ffmpeg", "shaka-packager"):
@@ -521,11 +709,36 @@ def pre_run():
         logger.info("Chapter filter applied: %s", sorted(chapter_filter))
 
 
+# the fields of a parsed lecture Udemy.refresh_lecture replaces, streams are resolved again from the new manifest urls
+REFRESHED_FIELDS = (
+    "asset_id",
+    "is_encrypted",
+    "assets",
+    "assets_count",
+    "subtitles",
+    "subtitle_count",
+    "sources",
+    "video_sources",
+    "sources_count",
+    "stream_sources",
+    "media_sources",
+)
+
+
 class Udemy:
     def __init__(self, bearer_token):
         global cj
 
         self.session = None
+        self.async_session = None
+        # quiz and manifest results resolved ahead of time by prefetch_metadata, keyed by url
+        self._prefetched = {}
+        # resolved lectures kept across runs, opened by open_stream_cache once the course is known
+        self.stream_cache = None
+        self.course_id = None
+        # lecture id -> when its links were last fetched again by refresh_lecture
+        self._refreshed = {}
+        self._refresh_lock = threading.Lock()
         self.bearer_token = bearer_token
         self.auth = UdemyAuth(cache_session=False)
         self.session = self.auth._session
@@ -603,6 +816,8 @@ class Udemy:
         #     }
         # )
         url = URLS.QUIZ.format(portal_name=portal_name, quiz_id=quiz_id)
+        if url in self._prefetched:
+            return self._prefetched.pop(url)
         try:
             resp = self.session._get(url).json()
         except conn_error as error:
@@ -735,50 +950,50 @@ class Udemy:
                     extension = filename.rsplit(".", 1)[-1] if "." in filename else ""
                     download_url = download_urls.get("File", [])[0].get("file")
                     _temp.append(
-                        {
-                            "type": "file",
-                            "title": title,
-                            "filename": "{0:03d} ".format(lecture_counter) + filename,
-                            "extension": extension,
-                            "download_url": download_url,
-                            "id": id,
-                        }
+                        Asset(
+                            type="file",
+                            title=title,
+                            filename="{0:03d} ".format(lecture_counter) + filename,
+                            extension=extension,
+                            download_url=download_url,
+                            id=id,
+                        )
                     )
             elif asset_type == "sourcecode":
                 if download_urls and isinstance(download_urls, dict):
                     extension = filename.rsplit(".", 1)[-1] if "." in filename else ""
                     download_url = download_urls.get("SourceCode", [])[0].get("file")
                     _temp.append(
-                        {
-                            "type": "source_code",
-                            "title": title,
-                            "filename": "{0:03d} ".format(lecture_counter) + filename,
-                            "extension": extension,
-                            "download_url": download_url,
-                            "id": id,
-                        }
+                        Asset(
+                            type="source_code",
+                            title=title,
+                            filename="{0:03d} ".format(lecture_counter) + filename,
+                            extension=extension,
+                            download_url=download_url,
+                            id=id,
+                        )
                     )
             elif asset_type == "externallink":
                 _temp.append(
-                    {
-                        "type": "external_link",
-                        "title": title,
-                        "filename": "{0:03d} ".format(lecture_counter) + filename,
-                        "extension": "txt",
-                        "download_url": external_url,
-                        "id": id,
-                    }
+                    Asset(
+                        type="external_link",
+                        title=title,
+                        filename="{0:03d} ".format(lecture_counter) + filename,
+                        extension="txt",
+                        download_url=external_url,
+                        id=id,
+                    )
                 )
         return _temp
 
     def _extract_article(self, asset, id):
         return [
-            {
-                "type": "article",
-                "body": asset.get("body"),
-                "extension": "html",
-                "id": id,
-            }
+            Asset(
+                type="article",
+                body=asset.get("body"),
+                extension="html",
+                id=id,
+            )
         ]
 
     def _extract_ppt(self, asset, lecture_counter):
@@ -790,13 +1005,13 @@ class Udemy:
             extension = filename.rsplit(".", 1)[-1] if "." in filename else ""
             download_url = download_urls.get("Presentation", [])[0].get("file")
             _temp.append(
-                {
-                    "type": "presentation",
-                    "filename": "{0:03d} ".format(lecture_counter) + filename,
-                    "extension": extension,
-                    "download_url": download_url,
-                    "id": id,
-                }
+                Asset(
+                    type="presentation",
+                    filename="{0:03d} ".format(lecture_counter) + filename,
+                    extension=extension,
+                    download_url=download_url,
+                    id=id,
+                )
             )
         return _temp
 
@@ -809,13 +1024,13 @@ class Udemy:
             extension = filename.rsplit(".", 1)[-1] if "." in filename else ""
             download_url = download_urls.get("File", [])[0].get("file")
             _temp.append(
-                {
-                    "type": "file",
-                    "filename": "{0:03d} ".format(lecture_counter) + filename,
-                    "extension": extension,
-                    "download_url": download_url,
-                    "id": id,
-                }
+                Asset(
+                    type="file",
+                    filename="{0:03d} ".format(lecture_counter) + filename,
+                    extension=extension,
+                    download_url=download_url,
+                    id=id,
+                )
             )
         return _temp
 
@@ -828,13 +1043,13 @@ class Udemy:
             extension = filename.rsplit(".", 1)[-1] if "." in filename else ""
             download_url = download_urls.get("E-Book", [])[0].get("file")
             _temp.append(
-                {
-                    "type": "ebook",
-                    "filename": "{0:03d} ".format(lecture_counter) + filename,
-                    "extension": extension,
-                    "download_url": download_url,
-                    "id": id,
-                }
+                Asset(
+                    type="ebook",
+                    filename="{0:03d} ".format(lecture_counter) + filename,
+                    extension=extension,
+                    download_url=download_url,
+                    id=id,
+                )
             )
         return _temp
 
@@ -847,13 +1062,13 @@ class Udemy:
             extension = filename.rsplit(".", 1)[-1] if "." in filename else ""
             download_url = download_urls.get("Audio", [])[0].get("file")
             _temp.append(
-                {
-                    "type": "audio",
-                    "filename": "{0:03d} ".format(lecture_counter) + filename,
-                    "extension": extension,
-                    "download_url": download_url,
-                    "id": id,
-                }
+                Asset(
+                    type="audio",
+                    filename="{0:03d} ".format(lecture_counter) + filename,
+                    extension=extension,
+                    download_url=download_url,
+                    id=id,
+                )
             )
         return _temp
 
@@ -892,13 +1107,13 @@ class Udemy:
                 else:
                     _type = source.get("type")
                     _temp.append(
-                        {
-                            "type": "video",
-                            "height": height,
-                            "width": width,
-                            "extension": _type.replace("video/", ""),
-                            "download_url": download_url,
-                        }
+                        Source(
+                            type="video",
+                            height=height,
+                            width=width,
+                            extension=_type.replace("video/", ""),
+                            download_url=download_url,
+                        )
                     )
         return _temp
 
@@ -934,19 +1149,18 @@ class Udemy:
                 )
                 ext = "vtt" if "vtt" in download_url.rsplit(".", 1)[-1] else "srt"
                 _temp.append(
-                    {
-                        "type": "subtitle",
-                        "language": lang,
-                        "extension": ext,
-                        "download_url": download_url,
-                    }
+                    Subtitle(
+                        type="subtitle",
+                        language=lang,
+                        extension=ext,
+                        download_url=download_url,
+                    )
                 )
         return _temp
 
-    def _extract_m3u8(self, url):
-        """extracts m3u8 streams"""
+    def _manifest_temp(self, url):
+        """Return the temp folder manifests are written to and the asset id of a manifest url"""
         asset_id_re = re.compile(r"assets/(?P<id>\d+)/")
-        _temp = []
 
         # get temp folder
         temp_path = Path(Path.cwd(), "temp")
@@ -960,131 +1174,158 @@ class Udemy:
 
         # # extract the asset id from the url
         asset_id = asset_id_re.search(url).group("id")
+        return temp_path, asset_id
+
+    def _hls_variants(self, url, raw_data):
+        """
+        Write the master playlist to the temp folder and list its variants as sources, one per height.
 
+        Variant playlists aren't fetched here, each source keeps its ``playlist_url`` until
+        ``_fetch_hls_variant`` writes it to ``download_url``.
+        """
+        temp_path, asset_id = self._manifest_temp(url)
         m3u8_path = Path(temp_path, f"index_{asset_id}.m3u8")
 
-        try:
-            logger.debug("> m3u8: fetching master playlist %s", url)
-            r = self.session._get(url)
-            r.raise_for_status()
-            raw_data = r.text
+        # write to temp file for later
+        with open(m3u8_path, "w") as f:
+            f.write(raw_data)
 
-            # write to temp file for later
-            with open(m3u8_path, "w") as f:
-                f.write(r.text)
+        m3u8_object = m3u8.loads(raw_data)
+        playlists = m3u8_object.playlists
+        variants = {}
+        for pl in playlists:
+            resolution = pl.stream_info.resolution
+            codecs = pl.stream_info.codecs
 
-            m3u8_object = m3u8.loads(raw_data)
-            playlists = m3u8_object.playlists
-            seen = set()
-            for pl in playlists:
-                resolution = pl.stream_info.resolution
-                codecs = pl.stream_info.codecs
+            if not resolution:
+                continue
+            if not codecs:
+                continue
+            width, height = resolution
+            bandwidth = pl.stream_info.average_bandwidth or pl.stream_info.bandwidth or 0
 
-                if not resolution:
-                    continue
-                if not codecs:
-                    continue
-                width, height = resolution
+            # keep the highest bandwidth variant of each height
+            if height in variants and variants[height].bandwidth >= bandwidth:
+                continue
 
-                if height in seen:
-                    continue
+            playlist_path = Path(temp_path, f"index_{asset_id}_{width}x{height}.m3u8")
+            variants[height] = Source(
+                type="hls",
+                height=height,
+                width=width,
+                bandwidth=bandwidth,
+                extension="mp4",
+                download_url=playlist_path.as_uri(),
+                playlist_path=str(playlist_path),
+                playlist_url=pl.uri,
+            )
+        return list(variants.values())
 
-                # we need to save the individual playlists to disk also
-                playlist_path = Path(temp_path, f"index_{asset_id}_{width}x{height}.m3u8")
+    def _fetch_hls_variant(self, source):
+        """Fetch the variant playlist of an hls source if it wasn't yet, returns False if that fails"""
+        uri = source.get("playlist_url")
+        if not uri:
+            return True
+        try:
+            logger.debug("> m3u8: fetching variant playlist %s", uri)
+            r = self.session._get(uri)
+            if r.status_code in EXPIRED_STATUSES:
+                raise ExpiredURLError(uri, r.status_code)
+            r.raise_for_status()
+            with open(source.get("playlist_path"), "w") as f:
+                f.write(r.text)
+        except ExpiredURLError:
+            raise
+        except Exception as error:
+            logger.error(f"m3u8 error: '{error}' while fetching variant playlist {source.get('height')}p")
+            return False
+        source.playlist_url = None
+        return True
 
-                with open(playlist_path, "w") as f:
-                    logger.debug("> m3u8: fetching variant playlist %s", pl.uri)
-                    r = self.session._get(pl.uri)
-                    r.raise_for_status()
-                    f.write(r.text)
+    def _extract_m3u8(self, url):
+        """extracts m3u8 streams, only the variant playlist that will most likely be downloaded is fetched"""
+        if url in self._prefetched:
+            return self._prefetched.pop(url)
+        _temp = []
 
-                seen.add(height)
-                _temp.append(
-                    {
-                        "type": "hls",
-                        "height": height,
-                        "width": width,
-                        "extension": "mp4",
-                        "download_url": playlist_path.as_uri(),
-                    }
-                )
+        try:
+            logger.debug("> m3u8: fetching master playlist %s", url)
+            r = self.session._get(url)
+            if r.status_code in EXPIRED_STATUSES:
+                raise ExpiredURLError(url, r.status_code)
+            r.raise_for_status()
+
+            _temp = self._hls_variants(url, r.text)
+            if _temp:
+                self._fetch_hls_variant(select_source(_temp))
+        except ExpiredURLError:
+            raise
         except Exception as error:
             logger.exception(f"m3u8 error: '{error}' while fetching hls streams")
         return _temp
 
     def _extract_mpd(self, url):
         """extracts mpd streams"""
-        asset_id_re = re.compile(r"assets/(?P<id>\d+)/")
-        _temp = {}
-
-        # get temp folder
-        temp_path = Path(Path.cwd(), "temp")
-        try:
-            logger.debug("> temp dir selected: %s", temp_path)
-        except Exception:
-            pass
-
-        # ensure the folder exists
-        temp_path.mkdir(parents=True, exist_ok=True)
-
-        # # extract the asset id from the url
-        asset_id = asset_id_re.search(url).group("id")
-
-        # download the mpd and save it to the temp file
-        mpd_path = Path(temp_path, f"index_{asset_id}.mpd")
+        if url in self._prefetched:
+            return self._prefetched.pop(url)
 
         try:
+            temp_path, asset_id = self._manifest_temp(url)
+            # download the mpd and save it to the temp file
+            mpd_path = Path(temp_path, f"index_{asset_id}.mpd")
+            logger.debug("> mpd: fetching manifest %s", url)
+            r = self.session._get(url)
+            if r.status_code in EXPIRED_STATUSES:
+                raise ExpiredURLError(url, r.status_code)
+            r.raise_for_status()
             with open(mpd_path, "wb") as f:
-                logger.debug("> mpd: fetching manifest %s", url)
-                r = self.session._get(url)
-                r.raise_for_status()
                 f.write(r.content)
+        except ExpiredURLError:
+            raise
+        except Exception:
+            logger.exception(f"Error fetching MPD streams")
+            return {}
+        return self._parse_mpd(mpd_path)
 
-            ytdl = yt_dlp.YoutubeDL(
-                {
-                    "quiet": True,
-                    "no_warnings": True,
-                    "allow_unplayable_formats": True,
-                    "enable_file_urls": True,
-                }
-            )
-            results = ytdl.extract_info(mpd_path.as_uri(), download=False, force_generic_extractor=True)
-            formats = results.get("formats", [])
-            best_audio = next(f for f in formats if (f["acodec"] != "none" and f["vcodec"] == "none"))
-            # filter formats to remove any audio only formats
-            formats = [f for f in formats if f["vcodec"] != "none" and f["acodec"] == "none"]
-            if not best_audio:
+    def _parse_mpd(self, mpd_path):
+        """lists the video representations of a downloaded mpd, paired with its best audio"""
+        _temp = {}
+        try:
+            representations = parse_representations(mpd_path)
+            audio = [r for r in representations if r.kind == "audio"]
+            if not audio:
                 raise ValueError("No suitable audio format found in MPD")
-            audio_format_id = best_audio.get("format_id")
+            audio_format_id = max(audio, key=lambda r: r.tbr).format_id
+            videos = [r for r in representations if r.kind == "video"]
 
-            for format in formats:
-                video_format_id = format.get("format_id")
-                extension = format.get("ext")
-                height = format.get("height")
-                width = format.get("width")
-                tbr = format.get("tbr", 0)
+            for video in videos:
+                video_format_id = video.format_id
+                extension = video.ext
+                height = video.height
+                width = video.width
+                tbr = video.tbr
 
                 # add to dict based on height
                 if height not in _temp:
                     _temp[height] = []
 
                 _temp[height].append(
-                    {
-                        "type": "dash",
-                        "height": str(height),
-                        "width": str(width),
-                        "format_id": f"{video_format_id},{audio_format_id}",
-                        "extension": extension,
-                        "download_url": mpd_path.as_uri(),
-                        "tbr": round(tbr),
-                    }
+                    Source(
+                        type="dash",
+                        height=str(height),
+                        width=str(width),
+                        format_id=f"{video_format_id},{audio_format_id}",
+                        extension=extension,
+                        download_url=mpd_path.as_uri(),
+                        tbr=round(tbr),
+                    )
                 )
             # for each resolution, use only the highest bitrate
             _temp2 = []
             for height, formats in _temp.items():
                 if formats:
                     # sort by tbr and take the first one
-                    formats.sort(key=lambda x: x["tbr"], reverse=True)
+                    formats.sort(key=lambda x: x.tbr, reverse=True)
                     _temp2.append(formats[0])
                 else:
                     del _temp[height]
@@ -1096,6 +1337,165 @@ class Udemy:
         # We don't delete the mpd file yet because we can use it to download later
         return _temp
 
+    def run_async(self, fn, *args):
+        """Run a coroutine method on a fresh event loop with ``self.async_session`` open for its duration"""
+
+        async def runner():
+            async with AsyncSession(self.session, rate_limiter, http_metrics) as client:
+                self.async_session = client
+                try:
+                    return await fn(*args)
+                finally:
+                    self.async_session = None
+
+        return asyncio.run(runner())
+
+    async def _get_quiz_async(self, quiz_id):
+        url = URLS.QUIZ.format(portal_name=portal_name, quiz_id=quiz_id)
+        resp = await self.async_session._get(url)
+        return resp.json().get("results")
+
+    async def _fetch_hls_variant_async(self, source):
+        uri = source.get("playlist_url")
+        if not uri:
+            return True
+        try:
+            r = await self.async_session._get(uri)
+            if r.status_code in EXPIRED_STATUSES:
+                raise ExpiredURLError(uri, r.status_code)
+            r.raise_for_status()
+            with open(source.get("playlist_path"), "w") as f:
+                f.write(r.text)
+        except ExpiredURLError:
+            raise
+        except Exception as error:
+            logger.error(f"m3u8 error: '{error}' while fetching variant playlist {source.get('height')}p")
+            return False
+        source.playlist_url = None
+        return True
+
+    async def _extract_m3u8_async(self, url):
+        """extracts m3u8 streams, errors are raised so the url isn't prefetched and the blocking path fetches it again"""
+        r = await self.async_session._get(url)
+        if r.status_code in EXPIRED_STATUSES:
+            raise ExpiredURLError(url, r.status_code)
+        r.raise_for_status()
+        _temp = self._hls_variants(url, r.text)
+        if _temp:
+            await self._fetch_hls_variant_async(select_source(_temp))
+        return _temp
+
+    async def _extract_mpd_async(self, url):
+        """extracts mpd streams, errors are raised so the url isn't prefetched and the blocking path fetches it again"""
+        temp_path, asset_id = self._manifest_temp(url)
+        mpd_path = Path(temp_path, f"index_{asset_id}.mpd")
+        r = await self.async_session._get(url)
+        if r.status_code in EXPIRED_STATUSES:
+            raise ExpiredURLError(url, r.status_code)
+        r.raise_for_status()
+        with open(mpd_path, "wb") as f:
+            f.write(r.content)
+        # parsing is CPU bound, keep it off the event loop
+        return await asyncio.to_thread(self._parse_mpd, mpd_path)
+
+    async def _fetch_page_async(self, url):
+        """Fetch a single page, retrying just that page on failure"""
+        for attempt in range(1, retry + 1):
+            try:
+                resp = await self.async_session._get(url)
+                if resp.ok:
+                    return resp.json()
+                logger.error(f"Failed to fetch page {url} (attempt {attempt}/{retry}), retrying...")
+            except Exception as error:
+                logger.error(f"Error fetching page {url}: {error} (attempt {attempt}/{retry})")
+            await asyncio.sleep(0.8)
+        return None
+
+    async def _handle_pagination_async(self, initial_url, initial_params=None):
+        """asyncio version of _handle_pagination, every page after the first is requested at once"""
+        data = None
+        try:
+            data = (await self.async_session._get(initial_url, initial_params)).json()
+        except Exception as error:
+            logger.fatal(f"Connection error: {error}")
+            sys.exit(1)
+
+        _next = data.get("next")
+        _count = data.get("count")
+        page_size = len(data.get("results") or []) or 100
+        est_page_count = math.ceil(_count / page_size) if _count else 1
+        if not _next:
+            return data
+
+        urls = [self._page_url(_next, n) for n in range(2, est_page_count + 1)]
+        pages = await asyncio.gather(*[self._fetch_page_async(u) for u in urls])
+        for n, resp in enumerate(pages, start=2):
+            if resp is None:
+                logger.fatal(f"Failed to fetch page {n}/{est_page_count}, giving up")
+                sys.exit(1)
+            results = resp.get("results")
+            if results and isinstance(results, list):
+                data["results"].extend(results)
+        logger.info(f"> Downloaded {est_page_count} data pages")
+        return data
+
+    async def _prefetch_metadata_async(self, udemy_object):
+        """Resolve quizzes and stream manifests of the whole course concurrently"""
+        tasks = {}
+        course_name = str(udemy_object.get("course_id")) if id_as_course_name else udemy_object.get("course_title")
+        for chapter in udemy_object.get("chapters"):
+            if chapter_filter is not None and int(chapter.get("chapter_index")) not in chapter_filter:
+                continue
+            chapter_dir = os.path.join(DOWNLOAD_DIR, course_name, chapter.get("chapter_title"))
+            for lecture in chapter.get("lectures"):
+                data = lecture.get("data") or {}
+                if lecture.get("_class") == "quiz":
+                    if dl_quizzes:
+                        url = URLS.QUIZ.format(portal_name=portal_name, quiz_id=lecture.get("id"))
+                        tasks[url] = self._get_quiz_async(lecture.get("id"))
+                    continue
+                if not info:
+                    # the same checks parse_new does before resolving a lecture's streams
+                    if skip_lectures:
+                        continue
+                    lecture_file_name = deEmojify(sanitize_filename(lecture.get("lecture_title") + ".mp4"))
+                    if os.path.isfile(os.path.join(chapter_dir, lecture_file_name)):
+                        continue
+                asset = data.get("asset")
+                if not isinstance(asset, dict):
+                    continue
+                if self.stream_cache is not None and asset.get("id") in self.stream_cache:
+                    continue
+                stream_urls = asset.get("stream_urls")
+                if stream_urls and isinstance(stream_urls, dict):
+                    for source in stream_urls.get("Video") or []:
+                        src = source.get("file")
+                        if src and not skip_hls and (source.get("type") == "application/x-mpegURL" or "m3u8" in src):
+                            tasks[src] = self._extract_m3u8_async(src)
+                elif stream_urls is None:
+                    for source in asset.get("media_sources") or []:
+                        if source.get("type") == "application/dash+xml" and source.get("src"):
+                            tasks[source.get("src")] = self._extract_mpd_async(source.get("src"))
+
+        logger.info(f"> Resolving {len(tasks)} quizzes and manifests concurrently...")
+        results = await asyncio.gather(*tasks.values(), return_exceptions=True)
+        for url, result in zip(tasks.keys(), results):
+            if isinstance(result, ExpiredURLError):
+                # the blocking path gets the same status and refreshes the lecture's links
+                logger.info(f"> Link of {url} expired while prefetching, it is refreshed when the lecture is downloaded")
+                continue
+            if isinstance(result, Exception):
+                # leave it out, the blocking path will fetch it again
+                logger.warning(f"Failed to prefetch {url}: {result}")
+                continue
+            if not result:
+                # nothing usable came back (e.g. the mpd didn't parse), let the blocking path try again
+                continue
+            self._prefetched[url] = result
+
+    def prefetch_metadata(self, udemy_object):
+        self.run_async(self._prefetch_metadata_async, udemy_object)
+
     def extract_course_name(self, url):
         """
         @author r0oth3x49
@@ -1115,6 +1515,9 @@ class Udemy:
     def _handle_pagination(self, initial_url, initial_params=None):
         """Helper function to handle paginated requests and return all results
 
+        When ``page_workers`` is greater than 1, the remaining page URLs are derived from the
+        ``count`` of the first page and fetched in parallel, otherwise ``next`` links are followed one by one.
+
         Args:
             initial_url (str): The initial URL to fetch from
             initial_params (dict, optional): Query parameters for the initial request. Defaults to None.
@@ -1122,6 +1525,16 @@ class Udemy:
         Returns:
             dict: Combined results from all pages
         """
+        pages = self._iter_pages(initial_url, initial_params)
+        data = next(pages)
+        for resp in pages:
+            results = resp.get("results")
+            if results and isinstance(results, list):
+                data["results"].extend(results)
+        return data
+
+    def _iter_pages(self, initial_url, initial_params=None):
+        """Generator behind _handle_pagination, yields each decoded page as soon as it has been fetched, in page order"""
         page = 1
         try:
             data = self.session._get(initial_url, initial_params).json()
@@ -1129,31 +1542,61 @@ class Udemy:
             logger.fatal(f"Connection error: {error}")
             time.sleep(0.8)
             sys.exit(1)
-        else:
-            _next = data.get("next")
-            _count = data.get("count")
-            est_page_count = math.ceil(_count / 100)  # 100 is the max results per page
+        yield data
+
+        _next = data.get("next")
+        _count = data.get("count")
+        # a page that has a next link is full, so its length is the page size the server actually used
+        page_size = len(data.get("results") or []) or 100
+        est_page_count = math.ceil(_count / page_size) if _count else 1
+
+        if _next and page_workers > 1 and est_page_count > 1:
+            urls = [self._page_url(_next, n) for n in range(2, est_page_count + 1)]
+            with ThreadPoolExecutor(max_workers=min(page_workers, len(urls))) as executor:
+                # map() yields in submission order, so pages come out in page order
+                for n, resp in enumerate(executor.map(self._fetch_page, urls), start=2):
+                    if resp is None:
+                        logger.fatal(f"Failed to fetch page {n}/{est_page_count}, giving up")
+                        sys.exit(1)
+                    logger.info(f"> Downloaded data page {n}/{est_page_count}")
+                    yield resp
+            return
 
-            while _next:
-                logger.info(f"> Downloading data page {page + 1}/{est_page_count}")
-                try:
-                    resp = self.session._get(_next)
-                    if not resp.ok:
-                        logger.error(f"Failed to fetch page {page + 1}, retrying...")
-                        continue
-                    resp = resp.json()
-                except conn_error as error:
-                    logger.fatal(f"Connection error: {error}")
-                    time.sleep(0.8)
-                    sys.exit(1)
-                else:
-                    _next = resp.get("next")
-                    results = resp.get("results")
-                    if results and isinstance(results, list):
-                        for item in resp["results"]:
-                            data["results"].append(item)
-                        page = page + 1
-            return data
+        while _next:
+            logger.info(f"> Downloading data page {page + 1}/{est_page_count}")
+            resp = self._fetch_page(_next)
+            if resp is None:
+                logger.fatal(f"Failed to fetch page {page + 1}, giving up")
+                sys.exit(1)
+            _next = resp.get("next")
+            page = page + 1
+            yield resp
+
+    def _page_url(self, next_url, page):
+        """Rewrite the ``page`` query parameter of a ``next`` link"""
+        parts = urlparse(next_url)
+        query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != "page"]
+        query.append(("page", str(page)))
+        return urlunparse(parts._replace(query=urlencode(query)))
+
+    def _fetch_page(self, url):
+        """Fetch a single page, retrying just that page on failure
+
+        Returns:
+            dict: The decoded page, or None if every attempt failed
+        """
+        for attempt in range(1, retry + 1):
+            try:
+                resp = self.session._get(url)
+                if resp is not None and resp.ok:
+                    return resp.json()
+                logger.error(f"Failed to fetch page {url} (attempt {attempt}/{retry}), retrying...")
+            except conn_error as error:
+                logger.error(f"Connection error: {error} (attempt {attempt}/{retry})")
+            except ValueError:
+                logger.error(f"Invalid JSON in page {url} (attempt {attempt}/{retry})")
+            time.sleep(0.8)
+        return None
 
     def _get_subscribed_courses(self, portal_name):
         """
@@ -1172,15 +1615,46 @@ class Udemy:
         return res["results"] if res and isinstance(res, dict) else []
 
     def _get_courses(self, portal_name):
-        a = self._get_subscribed_courses(portal_name)
-        b = self._get_subscription_course_enrollments(portal_name)
-        return a + b
+        # the two enrollment lists are independent, so fetch them at the same time
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            a = executor.submit(self._get_subscribed_courses, portal_name)
+            b = executor.submit(self._get_subscription_course_enrollments, portal_name)
+            return a.result() + b.result()
+
+    def _search_courses(self, portal_name, course_name):
+        """
+        Searches the subscribed courses for a slug, this is a single small request instead of the full enrollment list.
+        """
+        url = URLS.COURSE_SEARCH.format(portal_name=portal_name, course_name=quote(course_name.replace("-", " ")))
+        try:
+            resp = self.session._get(url)
+            if resp is None or not resp.ok:
+                return []
+            return resp.json().get("results", [])
+        except (conn_error, ValueError) as error:
+            logger.warning(f"Course search failed: {error}")
+            return []
+
+    def _lookup_course_id(self, course_id):
+        """
+        Fetches a course by id for a numeric slug, returns an empty dict so the slug lookups run if it can't be read.
+        """
+        url = URLS.COURSE.format(portal_name=portal_name, course_id=course_id)
+        try:
+            resp = self.session._get(url, COURSE_URL_PARAMS)
+            if resp is None or not resp.ok:
+                return {}
+            course = resp.json()
+        except (conn_error, ValueError) as error:
+            logger.warning(f"Course lookup by id failed: {error}")
+            return {}
+        return course if isinstance(course, dict) and course.get("id") else {}
 
     def _extract_course_info_json(self, url, course_id):
         # self.session._headers.update({"Referer": url})
         url = URLS.COURSE.format(portal_name=portal_name, course_id=course_id)
         try:
-            resp = self.session._get(url).json()
+            resp = self.session._get(url, COURSE_URL_PARAMS).json()
         except conn_error as error:
             logger.fatal(f"Connection error: {error}")
             time.sleep(0.8)
@@ -1191,8 +1665,18 @@ class Udemy:
     def _extract_course_curriculum(self, url, course_id, portal_name):
         # self.session._headers.update({"Referer": url})
         url = URLS.CURRICULUM_ITEMS.format(portal_name=portal_name, course_id=course_id)
+        if async_metadata:
+            return self.run_async(self._handle_pagination_async, url, CURRICULUM_ITEMS_PARAMS)
         return self._handle_pagination(url, CURRICULUM_ITEMS_PARAMS)
 
+    def _iter_course_curriculum(self, course_id, portal_name):
+        """Yield the curriculum items of a course while its pages are still being fetched"""
+        url = URLS.CURRICULUM_ITEMS.format(portal_name=portal_name, course_id=course_id)
+        for page in self._iter_pages(url, CURRICULUM_ITEMS_PARAMS):
+            results = page.get("results")
+            if results and isinstance(results, list):
+                yield from results
+
     def _extract_course(self, response, course_name):
         _temp = {}
         if response:
@@ -1259,15 +1743,32 @@ class Udemy:
     def _extract_course_info(self, url):
         global portal_name
         portal_name, course_name = self.extract_course_name(url)
-        course = {"portal_name": portal_name}
+        index = CourseIndex(COURSE_INDEX_PATH, COURSE_INDEX_TTL)
+
+        course = index.get(portal_name, course_name)
+        if course:
+            logger.info("> Course found in the local course index")
+            return course.get("id"), course
+
+        # a numeric slug is already the course id
+        if course_name.isdigit():
+            course = self._lookup_course_id(course_name)
+
+        if not course:
+            # targeted lookup before falling back to listing every enrollment
+            results = self._search_courses(portal_name=portal_name, course_name=course_name)
+            course = self._extract_course(response=results, course_name=course_name)
 
-        # get all the courses
-        results = self._get_courses(portal_name=portal_name)
-        # find the course that matches the url slug
-        course = self._extract_course(response=results, course_name=course_name)
+        if not course:
+            # get all the courses
+            results = self._get_courses(portal_name=portal_name)
+            index.put_many(portal_name, results)
+            # find the course that matches the url slug
+            course = self._extract_course(response=results, course_name=course_name)
         if not course:
             # try archived courses
             results = self._archived_courses(portal_name=portal_name)
+            index.put_many(portal_name, results)
             course = self._extract_course(response=results, course_name=course_name)
 
         # if not course or is_subscription_course:
@@ -1275,14 +1776,17 @@ class Udemy:
         #     course = self._extract_course_info_json(url, course_id)
 
         if course:
+            index.put(portal_name, course_name, course)
+            index.save()
             return course.get("id"), course
         if not course:
+            index.save()
             logger.fatal("Failed to find the course, are you enrolled?")
             # self.session.terminate()
 
             sys.exit(1)
 
-    def _parse_lecture(self, lecture: dict):
+    def _parse_lecture(self, lecture: Lecture) -> Lecture:
         retVal = []
 
         index = lecture.get("index")  # this is lecture_counter
@@ -1310,105 +1814,170 @@ class Udemy:
             if isinstance(supp_assets, list) and len(supp_assets) > 0:
                 retVal.extend(self._extract_supplementary_assets(supp_assets, index))
 
+        # a new record, the curriculum lecture keeps its raw data
+        lecture = Lecture(
+            index=lecture.get("index"),
+            lecture_index=lecture.get("lecture_index"),
+            lecture_title=lecture.get("lecture_title"),
+            _class=lecture.get("_class"),
+            id=lecture.get("id"),
+            assets=retVal,
+            assets_count=len(retVal),
+        )
         if asset != None:
+            lecture.asset_id = asset.get("id")
+            lecture.type = asset.get("asset_type")
+            lecture.is_encrypted = False
             stream_urls = asset.get("stream_urls")
             if stream_urls != None:
                 # not encrypted
                 if stream_urls and isinstance(stream_urls, dict):
-                    sources = stream_urls.get("Video")
                     tracks = asset.get("captions")
                     # duration = asset.get("time_estimation")
-                    sources = self._extract_sources(sources, skip_hls)
-                    subtitles = self._extract_subtitles(tracks)
-                    sources_count = len(sources)
-                    subtitle_count = len(subtitles)
-                    lecture.pop("data")  # remove the raw data object after processing
-                    lecture = {
-                        **lecture,
-                        "assets": retVal,
-                        "assets_count": len(retVal),
-                        "sources": sources,
-                        "subtitles": subtitles,
-                        "subtitle_count": subtitle_count,
-                        "sources_count": sources_count,
-                        "is_encrypted": False,
-                        "asset_id": asset.get("id"),
-                        "type": asset.get("asset_type"),
-                    }
+                    lecture.subtitles = self._extract_subtitles(tracks)
+                    lecture.subtitle_count = len(lecture.subtitles)
+                    # resolved by _resolve_lecture_streams when the lecture is downloaded
+                    lecture.stream_sources = stream_urls.get("Video")
                 else:
-                    lecture.pop("data")  # remove the raw data object after processing
-                    lecture = {
-                        **lecture,
-                        "html_content": asset.get("body"),
-                        "extension": "html",
-                        "assets": retVal,
-                        "assets_count": len(retVal),
-                        "subtitle_count": 0,
-                        "sources_count": 0,
-                        "is_encrypted": False,
-                        "asset_id": asset.get("id"),
-                        "type": asset.get("asset_type"),
-                    }
+                    lecture.html_content = asset.get("body")
+                    lecture.extension = "html"
+                    lecture.subtitle_count = 0
+                    lecture.sources_count = 0
             else:
                 # encrypted
                 media_sources = asset.get("media_sources")
                 if media_sources and isinstance(media_sources, list):
-                    sources = self._extract_media_sources(media_sources)
                     tracks = asset.get("captions")
                     # duration = asset.get("time_estimation")
-                    subtitles = self._extract_subtitles(tracks)
-                    sources_count = len(sources)
-                    subtitle_count = len(subtitles)
-                    lecture.pop("data")  # remove the raw data object after processing
-                    lecture = {
-                        **lecture,
-                        # "duration": duration,
-                        "assets": retVal,
-                        "assets_count": len(retVal),
-                        "video_sources": sources,
-                        "subtitles": subtitles,
-                        "subtitle_count": subtitle_count,
-                        "sources_count": sources_count,
-                        "is_encrypted": True,
-                        "asset_id": asset.get("id"),
-                        "type": asset.get("asset_type"),
-                    }
-
+                    lecture.subtitles = self._extract_subtitles(tracks)
+                    lecture.subtitle_count = len(lecture.subtitles)
+                    lecture.is_encrypted = True
+                    # resolved by _resolve_lecture_streams when the lecture is downloaded
+                    lecture.media_sources = media_sources
                 else:
-                    lecture.pop("data")  # remove the raw data object after processing
-                    lecture = {
-                        **lecture,
-                        "html_content": asset.get("body"),
-                        "extension": "html",
-                        "assets": retVal,
-                        "assets_count": len(retVal),
-                        "subtitle_count": 0,
-                        "sources_count": 0,
-                        "is_encrypted": False,
-                        "asset_id": asset.get("id"),
-                        "type": asset.get("asset_type"),
-                    }
+                    lecture.html_content = asset.get("body")
+                    lecture.extension = "html"
+                    lecture.subtitle_count = 0
+                    lecture.sources_count = 0
         else:
-            lecture = {
-                **lecture,
-                "assets": retVal,
-                "assets_count": len(retVal),
-                "asset_id": lecture_data.get("id"),
-                "type": lecture_data.get("type"),
-            }
+            lecture.asset_id = lecture_data.get("id")
+            lecture.type = lecture_data.get("type")
 
         return lecture
 
+    def open_stream_cache(self, course_id):
+        self.stream_cache = StreamCache(os.path.join(STREAM_CACHE_DIR, f"{course_id}.json"))
+        # entries are written in batches, the last ones when the run ends
+        atexit.register(self.stream_cache.flush)
+
+    def _load_cached_streams(self, lecture: Lecture) -> bool:
+        """
+        Fill in the streams, captions and assets of a lecture returned by ``_parse_lecture`` from the stream cache.
+
+        Returns False if the lecture is already resolved or has no usable cache entry.
+        """
+        if self.stream_cache is None or (lecture.stream_sources is None and lecture.media_sources is None):
+            return False
+        cached = self.stream_cache.get(lecture.asset_id)
+        if cached is None:
+            return False
+        for name in CACHED_FIELDS:
+            setattr(lecture, name, getattr(cached, name))
+        lecture.sources_count = len(lecture.sources or lecture.video_sources or [])
+        lecture.subtitle_count = len(lecture.subtitles or [])
+        lecture.assets_count = len(lecture.assets or [])
+        lecture.stream_sources = None
+        lecture.media_sources = None
+        logger.debug("> Streams of asset %s loaded from the stream cache", lecture.asset_id)
+        return True
+
+    def _resolve_lecture_streams(self, lecture: Lecture):
+        """
+        Fetch the manifests of a lecture returned by ``_parse_lecture`` and fill in its sources.
+
+        ``_parse_lecture`` only does the structural work, so lectures that are skipped or already
+        downloaded never request their m3u8/MPD. Resolving an already resolved lecture is a no-op.
+        With ``--stream-cache`` a cached lecture isn't fetched at all, and fetched ones are added to the cache.
+        """
+        if self._load_cached_streams(lecture):
+            return lecture
+        if lecture.stream_sources is not None:
+            manifest_urls = [source.get("file") for source in lecture.stream_sources if source.get("file")]
+            lecture.sources = self._extract_sources(lecture.stream_sources, skip_hls)
+            lecture.sources_count = len(lecture.sources)
+            lecture.stream_sources = None
+        elif lecture.media_sources is not None:
+            manifest_urls = [source.get("src") for source in lecture.media_sources if source.get("src")]
+            lecture.video_sources = self._extract_media_sources(lecture.media_sources)
+            lecture.sources_count = len(lecture.video_sources)
+            lecture.media_sources = None
+        else:
+            return lecture
+        # failed resolutions aren't cached, the next run tries again
+        if self.stream_cache is not None and lecture.sources_count:
+            self.stream_cache.put(lecture.asset_id, lecture, manifest_urls)
+        return lecture
+
+    def _fetch_lecture(self, lecture_id):
+        url = URLS.LECTURE.format(portal_name=portal_name, course_id=self.course_id, lecture_id=lecture_id)
+        r = self.session._get(url, LECTURE_PARAMS)
+        r.raise_for_status()
+        return r.json()
+
+    def refresh_lecture(self, lecture: Lecture, since: float) -> bool:
+        """
+        Fetch a lecture returned by ``_parse_lecture`` again and replace its links with freshly signed ones.
+
+        The record is updated in place, so the other jobs of the lecture pick up the new links too, and its
+        streams are resolved again on next use. A lecture that was already refreshed after ``since`` (the
+        moment the caller started using its links) isn't fetched again. Returns False if it can't be fetched.
+        """
+        with self._refresh_lock:
+            if self._refreshed.get(lecture.id, 0) > since:
+                return True
+            logger.info(f"      > Fetching fresh links for lecture '{lecture.lecture_title}'")
+            try:
+                data = self._fetch_lecture(lecture.id)
+            except Exception as error:
+                logger.error(f"      > Failed to fetch fresh links for lecture '{lecture.lecture_title}': {error}")
+                return False
+            if self.stream_cache is not None:
+                self.stream_cache.evict(lecture.asset_id)
+            fresh = self._parse_lecture(
+                Lecture(
+                    index=lecture.index,
+                    lecture_index=lecture.lecture_index,
+                    lecture_title=lecture.lecture_title,
+                    _class=lecture._class,
+                    id=lecture.id,
+                    data=data,
+                )
+            )
+            for name in REFRESHED_FIELDS:
+                setattr(lecture, name, getattr(fresh, name))
+            self._refreshed[lecture.id] = time.time()
+            return True
+
+    def refresh_expiring(self, lecture: Lecture):
+        """Refresh the links of a lecture ahead of time if one of them expires within ``DEFAULT_MARGIN``"""
+        checked = time.time()
+        expires = lecture_expiry(lecture)
+        if expires is not None and expires - checked < DEFAULT_MARGIN:
+            logger.debug("> Links of lecture %s expire in %ds", lecture.id, expires - checked)
+            # links that were just fetched and still expire this soon won't get any better
+            self.refresh_lecture(lecture, checked - DEFAULT_MARGIN)
+
 
 class Session(object):
     def __init__(self):
+        self.cache = ResponseCache(HTTP_CACHE_DIR, http_cache_size * 1024 * 1024) if http_cache else None
+        self.retry_policy = retry_policy
+        self._debugged_hosts = set()
         self._session = requests.sessions.Session()
         self._session.headers.update(HEADERS)
         self._session.mount(
             "https://",
-            SSLCiphers(
-                cipher_list="ECDHE-RSA-AES256-GCM-SHA384:ECDHE-ECDSA-AES256-GCM-SHA384:ECDHE-RSA-AES256-SHA384:ECDHE-ECDSA-AES256-SHA384:ECDHE-RSA-AES128-GCM-SHA256:ECDHE-RSA-AES128-SHA256:AES256-SH"
-            ),
+            SSLCiphers(cipher_list=CIPHER_LIST),
         )
 
     def visit(self, portal_name: str) -> bool:
@@ -1433,60 +2002,96 @@ class Session(object):
     #     self._headers["X-Udemy-Authorization"] = "Bearer {}".format(bearer_token)
 
     def _get(self, url, params=None):
-        host = None
+        start = time.monotonic()
+        cached = self.cache.lookup(url, params) if self.cache else None
+        headers = None
+        if cached is not None:
+            if not cached.has_validators:
+                resp = self.cache.to_response(cached)
+                if resp is not None:
+                    self._record(url, start, resp, cached=True)
+                    return resp
+            else:
+                headers = self.cache.conditional_headers(cached)
+
+        req = self.retry_policy.request(lambda: self._send("GET", url, params=params, headers=headers), url)
+        if req.status_code == 304 and cached is not None:
+            resp = self.cache.revalidate(cached, req)
+            if resp is not None:
+                self._record(url, start, req, cached=True)
+                return resp
+            # the cached body is gone, ask again without validators
+            req = self.retry_policy.request(lambda: self._send("GET", url, params=params), url)
+        self._record(url, start, req)
+        if req.ok:
+            if self.cache:
+                self.cache.store(url, params, req)
+        else:
+            logger.error(f"Failed request {url}: {req.status_code} {req.reason}")
+            self._log_request_debug(req)
+        return req
+
+    def _record(self, url, start, resp, cached=False):
+        http_metrics.record(
+            classify(url),
+            time.monotonic() - start,
+            resp.status_code,
+            len(resp.content or b"") if not cached else 0,
+            getattr(resp, "retries", 0),
+            getattr(resp, "connection_reused", False),
+            cached,
+        )
+
+    def _send(self, method, url, **kwargs):
+        """Send a single request once the rate limiter allows it"""
+        rate_limiter.acquire(url)
+        kwargs.setdefault("timeout", 20)
+        return self._session.request(method, url, **kwargs)
+
+    def _log_request_debug(self, req):
+        """Log auth/cookie diagnostics for a failed request, once per host"""
+        host = self.retry_policy.host_of(req.url or "")
+        if host in self._debugged_hosts:
+            return
+        self._debugged_hosts.add(host)
         try:
-            host = urlparse(url).hostname
+            # Brief diagnostics for auth/cookies
+            h = self._session.headers or {}
+            auth = h.get("authorization") or h.get("Authorization")
+            csrf = h.get("X-CSRFToken")
+            ua = h.get("User-Agent")
+            # Count cookies for the request host
+            _cookies_list = list(self._session.cookies)
+            host_cookies = [c for c in _cookies_list if (host and c.domain and (c.domain == host or host.endswith(c.domain.lstrip('.'))))]
+            logger.debug(
+                "> Request debug: host=%s ua=%s auth_present=%s csrf_present=%s host_cookie_count=%d host_cookie_names=%s",
+                host,
+                ua,
+                bool(auth),
+                bool(csrf),
+                len(host_cookies),
+                ", ".join(sorted({c.name for c in host_cookies}))
+            )
+            if auth:
+                logger.debug("> Authorization: %s", _mask(auth))
+            if csrf:
+                logger.debug("> X-CSRFToken: %s", _mask(csrf))
+            body = req.text.strip()
+            if body:
+                logger.debug("> Response body: %s", body[:1000])
         except Exception:
-            host = None
-        for i in range(10):
-            try:
-                req = self._session.get(url, params=params, timeout=20)
-            except Exception as e:
-                logger.error("Request exception %s on %s (attempt %d)", e.__class__.__name__, url, i)
-                time.sleep(0.8)
-                continue
-            if req.ok or req.status_code in [502, 503]:
-                return req
-            if not req.ok:
-                logger.error("Failed request " + url)
-                logger.error(f"{req.status_code} {req.reason}, retrying (attempt {i} )...")
-                try:
-                    # Brief diagnostics for auth/cookies
-                    h = self._session.headers or {}
-                    auth = h.get("authorization") or h.get("Authorization")
-                    csrf = h.get("X-CSRFToken")
-                    ua = h.get("User-Agent")
-                    # Count cookies for the request host
-                    _cookies_list = list(self._session.cookies)
-                    host_cookies = [c for c in _cookies_list if (host and c.domain and (c.domain == host or host.endswith(c.domain.lstrip('.'))))]
-                    logger.debug(
-                        "> Request debug: host=%s ua=%s auth_present=%s csrf_present=%s host_cookie_count=%d host_cookie_names=%s",
-                        host,
-                        ua,
-                        bool(auth),
-                        bool(csrf),
-                        len(host_cookies),
-                        ", ".join(sorted({c.name for c in host_cookies}))
-                    )
-                    if auth:
-                        logger.debug("> Authorization: %s", _mask(auth))
-                        logger.debug("> Authorization (full): %s", auth)
-                    if csrf:
-                        logger.debug("> X-CSRFToken: %s", _mask(csrf))
-                        logger.debug("> X-CSRFToken (full): %s", csrf)
-                    try:
-                        logger.debug("> Sent headers: %s", dict(req.request.headers))
-                    except Exception:
-                        pass
-                    body = req.text.strip()
-                    if body:
-                        logger.debug("> Response body: %s", body[:1000])
-                except Exception:
-                    pass
-                time.sleep(0.8)
+            pass
 
     def _post(self, url, data, redirect=True):
-        req = self._session.post(url, data, allow_redirects=redirect)
+        start = time.monotonic()
+        # a POST is only sent again when the server can't have acted on it
+        req = self.retry_policy.request(
+            lambda: self._send("POST", url, data=data, allow_redirects=redirect),
+            url,
+            statuses=UNSENT_STATUSES,
+            retry_error=request_not_sent,
+        )
+        self._record(url, start, req)
         if req.ok:
             return req
         if not req.ok:
@@ -1546,35 +2151,37 @@ def mux_process(
     audio_key: Union[str | None] = None,
     video_key: Union[str | None] = None,
 ):
-    codec = "hevc_nvenc" if use_nvenc else "libx265"
-    transcode = "-hwaccel cuda -hwaccel_output_format cuda" if use_nvenc else ""
-    audio_decryption_arg = f"-decryption_key {audio_key}" if audio_key is not None else ""
-    video_decryption_arg = f"-decryption_key {video_key}" if video_key is not None else ""
+    video_decryption_args = ["-decryption_key", video_key] if video_key is not None else []
+    audio_decryption_args = ["-decryption_key", audio_key] if audio_key is not None else []
 
-    if os.name == "nt":
-        if use_h265:
-            command = f'ffmpeg {transcode} -y {video_decryption_arg} -i "{video_filepath}" {audio_decryption_arg} -i "{audio_filepath}" -c:v {codec} -vtag hvc1 -crf {h265_crf} -preset {h265_preset} -c:a copy -fflags +bitexact -shortest -map_metadata -1 -metadata title="{video_title}" -metadata comment="Downloaded with Udemy-Downloader by Puyodead1 (https://github.com/Puyodead1/udemy-downloader)" "{output_path}"'
-        else:
-            command = f'ffmpeg -y {video_decryption_arg} -i "{video_filepath}" {audio_decryption_arg} -i "{audio_filepath}" -c copy -fflags +bitexact -shortest -map_metadata -1 -metadata title="{video_title}" -metadata comment="Downloaded with Udemy-Downloader by Puyodead1 (https://github.com/Puyodead1/udemy-downloader)" "{output_path}"'
-    else:
-        if use_h265:
-            command = f'nice -n 7 ffmpeg {transcode} -y {video_decryption_arg} -i "{video_filepath}" {audio_decryption_arg} -i "{audio_filepath}" -c:v {codec} -vtag hvc1 -crf {h265_crf} -preset {h265_preset} -c:a copy -fflags +bitexact -shortest -map_metadata -1 -metadata title="{video_title}" -metadata comment="Downloaded with Udemy-Downloader by Puyodead1 (https://github.com/Puyodead1/udemy-downloader)" "{output_path}"'
-        else:
-            command = f'nice -n 7 ffmpeg -y {video_decryption_arg} -i "{video_filepath}" {audio_decryption_arg} -i "{audio_filepath}" -c copy -fflags +bitexact -shortest -map_metadata -1 -metadata title="{video_title}" -metadata comment="Downloaded with Udemy-Downloader by Puyodead1 (https://github.com/Puyodead1/udemy-downloader)" "{output_path}"'
-
-    process = subprocess.Popen(
-        command,
-        shell=True,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        text=True,
-        bufsize=1,
-        encoding="utf-8",
-    )
-    log_subprocess_output("FFMPEG", process.stdout)
+    # --use-h265 encodes the muxed file afterwards in the transcode pool, muxing only copies the streams
+    args = [
+        *(["nice", "-n", "7"] if os.name != "nt" else []),
+        "ffmpeg",
+        "-y",
+        *video_decryption_args,
+        "-i",
+        video_filepath,
+        *audio_decryption_args,
+        "-i",
+        audio_filepath,
+        "-c",
+        "copy",
+        "-fflags",
+        "+bitexact",
+        "-shortest",
+        "-map_metadata",
+        "-1",
+        "-metadata",
+        f"title={video_title}",
+        "-metadata",
+        "comment=Downloaded with Udemy-Downloader by Puyodead1 (https://github.com/Puyodead1/udemy-downloader)",
+        output_path,
+    ]
+    process = FFmpegProcess(args)
     ret_code = process.wait()
     if ret_code != 0:
-        raise Exception("Muxing returned a non-zero exit code")
+        raise Exception(f"Muxing returned exit code {ret_code}: {process.tail[-1] if process.tail else ''}")
 
     return ret_code
 
@@ -1597,10 +2204,11 @@ def handle_segments(url, format_id, lecture_id, video_title, output_path, chapte
         if t.is_alive():
             return None, True  # (kid, timed_out)
         return result["kid"], False
-    os.chdir(os.path.join(chapter_dir))
 
-    video_filepath_enc = lecture_id + ".encrypted.mp4"
-    audio_filepath_enc = lecture_id + ".encrypted.m4a"
+    # absolute paths instead of chdir'ing into the chapter, the working directory is shared by every lecture thread
+    video_filepath_enc = os.path.join(chapter_dir, lecture_id + ".encrypted.mp4")
+    audio_filepath_enc = os.path.join(chapter_dir, lecture_id + ".encrypted.m4a")
+    output_template = os.path.join(chapter_dir, f"{lecture_id}.encrypted.%(ext)s")
     temp_output_path = os.path.join(chapter_dir, lecture_id + ".mp4")
 
     logger.info("> Downloading Lecture Tracks...")
@@ -1611,15 +2219,12 @@ def handle_segments(url, format_id, lecture_id, video_title, output_path, chapte
         "--allow-unplayable-formats",
         "--concurrent-fragments",
         f"{concurrent_downloads}",
-        "--downloader",
-        "aria2c",
-        "--downloader-args",
-        'aria2c:"--disable-ipv6"',
+        *ytdlp_downloader_args(),
         "--fixup",
         "never",
         "-k",
         "-o",
-        f"{lecture_id}.encrypted.%(ext)s",
+        output_template,
         "-f",
         format_id,
         f"{url}",
@@ -1632,11 +2237,14 @@ def handle_segments(url, format_id, lecture_id, video_title, output_path, chapte
         bufsize=1,
         encoding="utf-8",
     )
-    log_subprocess_output("YTDLP", process.stdout)
+    output = log_subprocess_output("YTDLP", process.stdout)
     ret_code = process.wait()
     logger.info("> Lecture Tracks Downloaded")
 
     if ret_code != 0:
+        status = expired_status(output)
+        if status:
+            raise ExpiredURLError(url, status)
         logger.warning("Return code from the downloader was non-0 (error), skipping!")
         return
 
@@ -1676,17 +2284,14 @@ def handle_segments(url, format_id, lecture_id, video_title, output_path, chapte
                 "--allow-unplayable-formats",
                 "--concurrent-fragments",
                 f"{concurrent_downloads}",
-                "--downloader",
-                "aria2c",
-                "--downloader-args",
-                'aria2c:"--disable-ipv6"',
+                *ytdlp_downloader_args(),
                 "--fixup",
                 "never",
                 "-k",
                 "--no-continue",
                 "--force-overwrites",
                 "-o",
-                f"{lecture_id}.encrypted.%(ext)s",
+                output_template,
                 "-f",
                 format_id,
                 f"{url}",
@@ -1768,10 +2373,11 @@ def handle_segments(url, format_id, lecture_id, video_title, output_path, chapte
         logger.info("> Cleaning up temporary files...")
         os.remove(video_filepath_enc)
         os.remove(audio_filepath_enc)
+        if use_h265:
+            transcoder.submit(output_path, video_title)
     except Exception as e:
         logger.exception(f"Muxing error: {e}")
     finally:
-        os.chdir(HOME_DIR)
         # if the url is a file url, we need to remove the file after we're done with it
         if url.startswith("file://"):
             try:
@@ -1780,6 +2386,67 @@ def handle_segments(url, format_id, lecture_id, video_title, output_path, chapte
                 pass
 
 
+def h265_video_args():
+    codec = "hevc_nvenc" if use_nvenc else "libx265"
+    return ["-c:v", codec, "-vtag", "hvc1", "-crf", str(h265_crf), "-preset", h265_preset]
+
+
+def h265_ffmpeg():
+    """ffmpeg and its hwaccel options, niced outside of windows"""
+    nice = ["nice", "-n", "7"] if os.name != "nt" else []
+    hwaccel = ["-hwaccel", "cuda", "-hwaccel_output_format", "cuda"] if use_nvenc else []
+    return [*nice, "ffmpeg", *hwaccel]
+
+
+def h265_command(input_path, output_path):
+    """The ffmpeg command the transcode pool encodes a downloaded lecture with"""
+    return [
+        *h265_ffmpeg(),
+        "-y",
+        "-i",
+        input_path,
+        "-map",
+        "0",
+        *h265_video_args(),
+        "-c:a",
+        "copy",
+        "-f",
+        "mp4",
+        output_path,
+    ]
+
+
+def h265_chunk_command(input_path, output_path):
+    """The ffmpeg command encoding the video of one chunk of a lecture, its audio is joined back afterwards"""
+    return [*h265_ffmpeg(), "-y", "-i", input_path, "-map", "0:v:0", *h265_video_args(), "-an", "-f", "mp4", output_path]
+
+
+def start_transcoder():
+    workers = transcode_workers or default_workers(h265_preset, use_nvenc)
+    if h265_chunks:
+        # one lecture at a time, its chunks keep the cores busy
+        logger.info(f"> Encoding H.265 in {h265_chunks} chunks per lecture, {workers} at a time, while lectures download")
+        return TranscodePool(h265_command, 1, queue_size=2, chunker=ChunkedEncoder(h265_chunk_command, h265_chunks, workers), skip=skip_reason)
+    logger.info(f"> Encoding H.265 with {workers} worker(s) while lectures download")
+    return TranscodePool(h265_command, workers, skip=skip_reason)
+
+
+def stop_transcoder():
+    """Wait for the queued encodes and report how the pool kept up"""
+    logger.info(f"> Waiting for {transcoder.depth} queued encode(s) to finish...")
+    transcoder.close()
+    stats = transcoder.stats()
+    logger.info(
+        "> Transcoding: %d lectures encoded, %d left as they were, %d failed, %.2fx realtime at %.1f fps, %.1fs spent waiting in the queue",
+        stats["encoded"],
+        stats["skipped"],
+        stats["failed"],
+        stats["speed"],
+        stats["fps"],
+        stats["queue_wait_seconds"],
+    )
+
+
 def check_for_aria():
     try:
         subprocess.Popen(["aria2c", "-v"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).wait()
@@ -1855,34 +2522,106 @@ def check_for_shaka():
         return True
 
 
+def ytdlp_downloader_args():
+    """yt-dlp hands fragments to aria2c when it is installed, otherwise it downloads them itself"""
+    if not aria2_available:
+        return []
+    return ["--downloader", "aria2c", "--downloader-args", 'aria2c:"--disable-ipv6"']
+
+
+def record_download_request(url, elapsed, status, size, retries, reused):
+    http_metrics.record(classify(url), elapsed, status, size, retries, reused)
+
+
+def get_http_downloader() -> HttpDownloader:
+    global http_downloader
+    with http_downloader_lock:
+        if http_downloader is None:
+            # download() runs under retry_policy.run, which retries the whole (resumed) file, so the
+            # downloader itself doesn't retry
+            http_downloader = HttpDownloader(
+                connections=concurrent_downloads,
+                before_request=rate_limiter.acquire,
+                record=record_download_request,
+                piece_attempts=1,
+            )
+        return http_downloader
+
+
 def download(url, path, filename):
     """
-    @author Puyodead1
+    Download a file with the built-in http downloader, resuming a previous attempt at it
     """
-    file_size = int(requests.head(url).headers["Content-Length"])
-    if os.path.exists(path):
-        first_byte = os.path.getsize(path)
-    else:
-        first_byte = 0
-    if first_byte >= file_size:
-        return file_size
-    header = {"Range": "bytes=%s-%s" % (first_byte, file_size)}
-    pbar = tqdm(total=file_size, initial=first_byte, unit="B", unit_scale=True, desc=filename)
-    res = requests.get(url, headers=header, stream=True)
-    res.raise_for_status()
-    with open(path, encoding="utf8", mode="ab") as f:
-        for chunk in res.iter_content(chunk_size=1024):
-            if chunk:
-                f.write(chunk)
-                pbar.update(1024)
-    pbar.close()
-    return file_size
+    pbar = None
+
+    def progress(completed, total):
+        nonlocal pbar
+        if pbar is None:
+            pbar = tqdm(total=total, initial=completed, unit="B", unit_scale=True, desc=filename)
+        else:
+            pbar.update(completed - pbar.n)
+
+    # every request is recorded in http_metrics by the downloader
+    try:
+        return get_http_downloader().download(url, path, progress)
+    except requests.HTTPError as error:
+        status = error.response.status_code
+        if status in EXPIRED_STATUSES:
+            raise ExpiredURLError(url, status)
+        raise
+    finally:
+        if pbar is not None:
+            pbar.close()
+
+
+def start_aria2_rpc():
+    """Start the aria2c daemon files are downloaded with, returns None if it can't be started"""
+    daemon = Aria2RPC()
+    if not daemon.start():
+        logger.warning("> Couldn't start the aria2c rpc daemon, starting aria2c for every file instead")
+        return None
+    atexit.register(daemon.shutdown)
+    logger.debug("> aria2c rpc daemon listening on port %d", daemon.port)
+    return daemon
+
+
+def download_aria_rpc(daemon: Aria2RPC, url, file_dir, filename):
+    last_logged = [0.0]
+
+    def progress(completed, total, speed):
+        now = time.monotonic()
+        if total and now - last_logged[0] >= 5:
+            last_logged[0] = now
+            logger.debug("[ARIA2] %s: %d/%d bytes (%d B/s)", filename, completed, total, speed)
+
+    try:
+        daemon.download(url, file_dir, filename, progress)
+    except Aria2Error as error:
+        status = expired_status([error.message])
+        if status:
+            raise ExpiredURLError(url, status)
+        raise Exception(f"The downloader failed with an error: {error}")
+    return 0
 
 
 def download_aria(url, file_dir, filename):
     """
     @author Puyodead1
     """
+    global aria2
+    daemon = aria2
+    if daemon is not None:
+        try:
+            return download_aria_rpc(daemon, url, file_dir, filename)
+        except Aria2RPCError as error:
+            logger.warning(f"> aria2c rpc daemon failed ({error}), starting aria2c for every file instead")
+            aria2 = None
+            # the daemon may still be writing the file, it must be gone before aria2c writes it again
+            daemon.shutdown()
+    if not aria2_available:
+        download(url, os.path.join(file_dir, filename), filename)
+        return 0
+
     args = [
         "aria2c",
         url,
@@ -1907,23 +2646,44 @@ def download_aria(url, file_dir, filename):
         bufsize=1,
         encoding="utf-8",
     )
-    log_subprocess_output("ARIA2", process.stdout)
+    output = log_subprocess_output("ARIA2", process.stdout)
     ret_code = process.wait()
     if ret_code != 0:
+        status = expired_status(output)
+        if status:
+            raise ExpiredURLError(url, status)
         raise Exception("Return code from the downloader was non-0 (error)")
     return ret_code
 
 
-def process_caption(caption, lecture_title, lecture_dir, tries=0):
-    filename = f"%s_%s.%s" % (
+def caption_filename(caption, lecture_title):
+    return f"%s_%s.%s" % (
         sanitize_filename(lecture_title),
         caption.get("language"),
         caption.get("extension"),
     )
+
+
+def convert_caption(caption, lecture_title, lecture_dir):
+    """Convert a downloaded vtt caption to srt"""
+    if caption.get("extension") != "vtt":
+        return
     filename_no_ext = f"%s_%s" % (
         sanitize_filename(lecture_title),
         caption.get("language"),
     )
+    try:
+        logger.info("    > Converting caption to SRT format...")
+        convert(lecture_dir, filename_no_ext)
+        logger.info("    > Caption conversion complete.")
+        if not keep_vtt:
+            os.remove(os.path.join(lecture_dir, caption_filename(caption, lecture_title)))
+    except Exception:
+        logger.exception(f"    > Error converting caption")
+
+
+def process_caption(caption, lecture_title, lecture_dir):
+    filename = caption_filename(caption, lecture_title)
     filepath = os.path.join(lecture_dir, filename)
 
     if os.path.isfile(filepath):
@@ -1931,27 +2691,174 @@ def process_caption(caption, lecture_title, lecture_dir, tries=0):
     else:
         logger.info(f"    >  Downloading caption: '%s'" % filename)
         try:
-            ret_code = download_aria(caption.get("download_url"), lecture_dir, filename)
+            ret_code = retry_policy.run(
+                lambda: download_aria(caption.get("download_url"), lecture_dir, filename),
+                caption.get("download_url"),
+                attempts=retry + 1,
+            )
             logger.debug(f"      > Download return code: {ret_code}")
+        except ExpiredURLError:
+            raise
         except Exception as e:
-            if tries >= 3:
-                logger.error(f"    > Error downloading caption: {e}. Exceeded retries, skipping.")
-                return
-            else:
-                logger.error(f"    > Error downloading caption: {e}. Will retry {3-tries} more times.")
-                process_caption(caption, lecture_title, lecture_dir, tries + 1)
-        if caption.get("extension") == "vtt":
-            try:
-                logger.info("    > Converting caption to SRT format...")
-                convert(lecture_dir, filename_no_ext)
-                logger.info("    > Caption conversion complete.")
-                if not keep_vtt:
-                    os.remove(filepath)
-            except Exception:
-                logger.exception(f"    > Error converting caption")
+            logger.error(f"    > Error downloading caption: {e}. Exceeded retries, skipping.")
+            return
+        convert_caption(caption, lecture_title, lecture_dir)
+
+
+def select_source(sources):
+    """Pick the source closest to the requested quality, or the best one. Higher bandwidth wins between equal heights."""
+    sources = sorted(sources, key=lambda x: (int(x.get("height")), x.get("bandwidth") or 0), reverse=True)
+    if isinstance(quality, int):
+        return min(sources, key=lambda x: abs(int(x.get("height")) - quality))
+    return sources[0]  # first index is the best quality
+
+
+def get_hls_downloader() -> HlsDownloader:
+    global hls_downloader
+    session = get_http_downloader().session
+    with http_downloader_lock:
+        if hls_downloader is None:
+            # segments share the connection pool of the http downloader
+            hls_downloader = HlsDownloader(
+                concurrency=concurrent_downloads,
+                session=session,
+                before_request=rate_limiter.acquire,
+                retry=retry_policy.request,
+                record=record_download_request,
+            )
+        return hls_downloader
+
+
+def load_playlist(url):
+    if url.startswith("file://"):
+        return m3u8.load(url2pathname(urlparse(url).path))
+    # rate limited, retried and recorded like the segments
+    r = get_hls_downloader().get(url)
+    if r.status_code in EXPIRED_STATUSES:
+        raise ExpiredURLError(url, r.status_code)
+    r.raise_for_status()
+    return m3u8.loads(r.text, uri=url)
 
 
-def process_lecture(lecture, lecture_path, chapter_dir):
+def download_hls_native(url, lecture_path, lecture_title):
+    """
+    Download a non-DRM hls variant with the in-process segment engine.
+
+    fmp4 segments are written to the mp4 file as they are, mpeg-ts segments are piped through ffmpeg
+    which remuxes them into mp4 while they arrive. Raises UnsupportedPlaylist for playlists left to yt-dlp.
+    """
+    playlist = load_playlist(url)
+    part_path = lecture_path + ".part"
+    pbar = None
+
+    def progress(done, total, written):
+        nonlocal pbar
+        if pbar is None:
+            pbar = tqdm(total=total, unit="seg", desc=lecture_title)
+        pbar.update(done - pbar.n)
+
+    try:
+        if is_fragmented_mp4(playlist):
+            with open(part_path, "wb") as f:
+                get_hls_downloader().download(playlist, f, progress)
+        else:
+            remux_segments(playlist, part_path, progress)
+        os.replace(part_path, lecture_path)
+    except requests.HTTPError as error:
+        status = error.response.status_code
+        if status in EXPIRED_STATUSES:
+            raise ExpiredURLError(error.response.url, status)
+        raise
+    finally:
+        if pbar is not None:
+            pbar.close()
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+
+def remux_segments(playlist, output_path, progress):
+    args = [
+        "ffmpeg",
+        "-y",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-f",
+        "mpegts",
+        "-i",
+        "pipe:0",
+        "-map",
+        "0:v?",
+        "-map",
+        "0:a?",
+        "-c",
+        "copy",
+        "-bsf:a",
+        "aac_adtstoasc",
+        "-f",
+        "mp4",
+        output_path,
+    ]
+    process = FFmpegProcess(args, duration=sum(segment.duration or 0 for segment in playlist.segments) or None, stdin=True)
+    try:
+        get_hls_downloader().download(playlist, process.stdin, progress)
+    except BrokenPipeError:
+        # ffmpeg exited early, its exit code tells why
+        pass
+    except BaseException:
+        process.kill()
+        raise
+    finally:
+        ret_code = process.wait()
+    if ret_code != 0:
+        raise Exception(f"Remuxing the segments returned exit code {ret_code}: {' '.join(process.tail)}")
+
+
+def download_hls_ytdlp(url, lecture_path):
+    temp_filepath = lecture_path.replace(".mp4", ".%(ext)s")
+    cmd = [
+        "yt-dlp",
+        "--enable-file-urls",
+        "--force-generic-extractor",
+        "--concurrent-fragments",
+        f"{concurrent_downloads}",
+        *ytdlp_downloader_args(),
+        "-o",
+        f"{temp_filepath}",
+        f"{url}",
+    ]
+    process = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        bufsize=1,
+        encoding="utf-8",
+    )
+    output = log_subprocess_output("YTDLP", process.stdout)
+    ret_code = process.wait()
+    status = expired_status(output) if ret_code != 0 else None
+    if status:
+        raise ExpiredURLError(url, status)
+    return ret_code
+
+
+def download_hls(url, lecture_path, lecture_title):
+    """Download a non-DRM hls variant natively, falling back to yt-dlp for what the native engine can't do"""
+    if native_hls:
+        try:
+            download_hls_native(url, lecture_path, lecture_title)
+            return 0
+        except ExpiredURLError:
+            raise
+        except UnsupportedPlaylist as error:
+            logger.info(f"      > Playlist {error}, downloading it with yt-dlp")
+        except Exception as error:
+            logger.warning(f"      > Native hls download failed ({error}), retrying it with yt-dlp")
+    return download_hls_ytdlp(url, lecture_path)
+
+
+def process_lecture(udemy: Udemy, lecture, lecture_path, chapter_dir):
     lecture_id = lecture.get("id")
     lecture_title = lecture.get("lecture_title")
     is_encrypted = lecture.get("is_encrypted")
@@ -1977,14 +2884,18 @@ def process_lecture(lecture, lecture_path, chapter_dir):
             logger.info(f"      > Lecture '{lecture_title}' is missing media links")
             logger.debug(f"Lecture source count: {len(lecture_sources)}")
     else:
-        sources = lecture.get("sources")
-        sources = sorted(sources, key=lambda x: int(x.get("height")), reverse=True)
+        sources = list(lecture.get("sources"))
         if sources:
             if not os.path.isfile(lecture_path):
                 logger.info("      > Lecture doesn't have DRM, attempting to download...")
-                source = sources[0]  # first index is the best quality
-                if isinstance(quality, int):
-                    source = min(sources, key=lambda x: abs(int(x.get("height")) - quality))
+                source = select_source(sources)
+                # hls variants are fetched on demand, fall back to the next best one if it can't be
+                while source.get("type") == "hls" and not udemy._fetch_hls_variant(source):
+                    sources.remove(source)
+                    if not sources:
+                        logger.error(f"      > No variant playlist could be fetched for lecture '{lecture_title}'")
+                        return
+                    source = select_source(sources)
                 try:
                     logger.info(
                         "      ====== Selected quality: %s %s",
@@ -1994,72 +2905,18 @@ def process_lecture(lecture, lecture_path, chapter_dir):
                     url = source.get("download_url")
                     source_type = source.get("type")
                     if source_type == "hls":
-                        temp_filepath = lecture_path.replace(".mp4", ".%(ext)s")
-                        cmd = [
-                            "yt-dlp",
-                            "--enable-file-urls",
-                            "--force-generic-extractor",
-                            "--concurrent-fragments",
-                            f"{concurrent_downloads}",
-                            "--downloader",
-                            "aria2c",
-                            "--downloader-args",
-                            'aria2c:"--disable-ipv6"',
-                            "-o",
-                            f"{temp_filepath}",
-                            f"{url}",
-                        ]
-                        process = subprocess.Popen(
-                            cmd,
-                            stdout=subprocess.PIPE,
-                            stderr=subprocess.STDOUT,
-                            text=True,
-                            bufsize=1,
-                            encoding="utf-8",
-                        )
-                        log_subprocess_output("YTDLP", process.stdout)
-                        ret_code = process.wait()
+                        ret_code = download_hls(url, lecture_path, lecture_title)
                         if ret_code == 0:
-                            tmp_file_path = lecture_path + ".tmp"
                             logger.info("      > HLS Download success")
                             if use_h265:
-                                codec = "hevc_nvenc" if use_nvenc else "libx265"
-                                transcode = "-hwaccel cuda -hwaccel_output_format cuda".split(" ") if use_nvenc else []
-                                cmd = [
-                                    "ffmpeg",
-                                    *transcode,
-                                    "-y",
-                                    "-i",
-                                    lecture_path,
-                                    "-c:v",
-                                    codec,
-                                    "-c:a",
-                                    "copy",
-                                    "-f",
-                                    "mp4",
-                                    "-metadata",
-                                    'comment="Downloaded with Udemy-Downloader by Puyodead1 (https://github.com/Puyodead1/udemy-downloader)"',
-                                    tmp_file_path,
-                                ]
-                                process = subprocess.Popen(
-                                    cmd,
-                                    stdout=subprocess.PIPE,
-                                    stderr=subprocess.STDOUT,
-                                    text=True,
-                                    bufsize=1,
-                                    encoding="utf-8",
-                                )
-                                log_subprocess_output("FFMPEG", process.stdout)
-                                ret_code = process.wait()
-                                if ret_code == 0:
-                                    os.unlink(lecture_path)
-                                    os.rename(tmp_file_path, lecture_path)
-                                    logger.info("      > Encoding complete")
-                                else:
-                                    logger.error("      > Encoding returned non-zero return code")
+                                transcoder.submit(lecture_path, lecture_title)
                     else:
-                        ret_code = download_aria(url, chapter_dir, lecture_title + ".mp4")
+                        ret_code = retry_policy.run(
+                            lambda: download_aria(url, chapter_dir, lecture_title + ".mp4"), url, attempts=retry
+                        )
                         logger.debug(f"      > Download return code: {ret_code}")
+                except ExpiredURLError:
+                    raise
                 except Exception:
                     logger.exception(f">        Error downloading lecture")
             else:
@@ -2123,35 +2980,353 @@ def process_coding_assignment(quiz, lecture, chapter_dir):
             f.write(html)
 
 
-def parse_new(udemy: Udemy, udemy_object: dict):
+def with_fresh_urls(udemy: Udemy, parsed_lecture, fn):
+    """
+    Call ``fn()``, which downloads something using the links of ``parsed_lecture``.
+
+    Links about to expire are refreshed before each attempt. When ``fn`` raises ``ExpiredURLError`` the lecture
+    is fetched again and ``fn`` retried with the new links, up to ``url_refreshes`` times. ``fn`` has to read the
+    links from ``parsed_lecture`` when called, a refresh replaces them.
+    """
+    for attempt in range(url_refreshes + 1):
+        udemy.refresh_expiring(parsed_lecture)
+        # a refresh by another job after this point means fn may have used links that are already replaced
+        started = time.time()
+        try:
+            return fn()
+        except ExpiredURLError as error:
+            if attempt == url_refreshes:
+                raise
+            logger.warning(f"      > {error}, retrying with fresh links")
+            if not udemy.refresh_lecture(parsed_lecture, started):
+                raise
+
+
+def process_lecture_media(udemy: Udemy, parsed_lecture, chapter_dir, total_lectures):
+    """Download (or write, for html lectures) the main file of a parsed lecture unless it already exists"""
+    lecture_title = parsed_lecture.get("lecture_title")
+    index = parsed_lecture.get("index")  # this is lecture_counter
+    # lecture_index = lecture.get("lecture_index")  # this is the raw object index from udemy
+
+    try:
+        lecture_extension = parsed_lecture.get("extension")
+        extension = "mp4"  # video lectures dont have an extension property, so we assume its mp4
+        if lecture_extension != None:
+            # if the lecture extension property isnt none, set the extension to the lecture extension
+            extension = lecture_extension
+        lecture_file_name = sanitize_filename(lecture_title + "." + extension)
+        lecture_file_name = deEmojify(lecture_file_name)
+        lecture_path = os.path.join(chapter_dir, lecture_file_name)
+
+        logger.info(f"  > Processing lecture {index} of {total_lectures}" if total_lectures else f"  > Processing lecture {index}")
+        logger.debug(
+            "      > extension=%s path=%s subtitles=%s assets=%s",
+            extension,
+            lecture_path,
+            len(parsed_lecture.get("subtitles") or []),
+            len(parsed_lecture.get("assets") or []),
+        )
+
+        # Check if the lecture is already downloaded
+        if os.path.isfile(lecture_path):
+            logger.info("      > Lecture '%s' is already downloaded, skipping..." % lecture_title)
+        else:
+            # Check if the file is an html file
+            if extension == "html":
+                # if the html content is None or an empty string, skip it so we dont save empty html files
+                if parsed_lecture.get("html_content") != None and parsed_lecture.get("html_content") != "":
+                    html_content = parsed_lecture.get("html_content").encode("utf8", "ignore").decode("utf8")
+                    lecture_path = os.path.join(
+                        chapter_dir,
+                        "{}.html".format(sanitize_filename(lecture_title)),
+                    )
+                    try:
+                        logger.debug("      > Writing HTML lecture to %s", lecture_path)
+                        with open(lecture_path, encoding="utf8", mode="w") as f:
+                            f.write(html_content)
+                    except Exception:
+                        logger.exception("    > Failed to write html file")
+            else:
+
+                def download_media():
+                    # only now that we know the media is needed are the manifests fetched
+                    udemy._resolve_lecture_streams(parsed_lecture)
+                    logger.debug(
+                        "      > resolved streams: sources=%s video_sources=%s",
+                        len(parsed_lecture.get("sources") or []),
+                        len(parsed_lecture.get("video_sources") or []),
+                    )
+                    logger.debug("      > Invoking process_lecture for '%s'", lecture_title)
+                    process_lecture(udemy, parsed_lecture, lecture_path, chapter_dir)
+                    logger.debug("      > process_lecture returned for '%s'", lecture_title)
+
+                try:
+                    with_fresh_urls(udemy, parsed_lecture, download_media)
+                except ExpiredURLError as error:
+                    logger.error("      > %s, giving up on lecture '%s'", error, lecture_title)
+                except Exception:
+                    logger.exception("      > Unexpected error while processing lecture '%s'", lecture_title)
+    except Exception:
+        logger.exception("    > Unexpected error building lecture path/metadata for '%s'", lecture_title)
+
+
+def current_caption(parsed_lecture, caption):
+    """The caption of the same language, with a fresh link if the lecture was refreshed meanwhile"""
+    language = caption.get("language")
+    return next((s for s in parsed_lecture.get("subtitles") or [] if s.get("language") == language), caption)
+
+
+def current_asset(parsed_lecture, asset):
+    """The same attachment, with a fresh link if the lecture was refreshed meanwhile"""
+    filename = asset.get("filename")
+    return next((a for a in parsed_lecture.get("assets") or [] if a.get("filename") == filename), asset)
+
+
+def download_lecture_caption(udemy: Udemy, parsed_lecture, caption, chapter_dir):
+    """Download a single caption of a lecture, fetching the lecture again if its link expired"""
+    lecture_title = parsed_lecture.get("lecture_title")
+    try:
+        with_fresh_urls(
+            udemy,
+            parsed_lecture,
+            lambda: process_caption(current_caption(parsed_lecture, caption), lecture_title, chapter_dir),
+        )
+    except ExpiredURLError as error:
+        logger.error(f"    > {error}, skipping caption")
+
+
+def download_lecture_asset(udemy: Udemy, parsed_lecture, asset, chapter_dir):
+    """Download a single attachment of a lecture, fetching the lecture again if its link expired"""
+    filename = asset.get("filename")
+
+    def download_asset():
+        download_url = current_asset(parsed_lecture, asset).get("download_url")
+        return retry_policy.run(
+            lambda: download_aria(download_url, chapter_dir, filename), download_url, attempts=retry
+        )
+
+    try:
+        ret_code = with_fresh_urls(udemy, parsed_lecture, download_asset)
+        logger.debug(f"      > Download return code: {ret_code}")
+    except ExpiredURLError as error:
+        logger.error(f"    > {error}, skipping asset")
+    except Exception:
+        logger.exception("> Error downloading asset")
+
+
+def add_lecture_downloads(batch: DownloadBatch, udemy: Udemy, parsed_lecture, chapter_dir):
+    """Queue the captions and attachments of a lecture in the download batch of its chapter"""
+    lecture_title = parsed_lecture.get("lecture_title")
+    if dl_captions and parsed_lecture.get("subtitles") != None and parsed_lecture.get("extension") == None:
+        for caption in parsed_lecture.get("subtitles"):
+            lang = caption.get("language")
+            if lang != caption_locale and caption_locale != "all":
+                continue
+            filename = caption_filename(caption, lecture_title)
+            if os.path.isfile(os.path.join(chapter_dir, filename)):
+                logger.info("    > Caption '%s' already downloaded." % filename)
+                continue
+            batch.add(
+                lambda caption=caption: current_caption(parsed_lecture, caption).get("download_url"),
+                chapter_dir,
+                filename,
+                on_done=functools.partial(convert_caption, caption, lecture_title, chapter_dir),
+                fallback=functools.partial(download_lecture_caption, udemy, parsed_lecture, caption, chapter_dir),
+                owner=parsed_lecture,
+            )
+
+    if dl_assets:
+        for asset in parsed_lecture.get("assets") or []:
+            if asset.get("type") not in DOWNLOADABLE_ASSETS:
+                continue
+            batch.add(
+                lambda asset=asset: current_asset(parsed_lecture, asset).get("download_url"),
+                chapter_dir,
+                asset.get("filename"),
+                fallback=functools.partial(download_lecture_asset, udemy, parsed_lecture, asset, chapter_dir),
+                owner=parsed_lecture,
+            )
+
+
+def process_download_batch(udemy: Udemy, batch: DownloadBatch):
+    """
+    Download the captions and attachments queued for a chapter with a single aria2c run.
+
+    Links about to expire are refreshed first. Items the batch failed are retried one by one, which also
+    fetches their lecture again if the failure was an expired link.
+    """
+    global aria2
+    logger.info(f"    > Downloading {len(batch)} caption(s) and asset(s) of the chapter...")
+    lectures = {id(item.owner): item.owner for item in batch.items if item.owner is not None}
+    for parsed_lecture in lectures.values():
+        udemy.refresh_expiring(parsed_lecture)
+
+    daemon = aria2
+    if daemon is None and not aria2_available:
+        # without aria2c every item is downloaded on its own by the built-in downloader
+        for item in batch.items:
+            if item.fallback is not None:
+                _run_job(item.fallback)
+        return
+    try:
+        failed = batch.run(daemon, concurrent_downloads)
+    except Aria2RPCError as error:
+        logger.warning(f"> aria2c rpc daemon failed ({error}), starting aria2c for every batch instead")
+        aria2 = None
+        # a timed out rpc call doesn't mean the daemon is gone, stop it so each file has only one writer
+        daemon.shutdown()
+        failed = batch.run(None, concurrent_downloads)
+
+    failed_items = set(map(id, failed))
+    for item in batch.items:
+        if id(item) not in failed_items and item.on_done is not None:
+            _run_job(item.on_done)
+    for item in failed:
+        logger.warning(f"    > '{item.filename}' failed in the batch ({item.error}), retrying it on its own")
+        if item.fallback is not None:
+            _run_job(item.fallback)
+
+
+def process_lecture_assets(parsed_lecture, chapter_dir):
+    lecture_title = parsed_lecture.get("lecture_title")
+    assets = parsed_lecture.get("assets")
+    logger.info("    > Processing {} asset(s) for lecture...".format(len(assets)))
+
+    for asset in assets:
+        asset_type = asset.get("type")
+        filename = asset.get("filename")
+        download_url = asset.get("download_url")
+
+        if asset_type == "article":
+            body = asset.get("body")
+            # stip the 03d prefix
+            lecture_path = os.path.join(
+                chapter_dir,
+                "{}.html".format(sanitize_filename(lecture_title)),
+            )
+            try:
+                template_path = os.path.join(MAIN_SCRIPT_PATH, "templates", "article_template.html")
+                with open(template_path, "r") as f:
+                    content = f.read()
+                    content = content.replace("__title_placeholder__", lecture_title[4:])
+                    content = content.replace("__data_placeholder__", body)
+                    with open(lecture_path, encoding="utf8", mode="w") as f:
+                        f.write(content)
+            except Exception as e:
+                print("Failed to write html file: ", e)
+                continue
+        elif asset_type == "video":
+            logger.warning(
+                "If you're seeing this message, that means that you reached a secret area that I haven't finished! jk I haven't implemented handling for this asset type, please report this at https://github.com/Puyodead1/udemy-downloader/issues so I can add it. When reporting, please provide the following information: "
+            )
+            logger.warning("AssetType: Video; AssetData: ", asset)
+        elif asset_type in DOWNLOADABLE_ASSETS:
+            # downloaded with the rest of the chapter by process_download_batch
+            continue
+        elif asset_type == "external_link":
+            # write the external link to a shortcut file
+            file_path = os.path.join(chapter_dir, f"{filename}.url")
+            file = open(file_path, "w")
+            file.write("[InternetShortcut]\n")
+            file.write(f"URL={download_url}")
+            file.close()
+
+            # save all the external links to a single file
+            savedirs, name = os.path.split(os.path.join(chapter_dir, filename))
+            filename = "external-links.txt"
+            filename = os.path.join(savedirs, filename)
+            # lectures of the same chapter can be processed at the same time, keep the check and append atomic
+            with external_links_lock:
+                file_data = []
+                if os.path.isfile(filename):
+                    file_data = [i.strip().lower() for i in open(filename, encoding="utf-8", errors="ignore") if i]
+
+                content = "\n{}\n{}\n".format(name, download_url)
+                if name.lower() not in file_data:
+                    with open(filename, "a", encoding="utf-8", errors="ignore") as f:
+                        f.write(content)
+
+
+def _run_job(fn, *args):
+    try:
+        fn(*args)
+    except Exception:
+        # batch jobs are functools.partial objects, which have no __name__
+        name = getattr(getattr(fn, "func", fn), "__name__", repr(fn))
+        logger.exception(f"    > Unexpected error in {name}")
+
+
+def _job_worker(jobs: queue.Queue):
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        _run_job(*job)
+
+
+def parse_new(udemy: Udemy, udemy_object: dict, curriculum=None):
+    """
+    Download every lecture of the course.
+
+    ``curriculum`` yields ``(chapter, lecture)`` pairs as ``Curriculum.build`` does, by default those of the already
+    built ``udemy_object``. Each lecture is split into independent jobs (quiz, media, articles and links) put on a bounded
+    queue that ``parallel_lectures`` worker threads consume, so downloads start while the curriculum is still
+    being read and a slow producer or consumer holds back the other. Captions and attachments are collected per
+    chapter and downloaded by one aria2c run when the chapter is done. Folders are created and lectures parsed in
+    curriculum order, so file names and numbering don't depend on the order the jobs finish in.
+    """
     total_chapters = udemy_object.get("total_chapters")
     total_lectures = udemy_object.get("total_lectures")
-    logger.info(f"Chapter(s) ({total_chapters})")
-    logger.info(f"Lecture(s) ({total_lectures})")
+    if curriculum is None:
+        curriculum = Curriculum(udemy_object).events()
+        logger.info(f"Chapter(s) ({total_chapters})")
+        logger.info(f"Lecture(s) ({total_lectures})")
 
     course_name = str(udemy_object.get("course_id")) if id_as_course_name else udemy_object.get("course_title")
     course_dir = os.path.join(DOWNLOAD_DIR, course_name)
     if not os.path.exists(course_dir):
         os.mkdir(course_dir)
 
-    for chapter in udemy_object.get("chapters"):
-        current_chapter_index = int(chapter.get("chapter_index"))
-        # Skip chapters not in the filter if a filter is provided
-        if chapter_filter is not None and current_chapter_index not in chapter_filter:
-            logger.info(
-                "Skipping chapter %s as it is not in the specified filter",
-                current_chapter_index,
-            )
-            continue
+    jobs = queue.Queue(maxsize=parallel_lectures * 4)
+    workers = [
+        threading.Thread(target=_job_worker, args=(jobs,), name=f"lecture-worker-{n}", daemon=True)
+        for n in range(parallel_lectures)
+    ]
+    for worker in workers:
+        worker.start()
 
-        chapter_title = chapter.get("chapter_title")
-        chapter_index = chapter.get("chapter_index")
-        chapter_dir = os.path.join(course_dir, chapter_title)
-        if not os.path.exists(chapter_dir):
-            os.mkdir(chapter_dir)
-        logger.info(f"======= Processing chapter {chapter_index} of {total_chapters} =======")
+    def submit(fn, *args):
+        # blocks while the queue is full
+        jobs.put((fn, *args))
+
+    chapter_dir = None
+    # captions and attachments of the current chapter, downloaded together once the chapter is parsed
+    batch = DownloadBatch()
+    try:
+        for chapter, lecture in curriculum:
+            if lecture is None and len(batch):
+                submit(process_download_batch, udemy, batch)
+                batch = DownloadBatch()
+
+            current_chapter_index = int(chapter.get("chapter_index"))
+            # Skip chapters not in the filter if a filter is provided
+            if chapter_filter is not None and current_chapter_index not in chapter_filter:
+                if lecture is None:
+                    logger.info(
+                        "Skipping chapter %s as it is not in the specified filter",
+                        current_chapter_index,
+                    )
+                continue
+
+            chapter_title = chapter.get("chapter_title")
+            chapter_index = chapter.get("chapter_index")
+            if lecture is None:
+                chapter_dir = os.path.join(course_dir, chapter_title)
+                if not os.path.exists(chapter_dir):
+                    os.mkdir(chapter_dir)
+                logger.info(f"======= Processing chapter {chapter_index} of {total_chapters or '?'} =======")
+                continue
 
-        for lecture in chapter.get("lectures"):
             clazz = lecture.get("_class")
             lecture_title = lecture.get("lecture_title")
             logger.debug(
@@ -2162,150 +3337,39 @@ def parse_new(udemy: Udemy, udemy_object: dict):
                 # skip the quiz if we dont want to download it
                 if not dl_quizzes:
                     continue
-                process_quiz(udemy, lecture, chapter_dir)
+                submit(process_quiz, udemy, lecture, chapter_dir)
                 continue
 
-            index = lecture.get("index")  # this is lecture_counter
-            # lecture_index = lecture.get("lecture_index")  # this is the raw object index from udemy
-
             logger.debug("    calling _parse_lecture for '%s'", lecture_title)
             parsed_lecture = udemy._parse_lecture(lecture)
+            # before the jobs are queued, so the media job and the chapter's batch see the cached links too
+            udemy._load_cached_streams(parsed_lecture)
+            if not save_to_file:
+                # the raw api object isn't needed once parsed, unless --save-to-file still has to write it
+                lecture.data = None
             logger.debug("    returned from _parse_lecture for '%s'", lecture_title)
             logger.debug(
-                "    parsed lecture fields: encrypted=%s extension=%s sources=%s video_sources=%s", 
+                "    parsed lecture fields: encrypted=%s extension=%s",
                 parsed_lecture.get("is_encrypted"),
                 parsed_lecture.get("extension"),
-                len(parsed_lecture.get("sources") or []),
-                len(parsed_lecture.get("video_sources") or []),
             )
 
-            try:
-                lecture_extension = parsed_lecture.get("extension")
-                extension = "mp4"  # video lectures dont have an extension property, so we assume its mp4
-                if lecture_extension != None:
-                    # if the lecture extension property isnt none, set the extension to the lecture extension
-                    extension = lecture_extension
-                lecture_file_name = sanitize_filename(lecture_title + "." + extension)
-                lecture_file_name = deEmojify(lecture_file_name)
-                lecture_path = os.path.join(chapter_dir, lecture_file_name)
-
-                if not skip_lectures:
-                    logger.info(f"  > Processing lecture {index} of {total_lectures}")
-                    logger.debug(
-                        "      > extension=%s path=%s subtitles=%s assets=%s",
-                        extension,
-                        lecture_path,
-                        len(parsed_lecture.get("subtitles") or []),
-                        len(parsed_lecture.get("assets") or []),
-                    )
-
-                    # Check if the lecture is already downloaded
-                    if os.path.isfile(lecture_path):
-                        logger.info("      > Lecture '%s' is already downloaded, skipping..." % lecture_title)
-                    else:
-                        # Check if the file is an html file
-                        if extension == "html":
-                            # if the html content is None or an empty string, skip it so we dont save empty html files
-                            if parsed_lecture.get("html_content") != None and parsed_lecture.get("html_content") != "":
-                                html_content = parsed_lecture.get("html_content").encode("utf8", "ignore").decode("utf8")
-                                lecture_path = os.path.join(
-                                    chapter_dir,
-                                    "{}.html".format(sanitize_filename(lecture_title)),
-                                )
-                                try:
-                                    logger.debug("      > Writing HTML lecture to %s", lecture_path)
-                                    with open(lecture_path, encoding="utf8", mode="w") as f:
-                                        f.write(html_content)
-                                except Exception:
-                                    logger.exception("    > Failed to write html file")
-                        else:
-                            try:
-                                logger.debug("      > Invoking process_lecture for '%s'", lecture_title)
-                                process_lecture(parsed_lecture, lecture_path, chapter_dir)
-                                logger.debug("      > process_lecture returned for '%s'", lecture_title)
-                            except Exception:
-                                logger.exception(
-                                    "      > Unexpected error while processing lecture '%s'", lecture_title
-                                )
-            except Exception:
-                logger.exception("    > Unexpected error building lecture path/metadata for '%s'", lecture_title)
+            if not skip_lectures:
+                submit(process_lecture_media, udemy, parsed_lecture, chapter_dir, total_lectures)
 
-            # download subtitles for this lecture
-            subtitles = parsed_lecture.get("subtitles")
-            if dl_captions and subtitles != None and lecture_extension == None:
-                logger.info("Processing {} caption(s)...".format(len(subtitles)))
-                for subtitle in subtitles:
-                    lang = subtitle.get("language")
-                    if lang == caption_locale or caption_locale == "all":
-                        process_caption(subtitle, lecture_title, chapter_dir)
+            # subtitles and downloadable assets go in the chapter's batch
+            add_lecture_downloads(batch, udemy, parsed_lecture, chapter_dir)
 
             if dl_assets:
-                assets = parsed_lecture.get("assets")
-                logger.info("    > Processing {} asset(s) for lecture...".format(len(assets)))
-
-                for asset in assets:
-                    asset_type = asset.get("type")
-                    filename = asset.get("filename")
-                    download_url = asset.get("download_url")
-
-                    if asset_type == "article":
-                        body = asset.get("body")
-                        # stip the 03d prefix
-                        lecture_path = os.path.join(
-                            chapter_dir,
-                            "{}.html".format(sanitize_filename(lecture_title)),
-                        )
-                        try:
-                            template_path = os.path.join(MAIN_SCRIPT_PATH, "templates", "article_template.html")
-                            with open(template_path, "r") as f:
-                                content = f.read()
-                                content = content.replace("__title_placeholder__", lecture_title[4:])
-                                content = content.replace("__data_placeholder__", body)
-                                with open(lecture_path, encoding="utf8", mode="w") as f:
-                                    f.write(content)
-                        except Exception as e:
-                            print("Failed to write html file: ", e)
-                            continue
-                    elif asset_type == "video":
-                        logger.warning(
-                            "If you're seeing this message, that means that you reached a secret area that I haven't finished! jk I haven't implemented handling for this asset type, please report this at https://github.com/Puyodead1/udemy-downloader/issues so I can add it. When reporting, please provide the following information: "
-                        )
-                        logger.warning("AssetType: Video; AssetData: ", asset)
-                    elif (
-                        asset_type == "audio"
-                        or asset_type == "e-book"
-                        or asset_type == "file"
-                        or asset_type == "presentation"
-                        or asset_type == "ebook"
-                        or asset_type == "source_code"
-                    ):
-                        try:
-                            ret_code = download_aria(download_url, chapter_dir, filename)
-                            logger.debug(f"      > Download return code: {ret_code}")
-                        except Exception:
-                            logger.exception("> Error downloading asset")
-                    elif asset_type == "external_link":
-                        # write the external link to a shortcut file
-                        file_path = os.path.join(chapter_dir, f"{filename}.url")
-                        file = open(file_path, "w")
-                        file.write("[InternetShortcut]\n")
-                        file.write(f"URL={download_url}")
-                        file.close()
-
-                        # save all the external links to a single file
-                        savedirs, name = os.path.split(os.path.join(chapter_dir, filename))
-                        filename = "external-links.txt"
-                        filename = os.path.join(savedirs, filename)
-                        file_data = []
-                        if os.path.isfile(filename):
-                            file_data = [
-                                i.strip().lower() for i in open(filename, encoding="utf-8", errors="ignore") if i
-                            ]
-
-                        content = "\n{}\n{}\n".format(name, download_url)
-                        if name.lower() not in file_data:
-                            with open(filename, "a", encoding="utf-8", errors="ignore") as f:
-                                f.write(content)
+                submit(process_lecture_assets, parsed_lecture, chapter_dir)
+
+        if len(batch):
+            submit(process_download_batch, udemy, batch)
+    finally:
+        for _ in workers:
+            jobs.put(None)
+        for worker in workers:
+            worker.join()
 
 
 def _print_course_info(udemy: Udemy, udemy_object: dict):
@@ -2345,6 +3409,10 @@ def _print_course_info(udemy: Udemy, udemy_object: dict):
             lecture_index = lecture.get("lecture_index")  # this is the raw object index from udemy
             lecture_title = lecture.get("lecture_title")
             parsed_lecture = udemy._parse_lecture(lecture)
+            try:
+                with_fresh_urls(udemy, parsed_lecture, lambda: udemy._resolve_lecture_streams(parsed_lecture))
+            except ExpiredURLError as error:
+                logger.error(f"  > {error}, the qualities of '{lecture_title}' are unknown")
 
             lecture_sources = parsed_lecture.get("sources")
             lecture_is_encrypted = parsed_lecture.get("is_encrypted", None)
@@ -2393,11 +3461,13 @@ def _print_course_info(udemy: Udemy, udemy_object: dict):
 
 
 def main():
-    global bearer_token, portal_name
-    aria_ret_val = check_for_aria()
-    if not aria_ret_val:
-        logger.fatal("> Aria2c is missing from your system or path!")
-        sys.exit(1)
+    global bearer_token, portal_name, aria2, aria2_available, transcoder
+    if aria2_rpc:
+        aria2 = start_aria2_rpc()
+    # a running daemon already proves aria2c is there
+    aria2_available = aria2 is not None or check_for_aria()
+    if not aria2_available:
+        logger.warning("> Aria2c is missing from your system or path, downloading files with the built-in downloader")
 
     ffmpeg_ret_val = check_for_ffmpeg()
     if not ffmpeg_ret_val and not skip_lectures:
@@ -2409,6 +3479,9 @@ def main():
         logger.fatal("> Shaka Packager is missing from your system or path!")
         sys.exit(1)
 
+    if use_h265 and not skip_lectures and not info:
+        transcoder = start_transcoder()
+
     if load_from_file:
         logger.info("> 'load_from_file' was specified, data will be loaded from json files instead of fetched")
     if save_to_file:
@@ -2477,6 +3550,9 @@ def main():
             course_title = course_info.get("published_title")
 
     logger.info("> Fetching course curriculum, this may take a minute...")
+    # without --info or --async-metadata the whole curriculum isn't needed up front, lectures are
+    # downloaded while the remaining curriculum pages are still being fetched
+    streaming = not load_from_file and not info and not async_metadata
     if load_from_file:
         course_json = json.loads(
             open(
@@ -2488,11 +3564,13 @@ def main():
         title = course_json.get("title")
         course_title = course_json.get("published_title")
         portal_name = course_json.get("portal_name")
+    elif streaming:
+        course_json = {"results": [], "portal_name": portal_name}
     else:
         course_json = udemy._extract_course_curriculum(course_url, course_id, portal_name)
         course_json["portal_name"] = portal_name
 
-    if save_to_file:
+    if save_to_file and not streaming:
         with open(
             os.path.join(os.getcwd(), "saved", "course_content.json"),
             encoding="utf8",
@@ -2500,7 +3578,8 @@ def main():
         ) as f:
             f.write(json.dumps(course_json))
 
-    logger.info("> Course curriculum retrieved!")
+    if not streaming:
+        logger.info("> Course curriculum retrieved!")
     course = course_json.get("results")
     resource = course_json.get("detail")
 
@@ -2512,6 +3591,12 @@ def main():
                 mode="r",
             ).read()
         )
+        Curriculum(udemy_object)  # turns the loaded chapters into records
+        udemy.course_id = udemy_object.get("course_id")
+        if stream_cache:
+            udemy.open_stream_cache(udemy.course_id)
+        if async_metadata:
+            udemy.prefetch_metadata(udemy_object)
         if info:
             _print_course_info(udemy, udemy_object)
         else:
@@ -2523,121 +3608,40 @@ def main():
         udemy_object["title"] = title
         udemy_object["course_title"] = course_title
         udemy_object["chapters"] = []
-        chapter_index_counter = -1
+        curriculum = Curriculum(udemy_object, use_continuous_lecture_numbers)
+        udemy.course_id = course_id
+        if stream_cache:
+            udemy.open_stream_cache(course_id)
 
         # if resource:
         #     logger.info("> Terminating Session...")
         #     udemy.session.terminate()
         #     logger.info("> Session Terminated.")
 
-        if course:
-            logger.info("> Processing course data, this may take a minute. ")
-            lecture_counter = 0
-            lectures = []
-
-            for entry in course:
-                clazz = entry.get("_class")
-
-                if clazz == "chapter":
-                    # reset lecture tracking
-                    if not use_continuous_lecture_numbers:
-                        lecture_counter = 0
-                    lectures = []
-
-                    chapter_index = entry.get("object_index")
-                    chapter_title = "{0:02d} - ".format(chapter_index) + sanitize_filename(entry.get("title"))
-
-                    if chapter_title not in udemy_object["chapters"]:
-                        udemy_object["chapters"].append(
-                            {
-                                "chapter_title": chapter_title,
-                                "chapter_id": entry.get("id"),
-                                "chapter_index": chapter_index,
-                                "lectures": [],
-                            }
-                        )
-                        chapter_index_counter += 1
-                elif clazz == "lecture":
-                    lecture_counter += 1
-                    lecture_id = entry.get("id")
-                    if len(udemy_object["chapters"]) == 0:
-                        # dummy chapters to handle lectures without chapters
-                        chapter_index = entry.get("object_index")
-                        chapter_title = "{0:02d} - ".format(chapter_index) + sanitize_filename(entry.get("title"))
-                        if chapter_title not in udemy_object["chapters"]:
-                            udemy_object["chapters"].append(
-                                {
-                                    "chapter_title": chapter_title,
-                                    "chapter_id": lecture_id,
-                                    "chapter_index": chapter_index,
-                                    "lectures": [],
-                                }
-                            )
-                            chapter_index_counter += 1
-                    if lecture_id:
-                        logger.info(f"Processing {course.index(entry) + 1} of {len(course)}")
-
-                        lecture_index = entry.get("object_index")
-                        lecture_title = "{0:03d} ".format(lecture_counter) + sanitize_filename(entry.get("title"))
-
-                        lectures.append(
-                            {
-                                "index": lecture_counter,
-                                "lecture_index": lecture_index,
-                                "lecture_title": lecture_title,
-                                "_class": entry.get("_class"),
-                                "id": lecture_id,
-                                "data": entry,
-                            }
-                        )
-                    else:
-                        logger.debug("Lecture: ID is None, skipping")
-                elif clazz == "quiz":
-                    lecture_counter += 1
-                    lecture_id = entry.get("id")
-                    if len(udemy_object["chapters"]) == 0:
-                        # dummy chapters to handle lectures without chapters
-                        chapter_index = entry.get("object_index")
-                        chapter_title = "{0:02d} - ".format(chapter_index) + sanitize_filename(entry.get("title"))
-                        if chapter_title not in udemy_object["chapters"]:
-                            udemy_object["chapters"].append(
-                                {
-                                    "chapter_title": chapter_title,
-                                    "chapter_id": lecture_id,
-                                    "chapter_index": chapter_index,
-                                    "lectures": [],
-                                }
-                            )
-                            chapter_index_counter += 1
-
-                    if lecture_id:
-                        logger.info(f"Processing {course.index(entry) + 1} of {len(course)}")
-
-                        lecture_index = entry.get("object_index")
-                        lecture_title = "{0:03d} ".format(lecture_counter) + sanitize_filename(entry.get("title"))
-
-                        lectures.append(
-                            {
-                                "index": lecture_counter,
-                                "lecture_index": lecture_index,
-                                "lecture_title": lecture_title,
-                                "_class": entry.get("_class"),
-                                "id": lecture_id,
-                                "data": entry,
-                            }
-                        )
-                    else:
-                        logger.debug("Quiz: ID is None, skipping")
+        if streaming:
 
-                udemy_object["chapters"][chapter_index_counter]["lectures"] = lectures
-                udemy_object["chapters"][chapter_index_counter]["lecture_count"] = len(lectures)
+            def stream_curriculum():
+                for entry in udemy._iter_course_curriculum(course_id, portal_name):
+                    course.append(entry)  # kept for --save-to-file
+                    yield entry
 
-            udemy_object["total_chapters"] = len(udemy_object["chapters"])
-            udemy_object["total_lectures"] = sum(
-                [entry.get("lecture_count", 0) for entry in udemy_object["chapters"] if entry]
-            )
+            logger.info("> Processing course data while it is fetched...")
+            parse_new(udemy, udemy_object, curriculum.build(stream_curriculum()))
+            logger.info("> Course curriculum retrieved!")
+        else:
+            if course:
+                logger.info("> Processing course data, this may take a minute. ")
+            for _ in curriculum.build(course or [], len(course or [])):
+                pass
 
         if save_to_file:
+            if streaming:
+                with open(
+                    os.path.join(os.getcwd(), "saved", "course_content.json"),
+                    encoding="utf8",
+                    mode="w",
+                ) as f:
+                    f.write(json.dumps(course_json))
             with open(
                 os.path.join(os.getcwd(), "saved", "_udemy.json"),
                 encoding="utf8",
@@ -2646,13 +3650,41 @@ def main():
                 # remove "bearer_token" from the object before writing
                 udemy_object.pop("bearer_token")
                 udemy_object["portal_name"] = portal_name
-                f.write(json.dumps(udemy_object))
+                f.write(json.dumps(udemy_object, default=to_json))
             logger.info("> Saved parsed data to json")
 
-        if info:
-            _print_course_info(udemy, udemy_object)
-        else:
-            parse_new(udemy, udemy_object)
+        if not streaming:
+            if async_metadata:
+                udemy.prefetch_metadata(udemy_object)
+            if info:
+                _print_course_info(udemy, udemy_object)
+            else:
+                parse_new(udemy, udemy_object)
+
+    if transcoder is not None:
+        stop_transcoder()
+    if udemy.stream_cache is not None:
+        logger.info(
+            "> Stream cache: %d lectures reused, %d resolved",
+            udemy.stream_cache.hits,
+            udemy.stream_cache.misses,
+        )
+    retry_stats = retry_policy.metrics.snapshot()
+    logger.info(
+        "> Requests: %d attempts, %d retries, %d given up, %.1fs spent backing off",
+        retry_stats["attempts"],
+        retry_stats["retries"],
+        retry_stats["giveups"],
+        retry_stats["backoff_seconds"],
+    )
+    for pattern, bucket_stats in rate_limiter.stats().items():
+        logger.info(
+            "> Rate limit %s: %d requests granted, %d delayed, %.1fs spent waiting",
+            pattern,
+            bucket_stats["granted"],
+            bucket_stats["waited"],
+            bucket_stats["wait_seconds"],
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,191 @@
+import json
+import sys
+import zlib
+
+
+class Compressed(object):
+    """
+    Field kept zlib-compressed in a private slot and decompressed on every read.
+
+    Used for the large values that are rarely read once parsed: raw API objects and article bodies.
+    """
+
+    def __init__(self, slot: str, as_json: bool = False):
+        self.slot = slot
+        self.as_json = as_json
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = getattr(instance, self.slot)
+        if value is None:
+            return None
+        value = zlib.decompress(value).decode("utf-8")
+        return json.loads(value) if self.as_json else value
+
+    def __set__(self, instance, value):
+        if value is not None:
+            value = zlib.compress((json.dumps(value) if self.as_json else value).encode("utf-8"))
+        setattr(instance, self.slot, value)
+
+
+class Record(object):
+    """
+    Base of the ``__slots__`` records below.
+
+    ``FIELDS`` lists the public fields, in the order they are serialized. Records keep dict-style reads (``get``,
+    ``[]``) so they replace the dicts the parsing code used to pass around, and ``to_dict``/``from_dict`` give the
+    same json as those dicts did.
+    """
+
+    __slots__ = ()
+    FIELDS = ()
+    # short strings repeated on every record, interned so they are stored once
+    INTERNED = ()
+
+    def __init__(self, **fields):
+        for name in self.FIELDS:
+            value = fields.get(name)
+            if name in self.INTERNED and isinstance(value, str):
+                value = sys.intern(value)
+            setattr(self, name, value)
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None) if key in self.FIELDS else None
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.FIELDS and getattr(self, key) is not None
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({', '.join(f'{n}={getattr(self, n)!r}' for n in self.FIELDS[:3])})"
+
+    def to_dict(self) -> dict:
+        result = {}
+        for name in self.FIELDS:
+            value = getattr(self, name)
+            if value is None:
+                continue
+            if isinstance(value, list):
+                value = [v.to_dict() if isinstance(v, Record) else v for v in value]
+            elif isinstance(value, Record):
+                value = value.to_dict()
+            result[name] = value
+        return result
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        if isinstance(data, cls):
+            return data
+        return cls(**{name: data.get(name) for name in cls.FIELDS})
+
+
+def to_json(value):
+    """``default`` hook for ``json.dumps`` of objects holding records"""
+    if isinstance(value, Record):
+        return value.to_dict()
+    raise TypeError(f"Object of type {value.__class__.__name__} is not JSON serializable")
+
+
+class Source(Record):
+    """A downloadable rendition of a lecture video: progressive mp4, hls variant or dash representation"""
+
+    FIELDS = (
+        "type",
+        "height",
+        "width",
+        "extension",
+        "download_url",
+        "bandwidth",
+        "format_id",
+        "tbr",
+        "playlist_path",
+        "playlist_url",
+    )
+    INTERNED = ("type", "extension")
+    __slots__ = FIELDS
+
+
+class Subtitle(Record):
+    FIELDS = ("type", "language", "extension", "download_url")
+    INTERNED = ("type", "language", "extension")
+    __slots__ = FIELDS
+
+
+class Asset(Record):
+    """A lecture attachment, or the body of an article lecture"""
+
+    FIELDS = ("type", "title", "filename", "extension", "download_url", "id", "body")
+    INTERNED = ("type", "extension")
+    __slots__ = tuple(name for name in FIELDS if name != "body") + ("_body",)
+
+    body = Compressed("_body")
+
+
+class Lecture(Record):
+    """
+    A lecture or quiz of the curriculum.
+
+    Curriculum lectures carry the raw API object in ``data``. ``Udemy._parse_lecture`` returns a new record with
+    the assets, subtitles and stream fields filled in; ``stream_sources``/``media_sources`` hold the raw stream
+    inputs until ``Udemy._resolve_lecture_streams`` turns them into ``sources``/``video_sources``.
+    """
+
+    FIELDS = (
+        "index",
+        "lecture_index",
+        "lecture_title",
+        "_class",
+        "id",
+        "data",
+        "assets",
+        "assets_count",
+        "sources",
+        "video_sources",
+        "stream_sources",
+        "media_sources",
+        "subtitles",
+        "subtitle_count",
+        "sources_count",
+        "is_encrypted",
+        "asset_id",
+        "type",
+        "html_content",
+        "extension",
+    )
+    INTERNED = ("_class", "type", "extension")
+    __slots__ = tuple(name for name in FIELDS if name not in ("data", "html_content")) + ("_data", "_html_content")
+
+    data = Compressed("_data", as_json=True)
+    html_content = Compressed("_html_content")
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        if isinstance(data, cls):
+            return data
+        lecture = super().from_dict(data)
+        lecture.assets = [Asset.from_dict(a) for a in lecture.assets] if lecture.assets is not None else None
+        lecture.subtitles = [Subtitle.from_dict(s) for s in lecture.subtitles] if lecture.subtitles is not None else None
+        for name in ("sources", "video_sources"):
+            sources = getattr(lecture, name)
+            if sources is not None:
+                setattr(lecture, name, [Source.from_dict(s) for s in sources])
+        return lecture
+
+
+class Chapter(Record):
+    FIELDS = ("chapter_title", "chapter_id", "chapter_index", "lectures", "lecture_count")
+    __slots__ = FIELDS
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        if isinstance(data, cls):
+            return data
+        chapter = super().from_dict(data)
+        chapter.lectures = [Lecture.from_dict(lecture) for lecture in chapter.lectures or []]
+        return chapter
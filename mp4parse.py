@@ -6,10 +6,14 @@ http://download.macromedia.com/f4v/video_file_format_spec_v10_1.pdf
 
 """
 
+import binascii
 import bitstring
 from datetime import datetime
 from collections import namedtuple
 import logging
+import mmap
+import os
+import struct
 import six
 
 log = logging.getLogger(__name__)
@@ -107,8 +111,138 @@ class ProtectionSystemSpecificHeader(MixinDictRepr):
     type = "pssh"
 
 BoxHeader = namedtuple( "BoxHeader", ["box_size", "box_type", "header_size"] )
- 
-    
+
+# codec of a track as declared by the first sample entry of its stsd box. codec is the fourcc of the
+# original format for encrypted (encv/enca) entries, duration is in seconds and bitrate in bits per second
+# (from btrt, else from the sample sizes in stsz, None for fragmented files that keep them in moof boxes)
+TrackInfo = namedtuple( "TrackInfo", ["track_id", "handler", "codec", "width", "height", "duration",
+                                      "sample_count", "bitrate", "encrypted"] )
+
+VIDEO_HANDLER = "vide"
+AUDIO_HANDLER = "soun"
+
+
+# a box found by BoxIndex: offset and size are those of the whole box, its payload starts header_size bytes in
+Box = namedtuple( "Box", ["box_type", "offset", "size", "header_size"] )
+
+
+class BoxIndex(object):
+    """ Index of the boxes of an MP4 file that reads box headers only and seeks over their payloads
+
+    The children of a box are read the first time they are asked for and payloads only by payload(), so
+    finding moov/trak/stsd in a multi-GB lecture reads a few KB. Files are memory mapped, bytes and file
+    objects (anything with seek and read) work as well.
+    """
+
+    def __init__(self, source):
+        self._closers = []
+        self._children = {}
+        if hasattr(source, "read"):
+            self._file = source
+            self._buffer = None
+            source.seek(0, os.SEEK_END)
+            self.size = source.tell()
+        else:
+            self._file = None
+            self._buffer = source
+            self.size = len(source)
+
+    @classmethod
+    def open(cls, filename):
+        f = open(filename, "rb")
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files can't be mapped
+            index = cls(f)
+        else:
+            index = cls(buffer)
+            index._closers.append(buffer.close)
+        index._closers.append(f.close)
+        return index
+
+    def close(self):
+        for close in self._closers:
+            close()
+        self._closers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _read(self, offset, size):
+        if self._buffer is not None:
+            return bytes(self._buffer[offset:offset + size])
+        self._file.seek(offset)
+        return self._file.read(size)
+
+    def _read_header(self, offset, end, top_level):
+        header = self._read(offset, 16)
+        size, box_type = struct.unpack_from(">I4s", header)
+        header_size = 8
+        if size == 1:
+            if len(header) < 16:
+                raise ValueError("Premature end of data while reading box header")
+            size = struct.unpack_from(">Q", header, 8)[0]
+            header_size = 16
+        elif size == 0:
+            # the box extends to the end of its parent
+            size = end - offset
+        if size < header_size:
+            raise ValueError("Box %r at %d is smaller than its header" % (box_type, offset))
+        if offset + size > end:
+            if not top_level:
+                raise ValueError("Box %r at %d overruns its parent" % (box_type, offset))
+            # e.g. an mdat still being downloaded
+            log.debug("Box %r at %d is cut short by the end of the file", box_type, offset)
+            size = end - offset
+        return Box(box_type=box_type.decode("latin-1"), offset=offset, size=size, header_size=header_size)
+
+    def children(self, box=None, skip=0):
+        """ The boxes directly inside box, the top level ones without a box
+
+        :param skip: bytes of fields at the start of the payload before the child boxes (e.g. 8 for stsd)
+        :return: list of Box
+        """
+        key = (box.offset if box is not None else None, skip)
+        if key not in self._children:
+            if box is None:
+                start, end = 0, self.size
+            else:
+                start, end = box.offset + box.header_size + skip, box.offset + box.size
+            boxes = []
+            while end - start >= 8:
+                child = self._read_header(start, end, box is None)
+                boxes.append(child)
+                start += child.size
+            self._children[key] = boxes
+        return self._children[key]
+
+    def find_all(self, *path, parent=None):
+        """ Every box at path (box types, outermost first) below parent or the top level """
+        boxes = [parent]
+        for box_type in path:
+            boxes = [child for box in boxes for child in self.children(box) if child.box_type == box_type]
+        return boxes
+
+    def find(self, *path, parent=None):
+        """ The first box at path below parent or the top level, None if there isn't one """
+        box = parent
+        for box_type in path:
+            box = next((child for child in self.children(box) if child.box_type == box_type), None)
+            if box is None:
+                return None
+        return box
+
+    def payload(self, box, skip=0, size=None):
+        """ The payload of box from byte skip, at most size bytes of it """
+        start = box.offset + box.header_size + skip
+        available = box.offset + box.size - start
+        return self._read(start, available if size is None else min(size, available))
+
+
 class F4VParser(object):
 
     @classmethod
@@ -253,6 +387,121 @@ class F4VParser(object):
         
         return BoxHeader(box_size=size-header_size, box_type=box_type, header_size=header_size)
 
+    @classmethod
+    def parse_tracks(cls, filename=None, bytes_input=None):
+        """
+        Read the codec, dimensions and bitrate of every track of an MP4 file
+
+        Only box headers and the few boxes below moov that are needed are read, mdat is seeked over
+
+        :param filename: filename of mp4 file.
+        :type filename: str.
+        :param bytes_input: bytes of mp4 file.
+        :type bytes_input: bytes.
+        :return: list of TrackInfo, empty if there is no moov box
+        """
+        with (BoxIndex.open(filename) if filename else BoxIndex(bytes_input)) as index:
+            return [cls._parse_trak(index, trak) for trak in index.find_all(MovieBox.type, "trak")]
+
+    @classmethod
+    def parse_pssh(cls, filename=None, bytes_input=None):
+        """
+        Read the pssh boxes of the moov box of an MP4 file, without reading anything else
+
+        :param filename: filename of mp4 file.
+        :type filename: str.
+        :param bytes_input: bytes of mp4 file.
+        :type bytes_input: bytes.
+        :return: list of ProtectionSystemSpecificHeader
+        """
+        psshs = []
+        with (BoxIndex.open(filename) if filename else BoxIndex(bytes_input)) as index:
+            for box in index.find_all(MovieBox.type, ProtectionSystemSpecificHeader.type):
+                pssh = ProtectionSystemSpecificHeader()
+                pssh.header = BoxHeader(box_size=box.size - box.header_size, box_type=box.box_type,
+                                        header_size=box.header_size)
+                # same layout as _parse_pssh: version and flags, system id, data size, data
+                data = binascii.hexlify(index.payload(box)).decode("ascii")
+                pssh.system_id = data[8:40]
+                pssh.payload = data[48:]
+                psshs.append(pssh)
+        return psshs
+
+    @classmethod
+    def _parse_trak(cls, index, trak):
+        track_id = None
+        tkhd = index.find("tkhd", parent=trak)
+        if tkhd:
+            data = index.payload(tkhd, size=24)
+            track_id = struct.unpack_from(">I", data, 20 if data[0] == 1 else 12)[0]
+
+        seconds = None
+        mdhd = index.find("mdia", "mdhd", parent=trak)
+        if mdhd:
+            data = index.payload(mdhd, size=32)
+            if data[0] == 1:
+                timescale, duration = struct.unpack_from(">IQ", data, 20)
+            else:
+                timescale, duration = struct.unpack_from(">II", data, 12)
+            seconds = float(duration) / timescale if timescale and duration else None
+
+        handler = None
+        hdlr = index.find("mdia", "hdlr", parent=trak)
+        if hdlr:
+            handler = index.payload(hdlr, skip=8, size=4).decode("latin-1")
+
+        stbl = index.find("mdia", "minf", "stbl", parent=trak)
+        stsd = index.find("stsd", parent=stbl) if stbl else None
+        codec, width, height, bitrate, encrypted = cls._parse_stsd(index, stsd, handler)
+
+        sample_count = 0
+        stsz = index.find("stsz", parent=stbl) if stbl else None
+        if stsz:
+            sample_size, sample_count = struct.unpack(">II", index.payload(stsz, skip=4, size=8))
+            if bitrate is None and seconds and sample_count:
+                if sample_size:
+                    total_bytes = sample_size * sample_count
+                else:
+                    total_bytes = sum(struct.unpack(">%dI" % sample_count, index.payload(stsz, skip=12, size=sample_count * 4)))
+                bitrate = int(total_bytes * 8 / seconds)
+
+        return TrackInfo(track_id=track_id, handler=handler, codec=codec, width=width, height=height,
+                         duration=seconds, sample_count=sample_count, bitrate=bitrate, encrypted=encrypted)
+
+    @staticmethod
+    def _parse_stsd(index, stsd, handler):
+        """ Codec, width, height, bitrate and whether it's encrypted from the first sample entry """
+        entries = index.children(stsd, skip=8) if stsd else []
+        if not entries:
+            return None, None, None, None, False
+        entry = entries[0]
+        codec = entry.box_type
+        width = height = None
+        if handler == VIDEO_HANDLER:
+            # VisualSampleEntry: reserved, data_reference_index, pre_defined/reserved, then the dimensions
+            width, height = struct.unpack(">HH", index.payload(entry, skip=24, size=4))
+            skip = 78
+        elif handler == AUDIO_HANDLER:
+            # AudioSampleEntry: its fixed fields end after samplerate
+            skip = 28
+        else:
+            return codec, None, None, None, False
+
+        bitrate = None
+        encrypted = codec in ("encv", "enca")
+        try:
+            for child in index.children(entry, skip=skip):
+                if child.box_type == "btrt":
+                    bitrate = struct.unpack(">I", index.payload(child, skip=8, size=4))[0] or None
+                elif child.box_type == "sinf" and encrypted:
+                    frma = index.find("frma", parent=child)
+                    if frma:
+                        codec = index.payload(frma, size=4).decode("latin-1")
+        except (ValueError, struct.error):
+            # quicktime sound entries (version 1 and 2) carry extra fields before their child boxes
+            log.debug("Couldn't read the child boxes of the %s sample entry", codec)
+        return codec, width, height, bitrate, encrypted
+
     @staticmethod
     def _parse_unimplemented(bs, header):
         ui = UnImplementedBox()
@@ -0,0 +1,107 @@
+import logging
+from pathlib import Path
+from typing import List, Union
+
+from mpegdash.parser import MPEGDASHParser
+
+log = logging.getLogger("udemy-downloader.mpd")
+
+# same extensions yt-dlp derives from the representation mime type
+MIME_EXTENSIONS = {
+    "video/mp4": "mp4",
+    "audio/mp4": "m4a",
+    "video/webm": "webm",
+    "audio/webm": "webm",
+}
+
+
+class Representation(object):
+    """A single video or audio representation of an MPD, ``format_id`` is what yt-dlp accepts for ``-f``"""
+
+    __slots__ = ("format_id", "kind", "width", "height", "tbr", "ext", "codecs")
+
+    def __init__(self, format_id, kind, width, height, tbr, ext, codecs):
+        self.format_id = format_id
+        self.kind = kind
+        self.width = width
+        self.height = height
+        self.tbr = tbr
+        self.ext = ext
+        self.codecs = codecs
+
+    def __repr__(self):
+        return f"Representation({self.format_id!r}, {self.kind}, {self.width}x{self.height}, {self.tbr}k)"
+
+
+def _kind(adaptation_set, representation):
+    mime = representation.mime_type or adaptation_set.mime_type or ""
+    kind = adaptation_set.content_type or mime.split("/")[0]
+    if kind in ("video", "audio"):
+        return kind, mime
+    return None, mime
+
+
+def list_representations(path: Union[str, Path]) -> List[Representation]:
+    """
+    List the video and audio representations of a local MPD file.
+
+    Attributes missing on a representation are inherited from its adaptation set, and a representation id
+    repeated over several periods is only listed once.
+    """
+    mpd = MPEGDASHParser.parse(str(path))
+    seen = set()
+    result = []
+    for period in mpd.periods or []:
+        for adaptation_set in period.adaptation_sets or []:
+            for representation in adaptation_set.representations or []:
+                kind, mime = _kind(adaptation_set, representation)
+                if kind is None or representation.id is None or representation.id in seen:
+                    continue
+                seen.add(representation.id)
+                result.append(
+                    Representation(
+                        format_id=representation.id,
+                        kind=kind,
+                        width=representation.width or adaptation_set.width,
+                        height=representation.height or adaptation_set.height,
+                        tbr=(representation.bandwidth or 0) / 1000,
+                        ext=MIME_EXTENSIONS.get(mime, "mp4"),
+                        codecs=representation.codecs or adaptation_set.codecs,
+                    )
+                )
+    return result
+
+
+def list_representations_ytdlp(path: Union[str, Path]) -> List[Representation]:
+    """The previous yt-dlp based listing, only used when the MPD can't be parsed natively"""
+    import yt_dlp
+
+    ytdl = yt_dlp.YoutubeDL(
+        {
+            "quiet": True,
+            "no_warnings": True,
+            "allow_unplayable_formats": True,
+            "enable_file_urls": True,
+        }
+    )
+    results = ytdl.extract_info(Path(path).as_uri(), download=False, force_generic_extractor=True)
+    result = []
+    for f in results.get("formats", []):
+        if f.get("vcodec") != "none" and f.get("acodec") == "none":
+            kind, codecs = "video", f.get("vcodec")
+        elif f.get("acodec") != "none" and f.get("vcodec") == "none":
+            kind, codecs = "audio", f.get("acodec")
+        else:
+            continue
+        result.append(
+            Representation(f.get("format_id"), kind, f.get("width"), f.get("height"), f.get("tbr") or 0, f.get("ext"), codecs)
+        )
+    return result
+
+
+def parse_representations(path: Union[str, Path]) -> List[Representation]:
+    try:
+        return list_representations(path)
+    except Exception:
+        log.warning("Failed to parse %s, falling back to yt-dlp", path, exc_info=True)
+        return list_representations_ytdlp(path)
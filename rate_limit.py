@@ -0,0 +1,120 @@
+import argparse
+import asyncio
+import math
+import threading
+import time
+from fnmatch import fnmatch
+from typing import List, Optional, Tuple
+from urllib.parse import urlparse
+
+
+class TokenBucket(object):
+    """
+    Thread-safe token bucket refilled at ``rate`` tokens per second, holding at most ``burst`` tokens.
+
+    A token is reserved under the lock and the caller sleeps outside of it, so the same bucket works for
+    blocking threads (``acquire``) and asyncio tasks (``acquire_async``).
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be greater than 0")
+        self.rate = float(rate)
+        self.burst = float(burst) if burst else max(1.0, self.rate)
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+        self.granted = 0
+        self.waited = 0
+        self.wait_seconds = 0.0
+
+    def _reserve(self) -> float:
+        """Take a token and return how long the caller has to wait before using it"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            self.granted += 1
+            if self._tokens >= 0:
+                return 0.0
+            wait = -self._tokens / self.rate
+            self.waited += 1
+            self.wait_seconds += wait
+            return wait
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "granted": self.granted,
+                "waited": self.waited,
+                "wait_seconds": round(self.wait_seconds, 3),
+            }
+
+
+def parse_rate_limit(spec: str) -> Tuple[str, float, Optional[float]]:
+    """
+    Parse a ``HOST_PATTERN=RATE[:BURST]`` cli value, e.g. ``*.udemy.com=5`` or ``*.udemycdn.com=50:100``
+    """
+    pattern, sep, limit = spec.partition("=")
+    if not sep or not pattern:
+        raise argparse.ArgumentTypeError(f"Invalid rate limit '{spec}', expected HOST_PATTERN=RATE[:BURST]")
+    rate, _, burst = limit.partition(":")
+    try:
+        rate, burst = float(rate), float(burst) if burst else None
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid rate limit '{spec}', RATE and BURST must be numbers")
+    if not math.isfinite(rate) or rate <= 0 or (burst is not None and (not math.isfinite(burst) or burst <= 0)):
+        raise argparse.ArgumentTypeError(f"Invalid rate limit '{spec}', RATE and BURST must be greater than 0")
+    return pattern.strip().lower(), rate, burst
+
+
+class RateLimiter(object):
+    """
+    Maps host patterns (fnmatch style) to token buckets; the first matching rule wins and
+    hosts without a rule are not limited.
+    """
+
+    def __init__(self):
+        self._rules: List[Tuple[str, TokenBucket]] = []
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def add_rule(self, pattern: str, rate: float, burst: Optional[float] = None):
+        with self._lock:
+            self._rules.append((pattern, TokenBucket(rate, burst)))
+            self._cache.clear()
+
+    def bucket_for(self, url: str) -> Optional[TokenBucket]:
+        host = (urlparse(url).hostname or "").lower()
+        with self._lock:
+            if host not in self._cache:
+                self._cache[host] = next((b for p, b in self._rules if fnmatch(host, p)), None)
+            return self._cache[host]
+
+    def acquire(self, url: str):
+        bucket = self.bucket_for(url)
+        if bucket is not None:
+            bucket.acquire()
+
+    async def acquire_async(self, url: str):
+        bucket = self.bucket_for(url)
+        if bucket is not None:
+            await bucket.acquire_async()
+
+    def stats(self) -> dict:
+        with self._lock:
+            rules = list(self._rules)
+        return {pattern: bucket.stats() for pattern, bucket in rules}
@@ -0,0 +1,340 @@
+import asyncio
+import logging
+import random
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Iterable, Optional
+from urllib.parse import urlparse
+
+from requests.exceptions import ConnectionError as conn_error
+from requests.exceptions import ConnectTimeout, RequestException
+from urllib3.exceptions import NewConnectionError
+
+log = logging.getLogger("udemy-downloader.retry")
+
+# statuses that are worth retrying, anything else is returned to the caller straight away
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+# statuses a non-idempotent request (POST) is sent again on, the server didn't act on it
+UNSENT_STATUSES = {408, 429}
+# statuses the CDN answers expired signed urls with, retrying the same url can't succeed
+EXPIRED_STATUSES = {403, 410}
+
+# how aria2c ("status=403") and yt-dlp ("HTTP Error 403: Forbidden") report the status of a failed request
+_STATUS_RE = re.compile(r"(?:HTTP Error |status=)(\d{3})\b")
+
+
+class CircuitOpenError(conn_error):
+    """Raised instead of sending a request to a host whose circuit breaker is open"""
+
+
+class ExpiredURLError(Exception):
+    """Raised when a signed url is rejected with 403/410, it has to be fetched again before retrying"""
+
+    def __init__(self, url: str, status: int):
+        super().__init__(f"Link expired ({status}): {url.split('?')[0]}")
+        self.url = url
+        self.status = status
+
+
+def expired_status(output: Iterable[str]) -> Optional[int]:
+    """Return the 403/410 status reported in the output of a downloader subprocess, if any"""
+    for line in output:
+        for status in _STATUS_RE.findall(line):
+            if int(status) in EXPIRED_STATUSES:
+                return int(status)
+    return None
+
+
+def request_not_sent(error: Exception) -> bool:
+    """Whether a request failed before it reached the server, so even a POST can be sent again"""
+    if isinstance(error, ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if isinstance(error, conn_error) and error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+class RetryMetrics(object):
+    """Thread-safe counters for retries and time spent backing off"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.attempts = 0
+        self.retries = 0
+        self.giveups = 0
+        self.backoff_seconds = 0.0
+        self.circuit_opens = 0
+        self.by_host = {}
+
+    def _host(self, host: str) -> dict:
+        if host not in self.by_host:
+            self.by_host[host] = {"attempts": 0, "retries": 0, "giveups": 0, "backoff_seconds": 0.0}
+        return self.by_host[host]
+
+    def record_attempt(self, host: str):
+        with self._lock:
+            self.attempts += 1
+            self._host(host)["attempts"] += 1
+
+    def record_retry(self, host: str, delay: float):
+        with self._lock:
+            self.retries += 1
+            self.backoff_seconds += delay
+            stats = self._host(host)
+            stats["retries"] += 1
+            stats["backoff_seconds"] += delay
+
+    def record_giveup(self, host: str):
+        with self._lock:
+            self.giveups += 1
+            self._host(host)["giveups"] += 1
+
+    def record_circuit_open(self):
+        with self._lock:
+            self.circuit_opens += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "attempts": self.attempts,
+                "retries": self.retries,
+                "giveups": self.giveups,
+                "backoff_seconds": round(self.backoff_seconds, 3),
+                "circuit_opens": self.circuit_opens,
+                "by_host": {h: dict(v, backoff_seconds=round(v["backoff_seconds"], 3)) for h, v in self.by_host.items()},
+            }
+
+
+class CircuitBreaker(object):
+    """
+    Per-host circuit breaker.
+
+    After ``failure_threshold`` consecutive failed requests the host is skipped for ``reset_timeout`` seconds,
+    then a single trial request is let through; its outcome closes or re-opens the circuit. ``RetryPolicy``
+    records a failure once per request that gave up, not once per attempt, so the retries of a few requests
+    to a flaky host don't open it.
+    """
+
+    def __init__(self, failure_threshold: int = 8, reset_timeout: float = 30.0, metrics: Optional[RetryMetrics] = None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        self._failures = {}
+        self._opened_at = {}
+        self._trial = set()
+
+    def allow(self, host: str) -> bool:
+        with self._lock:
+            opened_at = self._opened_at.get(host)
+            if opened_at is None:
+                return True
+            if time.monotonic() - opened_at < self.reset_timeout or host in self._trial:
+                return False
+            # half-open, let one request through
+            self._trial.add(host)
+            return True
+
+    def retry_in(self, host: str) -> float:
+        """Seconds left until the open circuit of ``host`` turns half-open, 0 if it isn't open"""
+        with self._lock:
+            opened_at = self._opened_at.get(host)
+            if opened_at is None:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - opened_at))
+
+    def record_success(self, host: str):
+        with self._lock:
+            self._failures.pop(host, None)
+            self._opened_at.pop(host, None)
+            self._trial.discard(host)
+
+    def record_failure(self, host: str):
+        with self._lock:
+            failures = self._failures.get(host, 0) + 1
+            self._failures[host] = failures
+            if host in self._trial or (failures >= self.failure_threshold and host not in self._opened_at):
+                self._trial.discard(host)
+                self._opened_at[host] = time.monotonic()
+                log.warning("Too many failures for %s, pausing requests to it for %ds", host, self.reset_timeout)
+                if self.metrics:
+                    self.metrics.record_circuit_open()
+
+
+class RetryPolicy(object):
+    """
+    Exponential backoff with full jitter, ``Retry-After`` support and a per-host circuit breaker.
+
+    One policy is meant to be shared by every request path so retries and backoff time are counted in one place.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 10,
+        base_delay: float = 0.5,
+        max_delay: float = 20.0,
+        max_retry_after: float = 120.0,
+        breaker: Optional[CircuitBreaker] = None,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.metrics = RetryMetrics()
+        self.breaker = breaker if breaker is not None else CircuitBreaker(metrics=self.metrics)
+        self._sleep = sleep
+
+    @staticmethod
+    def host_of(url: str) -> str:
+        try:
+            return urlparse(url).hostname or ""
+        except ValueError:
+            return ""
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter: a random delay between 0 and the capped exponential step"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2**attempt)))
+
+    def retry_after(self, response) -> Optional[float]:
+        value = response.headers.get("Retry-After") if response is not None else None
+        if not value:
+            return None
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                delay = parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return None
+        return min(max(delay, 0.0), self.max_retry_after)
+
+    def _delay(self, host: str, attempt: int, response=None) -> float:
+        delay = None
+        if response is not None and response.status_code in (429, 503):
+            delay = self.retry_after(response)
+        if delay is None:
+            delay = self.backoff(attempt)
+        self.metrics.record_retry(host, delay)
+        return delay
+
+    def _wait(self, host: str, attempt: int, response=None):
+        self._sleep(self._delay(host, attempt, response))
+
+    def _check_circuit(self, host: str, url: str):
+        if not self.breaker.allow(host):
+            raise CircuitOpenError(f"Circuit open for {host}, not requesting {url}")
+
+    def _await_circuit(self, host: str):
+        """
+        Wait out an open circuit instead of failing a request that already started retrying. Once it is
+        half-open the request goes on without waiting for the trial request, which may be this one.
+        """
+        delay = self.breaker.retry_in(host)
+        if delay:
+            self._sleep(delay)
+
+    async def _await_circuit_async(self, host: str):
+        delay = self.breaker.retry_in(host)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def request(self, send: Callable, url: str, statuses=RETRY_STATUSES, retry_error: Optional[Callable[[Exception], bool]] = None):
+        """
+        Call ``send()`` until it returns a response whose status isn't in ``statuses``.
+
+        Returns the last response once attempts run out, and re-raises the last exception if every attempt raised.
+        An exception ``retry_error`` returns False for is re-raised straight away, for requests that must not be
+        sent twice (see ``UNSENT_STATUSES`` and ``request_not_sent``).
+        """
+        host = self.host_of(url)
+        self._check_circuit(host, url)
+        for attempt in range(self.max_attempts):
+            if attempt:
+                self._await_circuit(host)
+            self.metrics.record_attempt(host)
+            last_attempt = attempt == self.max_attempts - 1
+            try:
+                response = send()
+            except RequestException as error:
+                if last_attempt or (retry_error is not None and not retry_error(error)):
+                    self.breaker.record_failure(host)
+                    self.metrics.record_giveup(host)
+                    raise
+                log.warning("Request %s failed with %s (attempt %d/%d)", url, error.__class__.__name__, attempt + 1, self.max_attempts)
+                self._wait(host, attempt)
+                continue
+            if response.status_code not in statuses:
+                self.breaker.record_success(host)
+                response.retries = attempt
+                return response
+            if last_attempt:
+                self.breaker.record_failure(host)
+                self.metrics.record_giveup(host)
+                response.retries = attempt
+                return response
+            log.warning("Request %s returned %s %s (attempt %d/%d)", url, response.status_code, response.reason, attempt + 1, self.max_attempts)
+            self._wait(host, attempt, response)
+
+    async def request_async(self, send: Callable, url: str, errors=(RequestException,)):
+        """Asyncio version of ``request``, ``send`` is a coroutine function and ``errors`` the exceptions to retry"""
+        host = self.host_of(url)
+        self._check_circuit(host, url)
+        for attempt in range(self.max_attempts):
+            if attempt:
+                await self._await_circuit_async(host)
+            self.metrics.record_attempt(host)
+            last_attempt = attempt == self.max_attempts - 1
+            try:
+                response = await send()
+            except errors as error:
+                if last_attempt:
+                    self.breaker.record_failure(host)
+                    self.metrics.record_giveup(host)
+                    raise
+                log.warning("Request %s failed with %s (attempt %d/%d)", url, error.__class__.__name__, attempt + 1, self.max_attempts)
+                await asyncio.sleep(self._delay(host, attempt))
+                continue
+            if response.status_code not in RETRY_STATUSES:
+                self.breaker.record_success(host)
+                response.retries = attempt
+                return response
+            if last_attempt:
+                self.breaker.record_failure(host)
+                self.metrics.record_giveup(host)
+                response.retries = attempt
+                return response
+            log.warning("Request %s returned %s %s (attempt %d/%d)", url, response.status_code, response.reason, attempt + 1, self.max_attempts)
+            await asyncio.sleep(self._delay(host, attempt, response))
+
+    def run(self, fn: Callable, url: str, attempts: Optional[int] = None, retry_on=(Exception,)):
+        """
+        Call ``fn()`` and retry it with backoff when it raises one of ``retry_on``, e.g. for subprocess downloads.
+
+        ``ExpiredURLError`` is never retried, the caller has to get a fresh url first.
+        """
+        host = self.host_of(url)
+        attempts = attempts or self.max_attempts
+        self._check_circuit(host, url)
+        for attempt in range(attempts):
+            if attempt:
+                self._await_circuit(host)
+            self.metrics.record_attempt(host)
+            try:
+                result = fn()
+            except ExpiredURLError:
+                # the host answered, only the url is stale, so this must not leave a half-open circuit behind
+                self.breaker.record_success(host)
+                self.metrics.record_giveup(host)
+                raise
+            except retry_on as error:
+                if attempt == attempts - 1:
+                    self.breaker.record_failure(host)
+                    self.metrics.record_giveup(host)
+                    raise
+                log.warning("%s (attempt %d/%d), retrying", error, attempt + 1, attempts)
+                self._wait(host, attempt)
+                continue
+            self.breaker.record_success(host)
+            return result
@@ -0,0 +1,229 @@
+import base64
+import calendar
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Iterable, Optional
+from urllib.parse import parse_qsl, urlparse
+from urllib.request import url2pathname
+
+from models import Lecture
+
+log = logging.getLogger("udemy-downloader.stream_cache")
+
+# Entries are dropped this long (seconds) before the earliest of their signed urls expires, so a lecture
+# started from the cache doesn't run into expired links halfway through its download.
+DEFAULT_MARGIN = 15 * 60
+# How long entries whose urls carry no recognizable expiry are kept, the same as manifests in the http cache
+DEFAULT_TTL = 10 * 60
+
+# While lectures are resolved the cache file is rewritten at most this often (seconds), flush() writes the rest
+FLUSH_INTERVAL = 30
+
+# the resolved fields of a parsed lecture that are cached
+CACHED_FIELDS = ("sources", "video_sources", "subtitles", "assets")
+
+# exp=<epoch> inside akamai tokens (hdnts=exp=...~acl=...~hmac=..., token=st=...~exp=...)
+_EXP_RE = re.compile(r"(?:^|[~&:])exp=(\d{9,})")
+
+
+def _jwt_expiry(token: str) -> Optional[int]:
+    parts = token.split(".")
+    if len(parts) != 3:
+        return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(parts[1] + "=" * (-len(parts[1]) % 4)))
+    except (ValueError, TypeError):
+        return None
+    exp = payload.get("exp") if isinstance(payload, dict) else None
+    return int(exp) if isinstance(exp, (int, float)) else None
+
+
+def url_expiry(url: str) -> Optional[int]:
+    """
+    Return the epoch time a signed CDN url expires at, or None if it carries no expiry.
+
+    Understands cloudfront (``Expires=``), akamai tokens (``exp=`` in ``hdnts``/``token``), S3 presigned urls
+    (``X-Amz-Date`` + ``X-Amz-Expires``) and JWT ``token`` parameters as used by udemy's stream urls.
+    """
+    if not url or url.startswith("file:"):
+        return None
+    query = parse_qsl(urlparse(url).query, keep_blank_values=True)
+    params = {key.lower(): value for key, value in query}
+    candidates = []
+
+    if params.get("expires", "").isdigit():
+        candidates.append(int(params["expires"]))
+    if "x-amz-date" in params and params.get("x-amz-expires", "").isdigit():
+        try:
+            signed = calendar.timegm(time.strptime(params["x-amz-date"], "%Y%m%dT%H%M%SZ"))
+            candidates.append(signed + int(params["x-amz-expires"]))
+        except ValueError:
+            pass
+    for _, value in query:
+        match = _EXP_RE.search(value)
+        if match:
+            candidates.append(int(match.group(1)))
+    if "token" in params:
+        exp = _jwt_expiry(params["token"])
+        if exp:
+            candidates.append(exp)
+    return min(candidates) if candidates else None
+
+
+def lecture_urls(lecture: Lecture) -> Iterable[str]:
+    """Every signed url ``lecture`` relies on, the manifest urls of streams that aren't resolved yet included"""
+    for source in lecture.stream_sources or []:
+        yield source.get("file")
+    for source in lecture.media_sources or []:
+        yield source.get("src")
+    for source in (lecture.sources or []) + (lecture.video_sources or []):
+        yield source.download_url
+        if source.playlist_url:
+            yield source.playlist_url
+    for record in (lecture.subtitles or []) + (lecture.assets or []):
+        if record.download_url:
+            yield record.download_url
+
+
+def lecture_expiry(lecture: Lecture) -> Optional[int]:
+    """The earliest expiry of the signed urls of ``lecture``, None if none of them carries one"""
+    expiries = [exp for exp in (url_expiry(url) for url in lecture_urls(lecture)) if exp]
+    return min(expiries) if expiries else None
+
+
+def _local_files(lecture: Lecture) -> Iterable[str]:
+    """Manifests written to the temp folder that the cached sources point at"""
+    for source in (lecture.sources or []) + (lecture.video_sources or []):
+        # hls variants that weren't fetched yet keep their playlist_url and are fetched again
+        if source.playlist_url:
+            continue
+        url = source.download_url or ""
+        if url.startswith("file://"):
+            yield url2pathname(urlparse(url).path)
+
+
+class StreamCache(object):
+    """
+    Resolved streams, captions and assets of the lectures of one course, keyed by asset id.
+
+    Lectures are stored as they are resolved, together with the earliest expiry of the signed urls they
+    hold (the manifest urls they were resolved from included). An entry is reused until ``margin`` seconds
+    before that expiry and as long as the manifests it points at are still in the temp folder, then it is
+    evicted and that lecture alone is resolved again. The cache is a json file, changes are written at most
+    every ``FLUSH_INTERVAL`` seconds and by ``flush``, which has to be called once the run is done.
+    """
+
+    def __init__(self, path: str, margin: int = DEFAULT_MARGIN, default_ttl: int = DEFAULT_TTL):
+        self.path = path
+        self.margin = margin
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = {}  # str(asset_id) -> {"expires": epoch, "lecture": dict}
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf8", mode="r") as f:
+                entries = json.loads(f.read()).get("entries", {})
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, AttributeError):
+            log.warning("Ignoring unreadable stream cache %s", self.path)
+            return
+        now = time.time()
+        self._entries = {key: entry for key, entry in entries.items() if self._fresh(entry, now)}
+        evicted = len(entries) - len(self._entries)
+        if evicted:
+            log.debug("Evicted %d expired stream cache entries", evicted)
+            self._dirty = True
+
+    def _fresh(self, entry: dict, now: float) -> bool:
+        return now < entry.get("expires", 0) - self.margin
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, encoding="utf8", mode="w") as f:
+            f.write(json.dumps({"entries": self._entries}))
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    def _changed(self):
+        """Called with the lock held after every change, writes the file if the last write is long enough ago"""
+        self._dirty = True
+        if time.monotonic() - self._saved_at >= FLUSH_INTERVAL:
+            self._save()
+
+    def flush(self):
+        """Write the changes not written yet"""
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def __contains__(self, asset_id) -> bool:
+        """Whether ``asset_id`` has an unexpired entry, without counting a hit or checking its manifests"""
+        entry = self._entries.get(str(asset_id))
+        return entry is not None and self._fresh(entry, time.time())
+
+    def get(self, asset_id) -> Optional[Lecture]:
+        """Return a Lecture holding the cached fields of ``asset_id``, or None if there is no usable entry"""
+        if asset_id is None:
+            return None
+        key = str(asset_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            lecture = Lecture.from_dict(entry["lecture"])
+            if not self._fresh(entry, time.time()) or not all(os.path.isfile(p) for p in _local_files(lecture)):
+                log.debug("Stream cache entry of asset %s is stale, evicting it", key)
+                del self._entries[key]
+                self._changed()
+                self.misses += 1
+                return None
+            self.hits += 1
+            return lecture
+
+    def put(self, asset_id, lecture: Lecture, manifest_urls: Iterable[str] = ()):
+        """
+        Store the cached fields of a resolved ``lecture``.
+
+        ``manifest_urls`` are the signed urls its streams were resolved from, their expiry also bounds the entry
+        since the segment urls inside a manifest are signed for as long as the manifest url is.
+        """
+        if asset_id is None:
+            return
+        now = time.time()
+        expiries = [exp for exp in (url_expiry(url) for url in manifest_urls) if exp]
+        lecture_expires = lecture_expiry(lecture)
+        if lecture_expires:
+            expiries.append(lecture_expires)
+        # without any known expiry the entry is only kept for default_ttl, past the margin
+        expires = min(expiries) if expiries else int(now + self.default_ttl + self.margin)
+        if not self._fresh({"expires": expires}, now):
+            return
+        # a snapshot, the live records keep changing as hls variants are fetched
+        snapshot = {}
+        for name in CACHED_FIELDS:
+            value = getattr(lecture, name)
+            snapshot[name] = [record.to_dict() for record in value] if value is not None else None
+        entry = {"expires": expires, "lecture": snapshot}
+        with self._lock:
+            self._entries[str(asset_id)] = entry
+            self._changed()
+
+    def evict(self, asset_id):
+        """Drop the entry of ``asset_id``, e.g. once its links were rejected as expired"""
+        with self._lock:
+            if self._entries.pop(str(asset_id), None) is not None:
+                self._changed()
@@ -3,20 +3,47 @@ from typing import Optional
 
 from requests.adapters import HTTPAdapter
 
+CIPHER_LIST = "ECDHE-RSA-AES256-GCM-SHA384:ECDHE-ECDSA-AES256-GCM-SHA384:ECDHE-RSA-AES256-SHA384:ECDHE-ECDSA-AES256-SHA384:ECDHE-RSA-AES128-GCM-SHA256:ECDHE-RSA-AES128-SHA256:AES256-SH"
 
-class SSLCiphers(HTTPAdapter):
+
+def create_ssl_context(cipher_list: Optional[str] = None) -> ssl.SSLContext:
+    """
+    Build the SSL context shared by the requests adapter and the asyncio client so both have the same TLS fingerprint.
+    """
+    ctx = ssl.create_default_context()
+    ctx.check_hostname = False  # For some reason this is needed to avoid a verification error
+    # You can set ciphers but Python's default cipher list should suffice.
+    # This cipher list differs to the default Python-requests one.
+    if cipher_list:
+        ctx.set_ciphers(cipher_list)
+    return ctx
+
+
+class ReuseTrackingAdapter(HTTPAdapter):
+    """
+    HTTP Adapter that sets ``connection_reused`` on every response, True if its pooled connection served an earlier one.
+    """
+
+    def build_response(self, req, resp):
+        response = super().build_response(req, resp)
+        # Mark the pooled connection on first use so later responses on it can be reported as reused
+        conn = getattr(resp, "_connection", None)
+        response.connection_reused = bool(getattr(conn, "_udemy_used", False))
+        if conn is not None:
+            try:
+                conn._udemy_used = True
+            except AttributeError:
+                pass
+        return response
+
+
+class SSLCiphers(ReuseTrackingAdapter):
     """
     Custom HTTP Adapter to change the TLS Cipher set, and therefore it's fingerprint.
     """
 
     def __init__(self, cipher_list: Optional[str] = None, *args, **kwargs):
-        ctx = ssl.create_default_context()
-        ctx.check_hostname = False  # For some reason this is needed to avoid a verification error
-        self._ssl_context = ctx
-        # You can set ciphers but Python's default cipher list should suffice.
-        # This cipher list differs to the default Python-requests one.
-        if cipher_list:
-            self._ssl_context.set_ciphers(cipher_list)
+        self._ssl_context = create_ssl_context(cipher_list)
         super().__init__(*args, **kwargs)
 
     def init_poolmanager(self, *args, **kwargs):
@@ -0,0 +1,464 @@
+import logging
+import os
+import queue
+import shutil
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+import mp4parse
+from ffmpeg_runner import FFmpegProgress, run_ffmpeg
+
+log = logging.getLogger("udemy-downloader.transcode")
+
+# cores a single libx265 encode keeps busy on its own, slower presets analyse more per frame and spread it
+# over more threads, so fewer of them run side by side
+PRESET_THREADS = {
+    "ultrafast": 2,
+    "superfast": 2,
+    "veryfast": 3,
+    "faster": 3,
+    "fast": 4,
+    "medium": 4,
+    "slow": 6,
+    "slower": 8,
+    "veryslow": 8,
+    "placebo": 8,
+}
+# consumer nvidia cards only run a few nvenc sessions at once
+NVENC_WORKERS = 2
+
+# chunks shorter than this (seconds) aren't worth their own encoder, the split points are spread out further
+MIN_CHUNK_SECONDS = 20
+
+# video already in one of these is left as it is
+HEVC_CODECS = ("hvc1", "hev1")
+# below this many bits per pixel per frame the source is already so lean H.265 can't shrink it noticeably
+MIN_BITS_PER_PIXEL = 0.01
+
+
+class TranscodeError(Exception):
+    pass
+
+
+def probe_keyframes(path: str) -> Tuple[float, List[float]]:
+    """The duration of ``path`` and the times of the keyframes of its first video stream, from the packet index"""
+    duration = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.strip()
+    packets = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", path],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    keyframes = []
+    for line in packets.splitlines():
+        pts_time, _, flags = line.partition(",")
+        if "K" in flags and pts_time not in ("", "N/A"):
+            keyframes.append(float(pts_time))
+    return float(duration), sorted(keyframes)
+
+
+def split_points(keyframes: List[float], duration: float, chunks: int, min_chunk: float = MIN_CHUNK_SECONDS) -> List[float]:
+    """Keyframes cutting ``duration`` into ``chunks`` roughly equal parts, none of them shorter than ``min_chunk``"""
+    chunks = max(1, min(chunks, int(duration // min_chunk)))
+    points = []
+    previous = 0.0
+    for n in range(1, chunks):
+        target = duration * n / chunks
+        point = next((time for time in keyframes if time >= target), None)
+        if point is None or point - previous < min_chunk or duration - point < min_chunk:
+            continue
+        points.append(point)
+        previous = point
+    return points
+
+
+class ChunkedEncoder(object):
+    """
+    Encodes one file as several chunks at once, for lectures a single encoder doesn't spread over every core.
+
+    The video stream is cut at keyframes into up to ``chunks`` parts without re-encoding, the parts are
+    encoded by up to ``workers`` ffmpeg processes side by side and joined again with the concat demuxer,
+    copying the encoded video and the original audio. Every chunk starts on a keyframe, so the joined stream
+    plays exactly like one encoded in a single pass apart from where the encoder places its own keyframes.
+
+    ``build(input_path, output_path)`` returns the ffmpeg command encoding the video of a chunk, without audio.
+    """
+
+    def __init__(self, build: Callable[[str, str], List[str]], chunks: int, workers: int):
+        self.build = build
+        self.chunks = chunks
+        self.workers = workers
+
+    def encode(
+        self, input_path: str, output_path: str, on_progress: Optional[Callable[[FFmpegProgress], None]] = None
+    ) -> Optional[float]:
+        """
+        Encode ``input_path`` to ``output_path`` and return its duration, None if it is too short to split.
+
+        ``on_progress`` gets the progress of all chunks together: the frames and media seconds encoded so far
+        and the fps and speed they add up to since the split started.
+        """
+        try:
+            duration, keyframes = probe_keyframes(input_path)
+        except (OSError, subprocess.CalledProcessError, ValueError) as error:
+            log.warning("> Couldn't list the keyframes of '%s' (%s), encoding it in one piece", input_path, error)
+            return None
+        points = split_points(keyframes, duration, self.chunks)
+        if not points:
+            return None
+
+        total = FFmpegProgress(duration)
+        chunk_progress = {}
+        lock = threading.Lock()
+
+        def report(name, progress):
+            with lock:
+                chunk_progress[name] = (progress.frame, progress.out_time)
+                total.frame = sum(frame for frame, _ in chunk_progress.values())
+                total.out_time = sum(out_time for _, out_time in chunk_progress.values())
+                elapsed = time.monotonic() - total.started
+                total.fps = total.frame / elapsed if elapsed > 0 else 0.0
+                total.speed = total.out_time / elapsed if elapsed > 0 else 0.0
+            if on_progress is not None:
+                on_progress(total)
+
+        workdir = tempfile.mkdtemp(prefix=".chunks-", dir=os.path.dirname(os.path.abspath(input_path)))
+        try:
+            split_args = [
+                "ffmpeg",
+                "-y",
+                "-i",
+                input_path,
+                "-map",
+                "0:v:0",
+                "-c",
+                "copy",
+                "-f",
+                "segment",
+                "-segment_times",
+                ",".join(f"{point:.6f}" for point in points),
+                "-reset_timestamps",
+                "1",
+                os.path.join(workdir, "chunk_%04d.mp4"),
+            ]
+            if run_ffmpeg(split_args) != 0:
+                raise TranscodeError("splitting at keyframes failed")
+            parts = sorted(name for name in os.listdir(workdir) if name.startswith("chunk_"))
+            log.debug("Encoding '%s' as %d chunks with %d workers", input_path, len(parts), self.workers)
+
+            def encode_part(name):
+                encoded = os.path.join(workdir, "encoded_" + name)
+                if run_ffmpeg(self.build(os.path.join(workdir, name), encoded), lambda progress: report(name, progress)) != 0:
+                    raise TranscodeError(f"encoding {name} failed")
+                return encoded
+
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(parts))) as executor:
+                encoded = list(executor.map(encode_part, parts))
+
+            list_path = os.path.join(workdir, "chunks.txt")
+            with open(list_path, encoding="utf8", mode="w") as f:
+                f.write("".join(f"file '{os.path.basename(path)}'\n" for path in encoded))
+            concat_args = [
+                "ffmpeg",
+                "-y",
+                "-f",
+                "concat",
+                "-safe",
+                "0",
+                "-i",
+                list_path,
+                "-i",
+                input_path,
+                "-map",
+                "0:v",
+                "-map",
+                "1:a?",
+                "-map_metadata",
+                "1",
+                "-c",
+                "copy",
+                "-tag:v",
+                "hvc1",
+                "-f",
+                "mp4",
+                output_path,
+            ]
+            if run_ffmpeg(concat_args) != 0:
+                raise TranscodeError("joining the encoded chunks failed")
+            total.ended = True
+            if on_progress is not None:
+                on_progress(total)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        return duration
+
+
+def skip_reason(path: str) -> Optional[str]:
+    """Why encoding ``path`` to H.265 wouldn't gain anything, None if it's worth encoding"""
+    try:
+        tracks = mp4parse.F4VParser.parse_tracks(filename=path)
+    except (OSError, ValueError, struct.error) as error:
+        log.debug("Couldn't read the tracks of '%s': %s", path, error)
+        return None
+    video = next((track for track in tracks if track.handler == mp4parse.VIDEO_HANDLER), None)
+    if video is None:
+        return "it has no video track"
+    if video.codec in HEVC_CODECS:
+        return "the video is already H.265"
+    if video.bitrate and video.width and video.height and video.duration and video.sample_count:
+        frame_rate = video.sample_count / video.duration
+        bits_per_pixel = video.bitrate / (video.width * video.height * frame_rate)
+        if bits_per_pixel < MIN_BITS_PER_PIXEL:
+            return f"the video is already {video.bitrate // 1000} kb/s at {video.width}x{video.height}"
+    return None
+
+
+def default_workers(preset: str, nvenc: bool = False, cores: Optional[int] = None) -> int:
+    """How many encodes to run at once for ``preset`` on this machine"""
+    if nvenc:
+        return NVENC_WORKERS
+    cores = cores or os.cpu_count() or 1
+    return max(1, cores // PRESET_THREADS.get(preset, 4))
+
+
+class TranscodeJob(object):
+    __slots__ = ("path", "label", "queued", "started", "finished", "media_seconds", "error", "skipped", "progress")
+
+    def __init__(self, path: str, label: str):
+        self.path = path
+        self.label = label
+        self.queued = time.monotonic()
+        self.started = None
+        self.finished = None
+        self.media_seconds = 0.0
+        self.error = None
+        self.skipped = None
+        self.progress = None
+
+    def update(self, progress: FFmpegProgress):
+        self.progress = progress
+        self.media_seconds = progress.out_time
+
+    @property
+    def speed(self) -> float:
+        """Seconds of media encoded per second, 0 if ffmpeg didn't report its position"""
+        elapsed = (self.finished or time.monotonic()) - (self.started or self.queued)
+        return self.media_seconds / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def state(self) -> str:
+        if self.error is not None:
+            return "failed"
+        if self.skipped is not None:
+            return "skipped"
+        if self.finished is not None:
+            return "done"
+        return "encoding" if self.started is not None else "waiting"
+
+    @property
+    def fps(self) -> float:
+        """Frames encoded per second"""
+        if self.progress is None:
+            return 0.0
+        elapsed = (self.finished or time.monotonic()) - (self.started or self.queued)
+        return self.progress.frame / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Seconds until the encode finishes at its current speed, None while that's unknown"""
+        if self.finished is not None:
+            return 0.0
+        return self.progress.eta if self.progress is not None else None
+
+    def as_dict(self) -> dict:
+        eta = self.eta
+        return {
+            "label": self.label,
+            "state": self.state,
+            "queue_wait_seconds": round((self.started or time.monotonic()) - self.queued, 1),
+            "encode_seconds": round((self.finished or time.monotonic()) - self.started, 1) if self.started else 0.0,
+            "media_seconds": round(self.media_seconds, 1),
+            "duration": self.progress.duration if self.progress is not None else None,
+            "frames": self.progress.frame if self.progress is not None else 0,
+            "fps": round(self.fps, 2),
+            "speed": round(self.speed, 3),
+            "eta": round(eta, 1) if eta is not None else None,
+            "skipped": self.skipped,
+            "error": self.error,
+        }
+
+
+class TranscodePool(object):
+    """
+    Encodes downloaded lectures in the background, one ffmpeg process per worker.
+
+    ``submit`` returns as soon as the file is queued, so the next lecture downloads while this one encodes.
+    The queue holds at most ``queue_size`` files waiting for a worker, once it is full ``submit`` blocks until
+    an encode finishes, which keeps downloads from running arbitrarily far ahead of the encoders.
+
+    ``build(input_path, output_path)`` returns the ffmpeg command encoding a file. The result is written next
+    to the input and replaces it once ffmpeg succeeded. With a ``chunker`` files are encoded in chunks by it,
+    those too short to split are still encoded with ``build``.
+
+    ``skip(path)`` returns why a file isn't worth encoding (e.g. ``skip_reason``), those are left as they are.
+    So is a file whose encode came out larger than it.
+    """
+
+    def __init__(
+        self,
+        build: Callable[[str, str], List[str]],
+        workers: int,
+        queue_size: Optional[int] = None,
+        chunker: Optional[ChunkedEncoder] = None,
+        skip: Optional[Callable[[str], Optional[str]]] = None,
+    ):
+        self.build = build
+        self.workers = workers
+        self.chunker = chunker
+        self.skip = skip
+        self.queue = queue.Queue(maxsize=queue_size or workers)
+        self.jobs = []
+        self._active = 0
+        self._waiting = 0
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"transcode-{n}", daemon=True) for n in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def depth(self) -> int:
+        """Files waiting for a worker"""
+        return self._waiting
+
+    def submit(self, path: str, label: str):
+        """Queue ``path`` to be encoded in place, blocks while the queue is full"""
+        job = TranscodeJob(path, label)
+        if self.queue.full():
+            log.info("> Encoders are busy, waiting for a free slot in the transcode queue...")
+            for running in self.running():
+                eta = running.eta
+                log.info(
+                    "  > '%s': %.1f fps, %.2fx realtime, %s left",
+                    running.label,
+                    running.fps,
+                    running.speed,
+                    f"{eta:.0f}s" if eta is not None else "unknown time",
+                )
+        with self._lock:
+            self._waiting += 1
+            self.jobs.append(job)
+        self.queue.put(job)
+        with self._lock:
+            waiting, active = self._waiting, self._active
+        log.info("> Queued '%s' for encoding (%d waiting, %d encoding)", label, waiting, active)
+
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            with self._lock:
+                self._waiting -= 1
+                self._active += 1
+            try:
+                self._encode(job)
+            except Exception as error:
+                job.error = str(error)
+                log.exception("Encoding '%s' failed", job.label)
+            finally:
+                job.finished = time.monotonic()
+                with self._lock:
+                    self._active -= 1
+
+    def _encode(self, job: TranscodeJob):
+        job.started = time.monotonic()
+        reason = self.skip(job.path) if self.skip is not None else None
+        if reason is not None:
+            job.finished = time.monotonic()
+            job.skipped = reason
+            log.info("> Not encoding '%s', %s", job.label, reason)
+            return
+        tmp_path = job.path + ".tmp"
+        try:
+            media_seconds = self.chunker.encode(job.path, tmp_path, job.update) if self.chunker is not None else None
+            if media_seconds is not None:
+                job.media_seconds = media_seconds
+            else:
+                ret_code = run_ffmpeg(self.build(job.path, tmp_path), job.update)
+                if ret_code != 0:
+                    raise TranscodeError(f"ffmpeg exit code {ret_code}")
+        except TranscodeError as error:
+            job.finished = time.monotonic()
+            job.error = str(error)
+            log.error("> Encoding '%s' failed: %s", job.label, error)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        job.finished = time.monotonic()
+        encoded_size, original_size = os.path.getsize(tmp_path), os.path.getsize(job.path)
+        if encoded_size >= original_size:
+            os.remove(tmp_path)
+            job.skipped = f"the encode was larger ({encoded_size / 1e6:.1f} MB vs {original_size / 1e6:.1f} MB)"
+            log.info("> Keeping the original of '%s', %s", job.label, job.skipped)
+            return
+        os.replace(tmp_path, job.path)
+        log.info(
+            "> Encoded '%s' in %.1fs (%.2fx realtime, %.1f fps), %d waiting",
+            job.label,
+            job.finished - job.started,
+            job.speed,
+            job.fps,
+            self.depth,
+        )
+
+    def running(self) -> List[TranscodeJob]:
+        """The jobs being encoded right now"""
+        with self._lock:
+            return [job for job in self.jobs if job.started is not None and job.finished is None]
+
+    def job_stats(self) -> List[dict]:
+        """Queue wait, encode time, fps, speed and ETA of every job submitted so far"""
+        with self._lock:
+            jobs = list(self.jobs)
+        return [job.as_dict() for job in jobs]
+
+    def stats(self) -> dict:
+        with self._lock:
+            jobs = list(self.jobs)
+            active = self._active
+        finished = [job for job in jobs if job.finished is not None and job.error is None]
+        skipped = [job for job in finished if job.skipped is not None]
+        encode_seconds = sum(job.finished - job.started for job in finished)
+        media_seconds = sum(job.media_seconds for job in finished)
+        frames = sum(job.progress.frame for job in finished if job.progress is not None)
+        return {
+            "queued": len(jobs),
+            "encoded": len(finished) - len(skipped),
+            "skipped": len(skipped),
+            "failed": sum(1 for job in jobs if job.error is not None),
+            "waiting": self.depth,
+            "encoding": active,
+            "encode_seconds": round(encode_seconds, 1),
+            "speed": round(media_seconds / encode_seconds, 2) if encode_seconds else 0.0,
+            "fps": round(frames / encode_seconds, 1) if encode_seconds else 0.0,
+            "queue_wait_seconds": round(sum(job.started - job.queued for job in jobs if job.started), 1),
+        }
+
+    def close(self):
+        """Wait for every queued file to be encoded and stop the workers"""
+        for _ in self._threads:
+            self.queue.put(None)
+        for thread in self._threads:
+            thread.join()
@@ -20,12 +20,10 @@ def extract_kid(mp4_file):
 
     """
 
-    boxes = mp4parse.F4VParser.parse(filename=mp4_file)
     if not os.path.exists(mp4_file):
         raise Exception("File does not exist")
-    for box in boxes:
-        if box.header.box_type == "moov":
-            pssh_box = next(x for x in box.pssh if x.system_id == "edef8ba979d64acea3c827dcd51d21ed")
+    for pssh_box in mp4parse.F4VParser.parse_pssh(filename=mp4_file):
+        if pssh_box.system_id == "edef8ba979d64acea3c827dcd51d21ed":
             hex = codecs.decode(pssh_box.payload, "hex")
 
             pssh = widevine_pssh_data_pb2.WidevinePsshData()